@@ -0,0 +1,76 @@
+"""
+Compares a poll of the per client table (Cisco_Processor) with a poll of the per radio client counters
+(Cisco_AP_Counter_Processor): GetBulk requests, varbinds, walk and parse time, against a local Fake_SNMP_Agent
+usage: python benchmarks/bench_ap_counters.py [n_clients] [n_aps]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_processor.Cisco_Processor import Cisco_Processor
+from data_processor.Cisco_AP_Counter_Processor import Cisco_AP_Counter_Processor, AP_COUNTER_OID
+from data_source.Fake_SNMP_Agent import Fake_SNMP_Agent
+from data_source.SNMP_Bulk_Walker import SNMP_Bulk_Walker
+
+CLIENT_OID = ".1.3.6.1.4.1.14179.2.1.5.1.1"
+N_RADIOS = 2
+
+
+def make_tables(project_path, n_clients, n_aps, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_macs = ["%d.%d.%d.%d.%d.%d" % tuple(rng.integers(0, 256, 6)) for _ in range(n_aps)]
+    ap_names = ["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)]
+
+    os.makedirs(os.path.join(project_path, "data"))
+    pd.DataFrame({"ap_mac_address": ["%s.%s" % (CLIENT_OID, mac) for mac in ap_macs], "ap_name": ap_names}).to_csv(
+        os.path.join(project_path, "data", "ap_mac_address.csv"), index=False)
+    with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+        fp.write("data_processor:\n  count_oid: \"%s\"\n" % CLIENT_OID)
+
+    ap = rng.integers(0, n_aps, n_clients)
+    client = rng.integers(0, 256, (n_clients, 3))
+    clients = {"%s.%s.%d.%d.%d" % (CLIENT_OID, ap_macs[a], c[0], c[1], c[2]): a for a, c in zip(ap, client)}
+    # every client is associated to one of the radios of its access point
+    radio_counts = np.zeros((n_aps, N_RADIOS), dtype=np.int64)
+    np.add.at(radio_counts, (np.fromiter(clients.values(), dtype=np.int64),
+                             rng.integers(0, N_RADIOS, len(clients))), 1)
+    counters = {"%s.%s.%d" % (AP_COUNTER_OID, ap_macs[a], slot): int(radio_counts[a, slot])
+                for a in range(n_aps) for slot in range(N_RADIOS)}
+    return clients, counters
+
+
+def poll(table, oid, processor):
+    with Fake_SNMP_Agent(table) as agent:
+        walker = SNMP_Bulk_Walker(host=agent.host, community="public", port=agent.port, max_repetitions=100)
+        start = time.perf_counter()
+        suffixes, values = walker.walk(oid)
+        walked = time.perf_counter()
+        parsed = processor.parse(pd.DataFrame({'oid_suffix': suffixes, 'value': values}))
+        parsed_time = time.perf_counter()
+        walker.close()
+        return parsed, agent.requests, len(suffixes), walked - start, parsed_time - walked
+
+
+def main(n_clients=40000, n_aps=800):
+    with tempfile.TemporaryDirectory() as project_path:
+        clients, counters = make_tables(project_path, n_clients, n_aps)
+        client_result = poll(clients, CLIENT_OID, Cisco_Processor(project_path=project_path))
+        counter_result = poll(counters, AP_COUNTER_OID, Cisco_AP_Counter_Processor(project_path=project_path))
+
+    merged = client_result[0].merge(counter_result[0], on='ap_name', how='outer', suffixes=('_clients', '_counters'))
+    assert (merged['count_clients'].fillna(0) == merged['count_counters'].fillna(0)).all()
+
+    print("clients=%d aps=%d radios per ap=%d (identical totals per ap)" % (len(clients), n_aps, N_RADIOS))
+    print("%-16s %10s %10s %10s %10s" % ("mode", "requests", "varbinds", "walk ms", "parse ms"))
+    for name, (_, requests, varbinds, walk_time, parse_time) in [("clients", client_result),
+                                                                 ("ap_counters", counter_result)]:
+        print("%-16s %10d %10d %10.1f %10.1f" % (name, requests, varbinds, walk_time * 1000, parse_time * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,56 @@
+"""
+Compares Cisco_Processor parse paths (merge + groupby vs. vectorized regex/bincount) on a synthetic snmpwalk output
+usage: python benchmarks/bench_cisco_parse.py [n_lines] [n_aps]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_processor.Cisco_Processor import Cisco_Processor
+
+COUNT_OID = ".1.3.6.1.4.1.14179.2.1.5.1.1"
+
+
+def make_walk(project_path, n_lines, n_aps, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_oids = ["%s.%d.%d.%d.%d.%d.%d" % ((COUNT_OID,) + tuple(rng.integers(0, 256, 6))) for _ in range(n_aps)]
+    ap_names = ["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)]
+
+    os.makedirs(os.path.join(project_path, "data"))
+    # 5% of the ap oids are left out of the map, as new access points would be
+    pd.DataFrame({"ap_mac_address": ap_oids, "ap_name": ap_names}).iloc[:int(n_aps * 0.95)].to_csv(
+        os.path.join(project_path, "data", "ap_mac_address.csv"), index=False)
+    with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+        fp.write("data_processor:\n  count_oid: \"%s\"\n" % COUNT_OID)
+
+    ap = rng.integers(0, n_aps, n_lines)
+    client = rng.integers(0, 256, (n_lines, 3))
+    lines = ["%s.%d.%d.%d %d" % (ap_oids[a], c[0], c[1], c[2], a) for a, c in zip(ap, client)]
+    return pd.DataFrame({"output": lines})
+
+
+def main(n_lines=100000, n_aps=2000, repeat=5):
+    with tempfile.TemporaryDirectory() as project_path:
+        walk = make_walk(project_path, n_lines, n_aps)
+        processor = Cisco_Processor(project_path=project_path)
+
+        merged = processor._parse_merge(walk.copy())
+        vectorized = processor._parse_vectorized(walk.copy())
+        pd.testing.assert_frame_equal(merged, vectorized)
+
+        t_merge = min(timeit.repeat(lambda: processor._parse_merge(walk.copy()), number=1, repeat=repeat))
+        t_vectorized = min(timeit.repeat(lambda: processor._parse_vectorized(walk.copy()), number=1, repeat=repeat))
+
+    print("lines=%d aps=%d (identical output: %d rows)" % (n_lines, n_aps, len(merged)))
+    print("merge + groupby     : %8.1f ms" % (t_merge * 1000))
+    print("scan + bincount     : %8.1f ms" % (t_vectorized * 1000))
+    print("speedup             : %8.1fx" % (t_merge / t_vectorized))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
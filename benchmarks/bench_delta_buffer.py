@@ -0,0 +1,80 @@
+"""
+Compares the rows and delta storage of SQLite_Connector (fast_insert) on synthetic polls where few access point counts
+change between polls (5% at night, 30% during the day): buffer size, save and full read time, rows to push
+usage: python benchmarks/bench_delta_buffer.py [n_aps] [n_days]
+"""
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_storage.SQLite_Connector import SQLite_Connector
+
+CONFIG = """
+rows:
+  filename: sqlite:///%s/rows.db
+  table: wifi_buffer_table
+  fast_insert: True
+delta:
+  filename: sqlite:///%s/delta.db
+  table: wifi_buffer_table
+  fast_insert: True
+  storage: delta
+"""
+
+
+def make_polls(n_aps, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_names = np.array(["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)], dtype=object)
+    buildings = np.array(["BLDG%d" % (i % 40) for i in range(n_aps)], dtype=object)
+    counts = rng.integers(0, 30, n_aps)
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    for poll in range(n_days * 144):
+        poll_time = start + pd.Timedelta(minutes=10 * poll)
+        changed = rng.random(n_aps) < (0.3 if 8 <= poll_time.hour < 20 else 0.05)
+        counts = np.where(changed, rng.integers(0, 30, n_aps), counts)
+        yield pd.DataFrame({"ap_name": ap_names, "count": counts, "time": poll_time, "building": buildings})
+
+
+def run(project_path, section, polls):
+    connector = SQLite_Connector(project_path=project_path, section=section)
+    t0 = time.perf_counter()
+    for poll in polls:
+        if not connector.save_to_db(poll):
+            raise Exception("save_to_db failed")
+    t_save = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    data = connector.read_from_db()
+    t_read = time.perf_counter() - t0
+    n_push = len(connector.read_from_db(changes_only=True)) if section == "delta" else len(data)
+    connector.close_connection()
+    size = sum(os.path.getsize(filename) for filename in glob.glob(os.path.join(project_path, section + ".db*")))
+    return data, t_save, t_read, n_push, size
+
+
+def main(n_aps=1000, n_days=3):
+    polls = list(make_polls(n_aps, n_days))
+    with tempfile.TemporaryDirectory() as project_path:
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG)
+        results = {section: run(project_path, section, polls) for section in ("rows", "delta")}
+
+    columns = ["time", "ap_name", "building", "count"]
+    rows, delta = (results[section][0][columns].sort_values(["time", "ap_name"], ignore_index=True)
+                   for section in ("rows", "delta"))
+    pd.testing.assert_frame_equal(rows, delta, check_dtype=False)
+
+    print("aps=%d polls=%d rows=%d (identical full reads)" % (n_aps, len(polls), len(rows)))
+    print("%-8s %12s %10s %10s %12s" % ("storage", "size (MB)", "save (s)", "read (s)", "push rows"))
+    for section in ("rows", "delta"):
+        _, t_save, t_read, n_push, size = results[section]
+        print("%-8s %12.1f %10.2f %10.2f %12d" % (section, size / 1e6, t_save, t_read, n_push))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
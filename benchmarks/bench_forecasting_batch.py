@@ -0,0 +1,56 @@
+"""
+Times data_applications.power_forecasting.train_models_batch against the per building train_model loop (both with
+and without occupancy, 3 folds) on synthetic 15 minute campus data
+usage: python benchmarks/bench_forecasting_batch.py [n_buildings ...]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+from data_applications.power_forecasting import train_model, train_models_batch
+
+N_POINTS = 96 * 90
+
+
+def make_campus(n_buildings, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2019-07-01", periods=N_POINTS, freq="15min", tz="US/Pacific")
+    buildings = ["building_%d" % i for i in range(n_buildings)]
+    temp = 70 + 10 * np.sin(np.arange(N_POINTS) / 96 * 2 * np.pi)
+    occupancy = pd.DataFrame(rng.poisson(50, (N_POINTS, n_buildings)), index=index, columns=buildings, dtype=float)
+    power = pd.DataFrame(3 * temp[:, None] + 0.5 * occupancy.to_numpy() + rng.normal(0, 5, occupancy.shape),
+                         index=index, columns=buildings)
+    tod = pd.get_dummies(index.hour, prefix="tod", drop_first=True, dtype=float).set_index(index)
+    dow = pd.get_dummies(index.weekday, prefix="dow", drop_first=True, dtype=float).set_index(index)
+    features = pd.concat([pd.Series(temp, index=index, name="temp"), tod, dow], axis=1)
+    return power, occupancy, features
+
+
+def main(sizes=(4, 20, 100)):
+    print("%d points per building, %d cpus" % (N_POINTS, os.cpu_count()))
+    print("%12s %12s %12s" % ("buildings", "loop (s)", "batch (s)"))
+    for n_buildings in sizes:
+        power, occupancy, features = make_campus(n_buildings)
+
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for building in power.columns:
+                df = features.assign(occupancy=occupancy[building], power=power[building])
+                train_model(df, None, None, with_occ_data=False)
+                train_model(df, None, None, with_occ_data=True)
+        loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        train_models_batch(power, features, occupancy)
+        print("%12d %12.2f %12.2f" % (n_buildings, loop, time.perf_counter() - t0))
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (4, 20, 100))
@@ -0,0 +1,66 @@
+"""
+Compares the floor, building and campus totals of a processed poll computed with str.split + groupby on the ap names
+and with Cisco_Processor.process (hierarchy codes resolved once, one bincount per poll)
+usage: python benchmarks/bench_hierarchy.py [n_aps] [n_buildings]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_processor.Cisco_Processor import Cisco_Processor
+
+COUNT_OID = ".1.3.6.1.4.1.14179.2.1.5.1.1"
+PATTERN = "^[^-]*-(?P<building>[^-]*)-(?P<floor>[^-]*)"
+
+
+def make_poll(project_path, n_aps, n_buildings, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_names = ["AP-BLDG%d-F%d-%d" % (i % n_buildings, i % 7, i) for i in range(n_aps)]
+    os.makedirs(os.path.join(project_path, "data"))
+    pd.DataFrame({"ap_mac_address": ["%s.%d" % (COUNT_OID, i) for i in range(n_aps)], "ap_name": ap_names}).to_csv(
+        os.path.join(project_path, "data", "ap_mac_address.csv"), index=False)
+    with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+        fp.write("data_processor:\n  count_oid: \"%s\"\n  hierarchy_pattern: \"%s\"\n" % (COUNT_OID, PATTERN))
+    return pd.DataFrame({"ap_name": ap_names, "count": rng.integers(0, 60, n_aps),
+                         "time": pd.Timestamp("2020-01-01", tz="UTC")})
+
+
+def split_groupby(poll):
+    parts = poll["ap_name"].str.split("-", expand=True)
+    poll = poll.assign(building=parts[1], floor=parts[2])
+    floors = poll.groupby(["building", "floor"])["count"].sum().reset_index()
+    buildings = poll.groupby("building")["count"].sum().reset_index()
+    return poll, floors, buildings, poll["count"].sum()
+
+
+def main(n_aps=5000, n_buildings=200, repeat=20):
+    with tempfile.TemporaryDirectory() as project_path:
+        poll = make_poll(project_path, n_aps, n_buildings)
+        processor = Cisco_Processor(project_path=project_path)
+
+        processed, floors, buildings, campus = split_groupby(poll.copy())
+        resolved = processor.process(poll.copy())
+        totals = processor.get_totals()
+        assert (resolved["building"] == processed["building"]).all()
+        for level, expected, keys in (("floor", floors, ["building", "floor"]), ("building", buildings, ["building"])):
+            got = totals.loc[totals["level"] == level].sort_values(keys, ignore_index=True)
+            assert (got[keys + ["count"]].to_numpy() == expected[keys + ["count"]].to_numpy()).all()
+        assert totals.loc[totals["level"] == "campus", "count"].item() == campus
+
+        t_groupby = min(timeit.repeat(lambda: split_groupby(poll.copy()), number=1, repeat=repeat))
+        t_resolved = min(timeit.repeat(lambda: (processor.process(poll.copy()), processor.get_totals()), number=1,
+                                       repeat=repeat))
+
+    print("aps=%d buildings=%d floors=%d (identical totals)" % (n_aps, n_buildings, len(floors)))
+    print("split + groupby     : %8.2f ms" % (t_groupby * 1000))
+    print("resolved + bincount : %8.2f ms" % (t_resolved * 1000))
+    print("speedup             : %8.1fx" % (t_groupby / t_resolved))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
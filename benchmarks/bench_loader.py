@@ -0,0 +1,64 @@
+"""
+Times data_applications.data_loader against pd.read_csv + tz localization on the campus 2 case study files: the first
+load (parse and build the cache), a cached load and a cached load of one building over two weeks
+usage: python benchmarks/bench_loader.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+from data_applications.data_loader import load_device_counts, load_power
+
+CAMPUS = os.path.join(ROOT, "case_studies", "campus 2")
+COUNTS = os.path.join(CAMPUS, "campus2_builing_device_count.csv")
+POWER = os.path.join(CAMPUS, "Power")
+
+
+def read_csv_counts():
+    df = pd.read_csv(COUNTS, index_col=[0], parse_dates=True)
+    df.index = df.index.tz_localize("US/Pacific", ambiguous="NaT", nonexistent="shift_forward")
+    return df
+
+
+def read_csv_power():
+    buildings = {}
+    for name in sorted(os.listdir(POWER)):
+        df = pd.read_csv(os.path.join(POWER, name), index_col=[0])
+        df.index = pd.to_datetime(df.index, utc=True).tz_convert("US/Pacific")
+        buildings[os.path.splitext(name)[0]] = df.iloc[:, 0].groupby(level=0).mean()
+    return pd.DataFrame(buildings)
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main():
+    cache_dir = tempfile.mkdtemp()
+    warnings.simplefilter("ignore")
+    try:
+        print("%-14s %10s %10s %10s %14s" % ("file", "read_csv", "first", "cached", "projection"))
+        for name, baseline, load, projection in [
+                ("device counts", read_csv_counts, lambda: load_device_counts(COUNTS, cache_dir=cache_dir),
+                 lambda: load_device_counts(COUNTS, buildings=["building_2"], start="2019-09-15", end="2019-09-30",
+                                            cache_dir=cache_dir)),
+                ("power", read_csv_power, lambda: load_power(POWER, cache_dir=cache_dir),
+                 lambda: load_power(os.path.join(POWER, "building_2.csv"), start="2019-09-15", end="2019-09-30",
+                                    cache_dir=cache_dir))]:
+            print("%-14s %10.3f %10.3f %10.3f %14.3f" % (name, timed(baseline), timed(load), timed(load),
+                                                         timed(projection)))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
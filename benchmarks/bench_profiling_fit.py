@@ -0,0 +1,42 @@
+"""
+Times data_applications.profiling.fit_distributions on the night hours (00:00-04:00) device counts of the campus 2
+case study, for several process pool sizes and with/without subsampling the MLE fits
+usage: python benchmarks/bench_profiling_fit.py [max_workers ...]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+from data_applications.profiling import fit_distributions
+
+CSV = os.path.join(ROOT, "case_studies", "campus 2", "campus2_builing_device_count.csv")
+
+
+def main(workers=(1, 2, 4)):
+    df = pd.read_csv(CSV, index_col=[0], parse_dates=True)
+    night = df.between_time("00:00", "04:00")
+    print("%d buildings, %d night points per building, %d cpus" % (night.shape[1], night.shape[0], os.cpu_count()))
+
+    reference = None
+    print("%12s %10s %10s" % ("max_workers", "subsample", "time (s)"))
+    for subsample in (None, 2000):
+        for max_workers in workers:
+            t0 = time.perf_counter()
+            results = fit_distributions(night, subsample=subsample, max_workers=max_workers)
+            print("%12d %10s %10.2f" % (max_workers, subsample, time.perf_counter() - t0))
+            if subsample is None:
+                if reference is None:
+                    reference = results
+                pd.testing.assert_frame_equal(results, reference)
+
+    best = reference.loc[reference["best"], ["site", "distribution", "sse"]]
+    best_subsample = results.loc[results["best"], ["site", "distribution", "sse"]]
+    print(best.merge(best_subsample, on="site", suffixes=("", "_subsample")).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1, 2, 4))
@@ -0,0 +1,80 @@
+"""
+Compares hourly building means computed from the raw buffer (read_from_db + groupby) with read_rollup, and the cost
+of maintaining the rollups on save_to_db (fast_insert buffer)
+usage: python benchmarks/bench_rollups.py [n_aps] [n_days]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_storage.SQLite_Connector import SQLite_Connector
+
+CONFIG = """
+raw:
+  filename: sqlite:///%s/raw.db
+  table: wifi_buffer_table
+  fast_insert: True
+rollups:
+  filename: sqlite:///%s/rollups.db
+  table: wifi_buffer_table
+  fast_insert: True
+  rollups: True
+"""
+
+
+def make_polls(n_aps, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_names = np.array(["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)], dtype=object)
+    buildings = np.array(["BLDG%d" % (i % 40) for i in range(n_aps)], dtype=object)
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    for poll in range(n_days * 144):
+        yield pd.DataFrame({"ap_name": ap_names, "count": rng.integers(0, 60, n_aps),
+                            "time": start + pd.Timedelta(minutes=10 * poll), "building": buildings})
+
+
+def save(connector, polls):
+    t0 = time.perf_counter()
+    for poll in polls:
+        if not connector.save_to_db(poll):
+            raise Exception("save_to_db failed")
+    return time.perf_counter() - t0
+
+
+def main(n_aps=1000, n_days=7):
+    polls = list(make_polls(n_aps, n_days))
+    with tempfile.TemporaryDirectory() as project_path:
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG)
+        raw = SQLite_Connector(project_path=project_path, section="raw")
+        rollups = SQLite_Connector(project_path=project_path, section="rollups")
+        t_save_raw = save(raw, polls)
+        t_save_rollups = save(rollups, polls)
+
+        t0 = time.perf_counter()
+        data = raw.read_from_db()
+        totals = data.groupby(["time", "building"])["count"].sum().reset_index()
+        totals["period"] = totals["time"].dt.floor("h")
+        from_raw = totals.groupby(["period", "building"])["count"].mean()
+        t_raw = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        from_rollup = rollups.read_rollup("building_hour").set_index(["period", "building"])["mean"]
+        t_rollup = time.perf_counter() - t0
+        raw.close_connection()
+        rollups.close_connection()
+
+    assert np.allclose(from_raw.to_numpy(), from_rollup.to_numpy())
+    print("aps=%d polls=%d rows=%d (identical hourly building means)" % (n_aps, len(polls), len(data)))
+    print("save without rollups  : %8.2f s" % t_save_raw)
+    print("save with rollups     : %8.2f s" % t_save_rollups)
+    print("hourly means from raw : %8.3f s" % t_raw)
+    print("read_rollup           : %8.3f s" % t_rollup)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
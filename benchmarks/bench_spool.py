@@ -0,0 +1,86 @@
+"""
+Compares the spool (Spool_Connector) and SQLite_Connector (fast_insert) local buffers: write (save_to_db of every
+poll), drain (push to a remote that accepts every batch) and trim (delete_data_from_db_based_on_time of the older half)
+throughput in rows per second
+usage: python benchmarks/bench_spool.py [n_aps] [n_days]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_storage.SQLite_Connector import SQLite_Connector
+from data_storage.Spool_Connector import Spool_Connector
+from push_to_remote_db import push
+
+CONFIG = """
+sqlite:
+  filename: sqlite:///%s/sqlite.db
+  table: wifi_buffer_table
+  fast_insert: True
+spool:
+  directory: spool
+"""
+
+
+class Null_Remote(object):
+    def __init__(self):
+        self.n_rows = 0
+
+    def save_to_db(self, data):
+        self.n_rows += len(data)
+        return True
+
+
+def make_polls(n_aps, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_names = np.array(["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)], dtype=object)
+    buildings = np.array(["BLDG%d" % (i % 40) for i in range(n_aps)], dtype=object)
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    for poll in range(n_days * 144):
+        yield pd.DataFrame({"ap_name": ap_names, "count": rng.integers(0, 60, n_aps),
+                            "time": start + pd.Timedelta(minutes=10 * poll), "building": buildings})
+
+
+def run(connector, polls):
+    t0 = time.perf_counter()
+    for poll in polls:
+        if not connector.save_to_db(poll):
+            raise Exception("save_to_db failed")
+    t_write = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    connector.delete_data_from_db_based_on_time(None, time_threshold=polls[len(polls) // 2]["time"].iloc[0])
+    t_trim = time.perf_counter() - t0
+
+    remote = Null_Remote()
+    t0 = time.perf_counter()
+    push(connector, remote)
+    t_drain = time.perf_counter() - t0
+    connector.close_connection()
+    return t_write, t_trim, t_drain, remote.n_rows
+
+
+def main(n_aps=1000, n_days=3):
+    polls = list(make_polls(n_aps, n_days))
+    n_rows = n_aps * len(polls)
+    with tempfile.TemporaryDirectory() as project_path:
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG)
+        results = {"sqlite": run(SQLite_Connector(project_path=project_path, section="sqlite"), polls),
+                   "spool": run(Spool_Connector(project_path=project_path, section="spool"), polls)}
+
+    assert results["sqlite"][3] == results["spool"][3] == n_rows - n_rows // 2
+    print("aps=%d polls=%d rows=%d (trim of %d rows, drain of %d rows)" % (
+        n_aps, len(polls), n_rows, n_rows // 2, results["spool"][3]))
+    print("%-8s %14s %14s %14s" % ("buffer", "write (rows/s)", "trim (rows/s)", "drain (rows/s)"))
+    for backend, (t_write, t_trim, t_drain, n_drained) in results.items():
+        print("%-8s %14.0f %14.0f %14.0f" % (backend, n_rows / t_write, n_rows // 2 / t_trim, n_drained / t_drain))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,62 @@
+"""
+Compares SQLite_Connector.save_to_db through DataFrame.to_sql with the fast_insert mode (typed table, WAL,
+synchronous=NORMAL, one executemany per poll) for 10k, 100k and 1M buffered rows written in polls of n_aps rows
+usage: python benchmarks/bench_sqlite_insert.py [n_aps]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from data_storage.SQLite_Connector import SQLite_Connector
+
+CONFIG = """
+to_sql:
+  filename: sqlite:///%s/to_sql.db
+  table: wifi_buffer_table
+fast_insert:
+  filename: sqlite:///%s/fast_insert.db
+  table: wifi_buffer_table
+  fast_insert: True
+"""
+
+
+def make_polls(n_rows, n_aps, seed=0):
+    rng = np.random.default_rng(seed)
+    ap_names = np.array(["AP-BLDG%d-%d" % (i % 40, i) for i in range(n_aps)], dtype=object)
+    buildings = np.array(["BLDG%d" % (i % 40) for i in range(n_aps)], dtype=object)
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    for poll in range(n_rows // n_aps):
+        yield pd.DataFrame({"ap_name": ap_names, "count": rng.integers(0, 60, n_aps),
+                            "time": start + pd.Timedelta(minutes=10 * poll), "building": buildings})
+
+
+def run(section, n_rows, n_aps):
+    with tempfile.TemporaryDirectory() as project_path:
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG)
+        connector = SQLite_Connector(project_path=project_path, section=section)
+        polls = list(make_polls(n_rows, n_aps))
+        t0 = time.perf_counter()
+        for poll in polls:
+            if not connector.save_to_db(poll):
+                raise Exception("save_to_db failed")
+        elapsed = time.perf_counter() - t0
+        connector.close_connection()
+    return elapsed
+
+
+def main(n_aps=2000):
+    print("%10s %14s %14s %9s" % ("rows", "to_sql (s)", "fast (s)", "speedup"))
+    for n_rows in (10000, 100000, 1000000):
+        t_to_sql = run("to_sql", n_rows, n_aps)
+        t_fast = run("fast_insert", n_rows, n_aps)
+        print("%10d %14.2f %14.2f %8.1fx" % (n_rows, t_to_sql, t_fast, t_to_sql / t_fast))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
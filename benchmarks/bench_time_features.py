@@ -0,0 +1,54 @@
+"""
+Times data_applications.power_forecasting.add_time_features (first call and memoized call) against the previous
+pd.get_dummies/join loop, on a multi-year 5 minute DatetimeIndex with all calendar features
+usage: python benchmarks/bench_time_features.py [years]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+from data_applications.power_forecasting import add_time_features, _time_features_cache
+
+FEATURES = {'year': lambda index: index.year, 'month': lambda index: index.month,
+            'week': lambda index: index.isocalendar().week, 'tod': lambda index: index.hour,
+            'dow': lambda index: index.weekday}
+
+
+def add_time_features_get_dummies(data):
+    for var, fn in FEATURES.items():
+        data[var] = np.asarray(fn(data.index))
+    for var in FEATURES:
+        data = data.join(pd.get_dummies(data[var], prefix=var, drop_first=True))
+        data.drop(columns=[var], inplace=True)
+    return data
+
+
+def main(years=3):
+    index = pd.date_range("2017-01-01", periods=288 * 365 * years, freq="5min", tz="US/Pacific")
+    df = pd.DataFrame({"temp": np.arange(len(index), dtype=float)}, index=index)
+    print("%d rows" % len(index))
+
+    t0 = time.perf_counter()
+    reference = add_time_features_get_dummies(df.copy())
+    print("%-24s %8.3f s" % ("get_dummies loop", time.perf_counter() - t0))
+
+    _time_features_cache.clear()
+    t0 = time.perf_counter()
+    result = add_time_features(df, year=True, month=True, week=True, tod=True, dow=True)
+    print("%-24s %8.3f s" % ("add_time_features", time.perf_counter() - t0))
+    t0 = time.perf_counter()
+    result = add_time_features(df, year=True, month=True, week=True, tod=True, dow=True)
+    print("%-24s %8.3f s" % ("add_time_features cached", time.perf_counter() - t0))
+
+    assert list(result.columns) == list(reference.columns)
+    assert (result.to_numpy(dtype=float) == reference.to_numpy(dtype=float)).all()
+    print("%d columns, %.1f MB of uint8 one-hots" % (result.shape[1], result.iloc[:, 1:].memory_usage().sum() / 1e6))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
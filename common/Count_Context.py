@@ -0,0 +1,140 @@
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+import atexit
+import logging
+import os
+import queue
+import threading
+import yaml
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class _Log_File_Handler(QueueHandler):
+    """
+    queue handler that tags every record with the log file it belongs to
+    """
+
+    def __init__(self, log_queue, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+
+class _Log_File_Router(logging.Handler):
+    """
+    handler of the queue listener thread, writes every record to the rotating file handler of its log file
+    """
+
+    def __init__(self, file_handlers):
+        super().__init__()
+        self.file_handlers = file_handlers
+
+    def emit(self, record):
+        self.file_handlers[record.log_file].handle(record)
+
+
+class Count_Context(object):
+    """
+    This class holds what the COUNT components share in a process: the config file, loaded once, and the logging
+    setup. Loggers get a non-blocking queue handler, attached once per logger and log file, and a single listener
+    thread writes the records to one rotating file handler per log file, so re-instantiating a component does not
+    stack handlers. Components built without a context share the one returned by get_context for their project.
+    """
+
+    _contexts = {}
+    _contexts_lock = threading.Lock()
+
+    def __init__(self, project_path=".", config_file="count_config.yaml"):
+        self.project_path = project_path
+        self.config_file = config_file
+        self.config = None
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.project_path + "/" + 'logs'):
+            os.makedirs(self.project_path + "/" + 'logs')
+        self.log_queue = queue.SimpleQueue()
+        self.file_handlers = {}
+        self.queue_handlers = []
+        self.listener = QueueListener(self.log_queue, _Log_File_Router(self.file_handlers))
+        self.listener.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def get_context(cls, project_path=".", config_file="count_config.yaml"):
+
+        """
+        this method returns the shared context of a project path and config file, created on first use
+        """
+        key = (os.path.realpath(project_path), config_file)
+        with cls._contexts_lock:
+            if key not in cls._contexts:
+                cls._contexts[key] = cls(project_path, config_file)
+            return cls._contexts[key]
+
+    def get_logger(self, name, log_file):
+
+        """
+        this method returns the logger name writing to logs/log_file through the queue, attaching its handler once
+        """
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG)
+        with self._lock:
+            if log_file not in self.file_handlers:
+                handler = TimedRotatingFileHandler(self.project_path + "/" + "logs/" + log_file, when='D', interval=1,
+                                                   backupCount=5)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                self.file_handlers[log_file] = handler
+            if not any(isinstance(handler, _Log_File_Handler) and handler.log_file == log_file and
+                       handler.queue is self.log_queue for handler in logger.handlers):
+                handler = _Log_File_Handler(self.log_queue, log_file)
+                logger.addHandler(handler)
+                self.queue_handlers.append((logger, handler))
+        return logger
+
+    def get_config(self, logger=None):
+
+        """
+        this method returns the config, reading the config file the first time only
+        """
+        with self._lock:
+            if self.config is None:
+                if not os.path.exists(self.project_path + "/" + self.config_file):
+                    if logger is not None:
+                        logger.error("cannot find config_file=%s" % self.config_file)
+                    raise Exception("config file not found")
+
+                with open(self.project_path + "/" + self.config_file, "r") as fp:
+                    self.config = yaml.safe_load(fp)
+                if logger is not None:
+                    logger.info("successfully loaded config_file=%s" % self.config_file)
+        return self.config
+
+    def reload_config(self, logger=None):
+
+        """
+        this method re-reads the config file; components built afterwards see the new config
+        """
+        with self._lock:
+            self.config = None
+        return self.get_config(logger)
+
+    def close(self):
+
+        """
+        this method detaches its handlers from the loggers, flushes the queued records and closes the log files
+        """
+        with Count_Context._contexts_lock:
+            for key, context in list(Count_Context._contexts.items()):
+                if context is self:
+                    del Count_Context._contexts[key]
+        if self.listener is not None:
+            for logger, handler in self.queue_handlers:
+                logger.removeHandler(handler)
+            self.listener.stop()
+            self.listener = None
+            for handler in self.file_handlers.values():
+                handler.close()
@@ -0,0 +1,2 @@
+# @author : Anand Krishnan Prakash <akprakash@lbl.gov>
+# @author : Marco Pritoni <mpritoni@lbl.gov>
\ No newline at end of file
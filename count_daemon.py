@@ -0,0 +1,171 @@
+from data_source.Wifi_Gatherer import Wifi_Gatherer
+from data_storage.InfluxDB_Connector import InfluxDB_Connector
+from data_applications.online_forecaster import Online_Forecaster
+from get_wifi_data import get_data_processor, get_local_database, get_pipeline
+from push_to_remote_db import push
+from common.Count_Context import Count_Context
+import logging
+import os
+import random
+import signal
+import threading
+import time
+
+
+class Periodic_Job(object):
+    """
+    This class runs a function every interval seconds in its own thread.
+    Runs are scheduled at start + k * interval (plus a random jitter per run) so they do not drift; a run that takes
+    longer than the interval never overlaps with the next one, the missed runs are skipped and logged instead.
+    """
+
+    def __init__(self, name, fn, interval, jitter=0, align=True, stop_event=None, logger=None):
+        self.name = name
+        self.fn = fn
+        self.interval = float(interval)
+        self.jitter = float(jitter)
+        self.align = align
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.thread = None
+        self.runs = 0
+        self.skipped = 0
+
+    def _get_start_time(self):
+        now = time.time()
+        if self.align:
+            # same wall clock boundaries as a "*/n" cron entry
+            return (now // self.interval + 1) * self.interval
+        return now
+
+    def _run(self):
+        start = self._get_start_time()
+        tick = 0
+        while True:
+            run_at = start + tick * self.interval + random.uniform(0, self.jitter)
+            if self.stop_event.wait(max(0.0, run_at - time.time())):
+                break
+
+            t0 = time.time()
+            try:
+                self.fn()
+                self.runs += 1
+                self.logger.info("job=%s finished in %.2fs" % (self.name, time.time() - t0))
+            except Exception as e:
+                self.logger.error("job=%s failed after %.2fs, error=%s" % (self.name, time.time() - t0, str(e)))
+
+            next_tick = int((time.time() - start) // self.interval) + 1
+            if next_tick > tick + 1:
+                self.skipped += next_tick - tick - 1
+                self.logger.warning("job=%s overran its interval of %ss, skipping %d run(s)" % (
+                    self.name, self.interval, next_tick - tick - 1))
+            tick = max(next_tick, tick + 1)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+class Count_Daemon(object):
+    """
+    This class builds the gatherer, processor and databases once and runs collect (get_wifi_data) and push
+    (push_to_remote_db) on periodic jobs until it receives SIGINT/SIGTERM
+    """
+
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="daemon", context=None):
+        """
+        initialize logging and read config file, once for the daemon and every component it builds
+        """
+        self.context = context if context is not None else Count_Context.get_context(project_path, config_file)
+        self.project_path = self.context.project_path
+        self.logger = self.context.get_logger(__name__, "count_daemon.log")
+        self.config_file = self.context.config_file
+        self.daemon_section = section
+        self.config = self.context.get_config(self.logger)
+
+        try:
+            daemon_cfg = self.config.get(self.daemon_section) or {}
+            self.collect_interval = daemon_cfg.get("collect_interval", 600)
+            self.push_interval = daemon_cfg.get("push_interval", 600)
+            self.jitter = daemon_cfg.get("jitter", 0)
+            self.align = daemon_cfg.get("align", True)
+            self.push_enabled = daemon_cfg.get("push", True)
+        except Exception as e:
+            self.logger.error(
+                "unexpected error while setting configuration from config_file=%s, section=%s, error=%s" % (
+                    self.config_file, self.daemon_section, str(e)))
+            raise e
+
+        self.stop_event = threading.Event()
+        self.data_source_obj = Wifi_Gatherer(section="snmp", context=self.context)
+        self.data_processor_obj = get_data_processor(self.project_path, self.config_file, section="data_processor",
+                                                     context=self.context)
+        self.local_database_obj = get_local_database(self.project_path, self.config_file, section="local_db",
+                                                     context=self.context)
+        self.pipeline = get_pipeline(self.project_path, self.config_file, self.data_source_obj,
+                                     self.data_processor_obj, self.local_database_obj, context=self.context)
+        self.forecaster_obj = None
+        if self.config.get("forecaster"):
+            self.forecaster_obj = Online_Forecaster(self.local_database_obj, section="forecaster",
+                                                    context=self.context)
+        self.remote_database_obj = None
+        if self.push_enabled:
+            self.remote_database_obj = InfluxDB_Connector(section="remote_db", context=self.context)
+
+        self.jobs = [Periodic_Job("collect", self.collect, self.collect_interval, jitter=self.jitter, align=self.align,
+                                  stop_event=self.stop_event, logger=self.logger)]
+        if self.push_enabled:
+            self.jobs.append(Periodic_Job("push", self.push, self.push_interval, jitter=self.jitter, align=self.align,
+                                          stop_event=self.stop_event, logger=self.logger))
+
+    def collect(self):
+        self.pipeline.run()
+        if self.forecaster_obj is not None:
+            # in the collect job so the new poll is read before a push deletes it from the buffer
+            try:
+                self.forecaster_obj.forecast()
+            except Exception as e:
+                self.logger.error("forecaster failed, error=%s" % str(e))
+
+    def push(self):
+        push(self.local_database_obj, self.remote_database_obj)
+
+    def stop(self, *args):
+        self.logger.info("stopping count daemon")
+        self.stop_event.set()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for job in self.jobs:
+            job.start()
+        self.logger.info("count daemon started with jobs=%s" % [job.name for job in self.jobs])
+
+        # the main thread has to stay interruptible to receive the signals
+        while not self.stop_event.wait(1):
+            pass
+
+        for job in self.jobs:
+            job.join()
+        self.close_connection()
+        self.logger.info("count daemon stopped")
+
+    def close_connection(self):
+        self.local_database_obj.close_connection()
+        self.pipeline.close_connection()
+        if self.forecaster_obj is not None:
+            self.forecaster_obj.close_connection()
+        if self.remote_database_obj is not None:
+            self.remote_database_obj.close_connection()
+
+
+if __name__ == "__main__":
+    project_path = os.path.dirname(os.path.realpath(__file__))
+    config_file = "count_config.yaml"
+
+    Count_Daemon(project_path=project_path, config_file=config_file, section="daemon").run()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+CACHE_FOLDER = '.count_cache'
+CACHE_VERSION = 1
+# Timezone named in a timestamp column header, e.g. 'US/Pacific Time Stamp' or 'DateTime US/Pacific'
+TIMEZONE_PATTERN = re.compile(r'[A-Za-z]+/[A-Za-z_]+(?:/[A-Za-z_]+)?')
+# UTC offset at the end of a timestamp, e.g. '2018-01-01 00:14:59-08:00'
+OFFSET_PATTERN = re.compile(r'(?:[+-]\d{2}:?\d{2}|Z)$')
+
+
+def _file_hash(filename, timezone, block_size=1 << 20):
+    """ Hash of the content of a file and of the timezone its naive timestamps are localized to, the cache key. """
+    digest = hashlib.blake2b(timezone.encode('utf-8'), digest_size=16)
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _get_cache_dir(filename, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_FOLDER)
+    return cache_dir
+
+
+def _to_utc_nanoseconds(times):
+    return times.dt.tz_convert('UTC').dt.tz_localize(None).dt.as_unit('ns').to_numpy().view(np.int64)
+
+
+def _parse_times(times, header, timezone):
+    """ Parse a timestamp column into UTC nanoseconds.
+    Timestamps with an offset are converted to UTC. Naive timestamps are localized to the timezone named in the
+    header (e.g. 'DateTime US/Pacific') or else to timezone; ambiguous DST times that cannot be inferred are dropped.
+    Returns
+    -------
+    (np.ndarray, str)
+        int64 UTC nanoseconds (NaT as the minimum int64) and the timezone of the index.
+    """
+    named = TIMEZONE_PATTERN.search(str(header))
+    if named is not None:
+        timezone = named.group(0)
+
+    if OFFSET_PATTERN.search(str(times.dropna().iloc[0]) if times.notna().any() else ''):
+        # offsets change with DST (-08:00/-07:00), parse everything to UTC
+        return _to_utc_nanoseconds(pd.to_datetime(times, utc=True)), timezone
+
+    parsed = pd.to_datetime(times).dt.as_unit('ns')
+    try:
+        localized = parsed.dt.tz_localize(timezone, ambiguous='infer', nonexistent='shift_forward')
+    except Exception:
+        localized = parsed.dt.tz_localize(timezone, ambiguous='NaT', nonexistent='shift_forward')
+        if localized.isna().sum() > parsed.isna().sum():
+            warnings.warn('%d ambiguous timestamps could not be localized to %s and are dropped' % (
+                localized.isna().sum() - parsed.isna().sum(), timezone))
+    return _to_utc_nanoseconds(localized), timezone
+
+
+def _build_cache(filename, path, timezone):
+    """ Parse a CSV (timestamp in the first column) into one .npy file per column, sorted by time. """
+    df = pd.read_csv(filename)
+    times, timezone = _parse_times(df.iloc[:, 0], df.columns[0], timezone)
+    valid = times != np.iinfo(np.int64).min
+    order = np.flatnonzero(valid)[np.argsort(times[valid], kind='stable')]
+
+    tmp_path = path + '.tmp%d' % os.getpid()
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'time.npy'), times[order])
+    columns = []
+    for i, column in enumerate(df.columns[1:]):
+        values = pd.to_numeric(df[column], errors='raise').to_numpy()
+        if not np.issubdtype(values.dtype, np.number):
+            values = values.astype(float)
+        np.save(os.path.join(tmp_path, 'column_%d.npy' % i), values[order])
+        columns.append(column)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as fp:
+        json.dump({'version': CACHE_VERSION, 'source': os.path.basename(filename), 'timezone': timezone,
+                   'columns': columns}, fp)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # another process built the same cache first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _remove_stale_caches(cache_dir, prefix, keep):
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != keep and '.tmp' not in name:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+def load_csv(filename, columns=None, start=None, end=None, timezone='US/Pacific', cache_dir=None):
+    """ Load a time series CSV (timestamp in the first column, numeric columns) with a tz-aware index.
+    The first load parses the CSV once into a cache of memory-mapped NumPy arrays keyed by the hash of the file,
+    next loads only read the requested columns and rows from the cache.
+    Parameters
+    ----------
+    filename    : str
+        CSV file, e.g. a building power or a device count case study file.
+    columns     : list
+        Columns to load (default all).
+    start, end  : str or pd.Timestamp
+        Time range to load, inclusive like df.loc[start:end] (naive values are in the index timezone).
+    timezone    : str
+        Timezone of naive timestamps when the header does not name one, and of the index of offset timestamps.
+    cache_dir   : str
+        Cache folder, default .count_cache next to the CSV.
+    Returns
+    -------
+    pd.DataFrame
+        Selected columns indexed by a tz-aware, time sorted DatetimeIndex named 'time'.
+    """
+    cache_dir = _get_cache_dir(filename, cache_dir)
+    prefix = os.path.basename(filename) + '-'
+    path = os.path.join(cache_dir, prefix + _file_hash(filename, timezone))
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        os.makedirs(cache_dir, exist_ok=True)
+        _build_cache(filename, path, timezone)
+        _remove_stale_caches(cache_dir, prefix, os.path.basename(path))
+
+    with open(os.path.join(path, 'meta.json')) as fp:
+        meta = json.load(fp)
+    selected = meta['columns'] if columns is None else list(columns)
+    missing = [column for column in selected if column not in meta['columns']]
+    if missing:
+        raise KeyError('columns %s not found in %s' % (missing, filename))
+
+    times = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+    index = pd.DatetimeIndex(np.asarray(times).view('M8[ns]')).tz_localize('UTC').tz_convert(meta['timezone'])
+    rows = index.slice_indexer(start, end)
+    index = index[rows]
+    data = {column: np.array(np.load(os.path.join(path, 'column_%d.npy' % meta['columns'].index(column)),
+                                     mmap_mode='r')[rows])
+            for column in selected}
+
+    index.name = 'time'
+    return pd.DataFrame(data, index=index, columns=selected)
+
+
+def load_device_counts(filename, buildings=None, start=None, end=None, timezone='US/Pacific', cache_dir=None):
+    """ Load a building device count CSV (one column per building, e.g. campus2_builing_device_count.csv).
+    See load_csv.
+    """
+    return load_csv(filename, columns=buildings, start=start, end=end, timezone=timezone, cache_dir=cache_dir)
+
+
+def load_power(filenames, start=None, end=None, timezone='US/Pacific', cache_dir=None, freq=None):
+    """ Load building power CSVs (one file per building, e.g. Power/building_1.csv) into one wide frame.
+    Parameters
+    ----------
+    filenames   : list or str
+        Power CSV files, or a folder of them. The columns are named after the files (building_1, ...).
+    start, end  : str or pd.Timestamp
+        Time range to load.
+    timezone    : str
+        See load_csv.
+    cache_dir   : str
+        See load_csv.
+    freq        : str
+        Resample every building to this frequency (mean) before aligning them, e.g. '15min'. Without freq,
+        duplicated timestamps of a building are averaged.
+    Returns
+    -------
+    pd.DataFrame
+        Power of every building on the union of their (resampled) timestamps.
+    """
+    if isinstance(filenames, str) and os.path.isdir(filenames):
+        filenames = sorted(os.path.join(filenames, name) for name in os.listdir(filenames) if name.endswith('.csv'))
+    elif isinstance(filenames, str):
+        filenames = [filenames]
+
+    buildings = {}
+    for filename in filenames:
+        df = load_csv(filename, start=start, end=end, timezone=timezone, cache_dir=cache_dir)
+        series = df.iloc[:, 0]
+        if freq is not None:
+            series = series.resample(freq).mean()
+        elif not series.index.is_unique:
+            series = series.groupby(level=0).mean()
+        buildings[os.path.splitext(os.path.basename(filename))[0]] = series
+    return pd.DataFrame(buildings)
@@ -0,0 +1,171 @@
+from data_storage.SQLite_Connector import SQLite_Connector
+from data_storage.InfluxDB_Connector import InfluxDB_Connector
+from data_applications.power_forecasting import TIME_FEATURES, load_models
+from common.Count_Context import Count_Context
+import numpy as np
+import pandas as pd
+
+# Output databases of the forecaster, selected with the output_type config parameter
+OUTPUT_TYPES = {'sqlite': SQLite_Connector, 'influxdb': InfluxDB_Connector}
+
+
+class Online_Forecaster(object):
+    """
+    This class predicts the next interval power of every building from the live local buffer.
+    The model (coefficients saved by power_forecasting.save_models) is loaded once; every tick reads only the polls
+    newer than its own high water mark in the buffer, keeps the building totals of the last interval in memory and
+    writes one prediction per building to a SQLite table or an InfluxDB measurement. The model may only use the
+    occupancy and the time features of add_time_features, so the cost of a tick does not depend on the history.
+    """
+
+    def __init__(self, local_database_obj, project_path=".", config_file="count_config.yaml", section="forecaster",
+                 context=None):
+        self.local_database_obj = local_database_obj
+        """
+        initialize logging and read config file, once per process (see Count_Context)
+        """
+        self.context = context if context is not None else Count_Context.get_context(project_path, config_file)
+        self.project_path = self.context.project_path
+        self.logger = self.context.get_logger(__name__, "online_forecaster.log")
+        self.config_file = self.context.config_file
+        self.forecaster_section = section
+        self.config = self.context.get_config(self.logger)
+
+        try:
+            forecaster_cfg = self.config[self.forecaster_section]
+            self.model_filename = forecaster_cfg.get("model_filename", "forecast_model.pkl")
+            self.variant = forecaster_cfg.get("variant", "with_occupancy")
+            self.interval = pd.Timedelta(forecaster_cfg.get("interval", "15min"))
+            self.timezone = forecaster_cfg.get("timezone", "US/Pacific")
+            self.output_type = forecaster_cfg.get("output_type", "sqlite")
+            self.output_section = forecaster_cfg.get("output", "forecast_db")
+            self.high_water_mark_name = forecaster_cfg.get("high_water_mark_name", "forecaster")
+            self.max_rows = forecaster_cfg.get("max_rows", 50000)
+            if self.output_type not in OUTPUT_TYPES:
+                raise Exception("unknown forecaster output_type=%s, expected one of %s" % (
+                    self.output_type, list(OUTPUT_TYPES)))
+        except Exception as e:
+            self.logger.error("unexpected error while setting configuration from config_file=%s, section=%s, "
+                              "error=%s" % (self.config_file, self.forecaster_section, str(e)))
+            raise e
+
+        self._load_model()
+        self.output_database_obj = OUTPUT_TYPES[self.output_type](section=self.output_section,
+                                                                  context=self.context)
+        self.recent = None
+        self.high_water_mark = None
+
+    def _load_model(self):
+
+        """
+        this method loads the coefficients once and splits their rows into the intercept, the time features (as
+        feature/value pairs compared with the target time at every tick) and the occupancy coefficients
+        """
+        try:
+            coefficients = load_models(self.project_path + "/" + self.model_filename)[self.variant]
+        except Exception as e:
+            self.logger.error("cannot load model variant=%s from model_filename=%s, error=%s" % (
+                self.variant, self.model_filename, str(e)))
+            raise e
+
+        features, values = [], []
+        for name in coefficients.index[1:].drop('occupancy', errors='ignore'):
+            feature, _, value = name.rpartition('_')
+            if feature not in TIME_FEATURES or not value.isdigit():
+                raise Exception("model feature=%s cannot be computed online, only occupancy and time features "
+                                "are supported" % name)
+            features.append(TIME_FEATURES.index(feature))
+            values.append(int(value))
+
+        self.buildings = list(coefficients.columns)
+        self.intercept = coefficients.iloc[0].to_numpy(dtype=float)
+        self.feature_index = np.array(features, dtype=np.int64)
+        self.feature_values = np.array(values, dtype=np.int64)
+        self.time_coefficients = coefficients.iloc[1:1 + len(features)].to_numpy(dtype=float)
+        self.occupancy_coefficients = None
+        if 'occupancy' in coefficients.index:
+            self.occupancy_coefficients = coefficients.loc['occupancy'].to_numpy(dtype=float)
+        self.logger.info("loaded model variant=%s with %d time features for %d buildings" % (
+            self.variant, len(features), len(self.buildings)))
+
+    def _get_time_features(self, time):
+
+        """
+        this method returns the one-hot time features of a single timestamp, in the model's row order
+        """
+        local = time.tz_convert(self.timezone)
+        calendar = np.array([local.year, local.month, local.isocalendar()[1], local.hour, local.weekday()])
+        return (calendar[self.feature_index] == self.feature_values).astype(float)
+
+    def _read_new_polls(self):
+
+        """
+        this method reads the polls newer than the high water mark; the first tick starts one interval before the
+        newest poll instead of reading the whole buffer
+        """
+        if self.high_water_mark is None:
+            self.high_water_mark = self.local_database_obj.get_high_water_mark(name=self.high_water_mark_name)
+            latest_time = self.local_database_obj.get_latest_time()
+            if latest_time is not None and (self.high_water_mark is None or
+                                            self.high_water_mark < latest_time - self.interval):
+                self.high_water_mark = latest_time - self.interval
+        return self.local_database_obj.read_chunk_from_db(after_time=self.high_water_mark, max_rows=self.max_rows)
+
+    def predict(self, time=None):
+
+        """
+        this method returns the predicted power of every building for the interval after time (default: the newest
+        poll), using the mean building occupancy of the last interval. Every poll refines the prediction of the same
+        interval, poll_time tells them apart
+        """
+        if time is None:
+            time = self.recent.index.max()
+        target_time = time.floor(self.interval) + self.interval
+
+        prediction = self.intercept + self._get_time_features(target_time) @ self.time_coefficients
+        occupancy = self.recent.mean().reindex(self.buildings).to_numpy(dtype=float)
+        if self.occupancy_coefficients is not None:
+            prediction = prediction + occupancy * self.occupancy_coefficients
+        return pd.DataFrame({'time': target_time, 'building': self.buildings, 'predicted_power': prediction,
+                             'occupancy': occupancy, 'poll_time': time})
+
+    def forecast(self):
+
+        """
+        this method runs one tick: reads the new polls, updates the building occupancy of the last interval,
+        predicts the next interval and saves the predictions. Returns the predictions (empty if no new poll)
+        """
+        data = self._read_new_polls()
+        if data.empty:
+            self.logger.info("no new poll in the local buffer since %s" % self.high_water_mark)
+            return pd.DataFrame()
+
+        totals = data.pivot_table(index='time', columns='building', values='count', aggfunc='sum')
+        totals = totals.reindex(columns=self.buildings)
+        recent = totals if self.recent is None else pd.concat([self.recent, totals])
+        latest_time = recent.index.max()
+        self.recent = recent.loc[recent.index > latest_time - self.interval]
+
+        predictions = self.predict(latest_time)
+        missing = predictions['predicted_power'].isna()
+        if missing.any():
+            self.logger.warning("no occupancy for buildings=%s, no prediction saved for them" % (
+                list(predictions.loc[missing, 'building'])))
+            predictions = predictions.loc[~missing]
+
+        if self.output_type == 'influxdb':
+            saved = self.output_database_obj.save_to_db(predictions, tag_columns=['building'],
+                                                        field_columns=['predicted_power', 'occupancy'])
+        else:
+            saved = self.output_database_obj.save_to_db(predictions)
+        if not saved:
+            raise Exception("Failed to save predictions to %s" % self.output_section)
+
+        self.high_water_mark = data['time'].iloc[-1]
+        self.local_database_obj.set_high_water_mark(self.high_water_mark, name=self.high_water_mark_name)
+        self.logger.info("saved predictions of %d buildings for the interval after %s" % (len(predictions),
+                                                                                          latest_time))
+        return predictions
+
+    def close_connection(self):
+        self.output_database_obj.close_connection()
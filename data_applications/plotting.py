@@ -0,0 +1,99 @@
+import pandas as pd
+import matplotlib.pyplot as plt
+import scipy.stats as st
+
+from data_applications.profiling import best_fit_distribution
+
+
+def plot_fitted_distributions(data, site):
+    """Plots the histogram of data with the pdfs of all the fitted distributions (called in find_dist)
+
+    Returns
+    -------
+    name and params of the best fitting distribution
+    """
+    plt.figure(figsize=(12,5))
+    ax = data.plot(kind='hist', bins=50, density=True, alpha=0.5)#, color=plt.rcParams['axes.color_cycle'][1])
+    # Save plot limits
+    dataYLim = ax.get_ylim()
+
+    # Find best fit distribution
+    best_fit_name, best_fit_params = best_fit_distribution(data, 200, ax)
+
+    # Update plots
+    ax.set_ylim(dataYLim)
+    ax.set_title(u'Device Count Data \n All Fitted Distributions for '+' '+site)
+    ax.set_xlabel(u'Device Count')
+    ax.set_ylabel('Frequency')
+
+    return best_fit_name, best_fit_params
+
+
+def plot_best_distribution(data, site, best_fit_name, best_fit_params, pdf):
+    """Plots the histogram of data with the pdf of the best fitting distribution (called in find_dist)"""
+    best_dist = getattr(st, best_fit_name)
+
+    # Display
+    plt.figure(figsize=(12,5))
+    ax = pdf.plot(lw=2, label='PDF', legend=True)
+    data.plot(kind='hist', bins=50, density=True, alpha=0.5, label='Data', legend=True, ax=ax)
+
+    param_names = (best_dist.shapes + ', loc, scale').split(', ') if best_dist.shapes else ['loc', 'scale']
+    param_str = ', '.join(['{}={:0.2f}'.format(k,v) for k,v in zip(param_names, best_fit_params)])
+    dist_str = '{}({})'.format(best_fit_name, param_str)
+
+    ax.set_title(u'Device Count Data with best fit distribution \n for '+site+' '+ dist_str)
+    ax.set_xlabel(u'Device Count')
+    ax.set_ylabel('Frequency')
+    return ax
+
+
+def plot_hourly_profile(occ_desc, column='Building Device Count'):
+    """Plots the interquartile range of device count by hour of day (called in hourly_profile)
+
+    Parameters
+    ----------
+    occ_desc : DataFrame
+        output of hourly_profile_stats
+    column : string
+        device count column to plot
+    """
+    hour_day = list(occ_desc.index)
+    hour_median = list(occ_desc[(column,   '50%')])
+    hour_25 = list(occ_desc[(column,   '25%')])
+    hour_75 = list(occ_desc[(column,   '75%')])
+
+    # plot initalizing
+    font = {'size'   : 12}
+    plt.rc('font', **font)
+
+    fig, ax = plt.subplots(figsize=(12,10))
+    plt.grid(axis = 'y', linestyle = '--', linewidth = 0.5)
+    ax.bar(hour_day, hour_median, bottom=hour_25, label='Q1-Median')
+    ax.bar(hour_day, hour_75, bottom=hour_median, label='Median-Q3')
+
+    ax.set_ylabel('Device Count')
+    ax.set_xlabel('Hour of Day')
+    ax.set_title('Distribution of Device Count by Hour')
+    ax.set_xticks(hour_day)
+    ax.legend()
+    plt.show()
+    return ax
+
+
+def plot_static_removal(df, no_static_df):
+    """Plots the device count histograms with and without static devices (called in remove_static)"""
+    # plot initalizing
+    font = {'size'   : 12}
+    plt.rc('font', **font)
+
+    kwargs = dict(alpha=0.5, bins=100)
+
+    plt.figure(figsize=(10, 10), dpi=80)
+
+    plt.xlim(xmax = df.iloc[:,0].describe()['75%'])
+
+    plt.hist(df.iloc[:,0].values.tolist(), **kwargs, label='With Static Devices')
+    plt.hist(no_static_df.iloc[:,0].values.tolist(), **kwargs, label='Without Static Devices')
+    plt.gca().set(title='Static Removal Shift', xlabel='Device Count', ylabel='Device Count Frequency')
+    plt.legend()
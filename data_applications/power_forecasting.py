@@ -5,9 +5,21 @@ from sklearn.model_selection import RandomizedSearchCV
 from sklearn.model_selection import KFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import pandas as pd
+import numpy as np
+import scipy.sparse
 import matplotlib.pyplot as plt
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from math import *
 
+# Calendar features encoded by build_time_features, in column order
+TIME_FEATURES = ('year', 'month', 'week', 'tod', 'dow')
+NS_PER_DAY = 86400 * 10 ** 9
+NS_PER_HOUR = 3600 * 10 ** 9
+TIME_FEATURES_CACHE_SIZE = 8
+_time_features_cache = OrderedDict()
+
 def calc_adj_r2(r2, n, k):
     """ Calculate and return adjusted r2 score.
     Parameters
@@ -25,7 +37,84 @@ def calc_adj_r2(r2, n, k):
     """
     return 1 - (((1 - r2) * (n - 1)) / (n - k - 1))
 
-def add_time_features(data, year=False, month=False, week=False, tod=False, dow=False):
+def _time_features_key(index, features, sparse):
+    """ Cache key of build_time_features: a digest of the timestamps (and timezone) and the requested encoding. """
+    digest = hashlib.blake2b(np.ascontiguousarray(index.asi8).tobytes(), digest_size=16).hexdigest()
+    return digest, str(index.tz), len(index), features, sparse
+
+def _time_feature_values(name, ns):
+    """ Integer value of a calendar feature per timestamp, from the local wall time in nanoseconds. The per day
+    features (year, month, week) are only computed once per distinct day. """
+    if name == 'tod':
+        return ns // NS_PER_HOUR % 24
+    day = ns // NS_PER_DAY
+    if name == 'dow':
+        # 1970-01-01 was a Thursday
+        return (day + 3) % 7
+    first_day = day.min()
+    days = pd.DatetimeIndex(np.arange(first_day, day.max() + 1) * NS_PER_DAY)
+    per_day = days.isocalendar().week if name == 'week' else getattr(days, name)
+    return np.asarray(per_day, dtype=np.int64)[day - first_day]
+
+def build_time_features(index, year=False, month=False, week=False, tod=False, dow=False, sparse=False):
+    """ One-hot encode the calendar features of a DatetimeIndex in one pass.
+    The columns are the same as pd.get_dummies(..., prefix=feature, drop_first=True) per feature, in the order year,
+    month, week, tod, dow. The encoding is memoized on the index values, so repeated calls over the same index (e.g.
+    train and predict) reuse it; the returned matrix is shared with the cache and read-only.
+    Parameters
+    ----------
+    index   : pd.DatetimeIndex
+        Timestamps to encode.
+    year, month, week, tod, dow    : bool
+        Features to encode (week is the ISO week).
+    sparse  : bool
+        Return a scipy.sparse.csr_matrix instead of a dense uint8 array.
+    Returns
+    -------
+    (np.ndarray or scipy.sparse.csr_matrix, list)
+        One-hot matrix (len(index), n_columns) and column names.
+    """
+    requested = {'year': year, 'month': month, 'week': week, 'tod': tod, 'dow': dow}
+    features = tuple(name for name in TIME_FEATURES if requested[name])
+    key = _time_features_key(index, features, sparse)
+    if key in _time_features_cache:
+        _time_features_cache.move_to_end(key)
+        return _time_features_cache[key]
+
+    n_rows = len(index)
+    ns = (index.tz_localize(None) if index.tz is not None else index).as_unit('ns').asi8
+    columns = []
+    rows, cols = [], []
+    for name in features if n_rows else ():
+        values = _time_feature_values(name, ns)
+        # integer codes of the present values, the smallest one is the drop_first reference (all zeros)
+        offset = values.min()
+        present_values = np.flatnonzero(np.bincount(values - offset)) + offset
+        lookup = np.zeros(present_values[-1] - offset + 1, dtype=np.int64)
+        lookup[present_values - offset] = np.arange(len(present_values))
+        codes = lookup[values - offset]
+        present = codes > 0
+        rows.append(np.flatnonzero(present))
+        cols.append(codes[present] - 1 + len(columns))
+        columns.extend('%s_%d' % (name, value) for value in present_values[1:])
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+
+    if sparse:
+        matrix = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, cols)),
+                                         shape=(n_rows, len(columns)))
+    else:
+        # column-major, so each one-hot column is contiguous and a DataFrame can be built without transposing
+        matrix = np.zeros((n_rows, len(columns)), dtype=np.uint8, order='F')
+        matrix.T.reshape(-1)[cols * n_rows + rows] = 1
+        matrix.setflags(write=False)
+
+    _time_features_cache[key] = (matrix, columns)
+    if len(_time_features_cache) > TIME_FEATURES_CACHE_SIZE:
+        _time_features_cache.popitem(last=False)
+    return matrix, columns
+
+def add_time_features(data, year=False, month=False, week=False, tod=False, dow=False, sparse=False):
     """ Add time features to dataframe.
     Parameters
     ----------
@@ -39,38 +128,18 @@ def add_time_features(data, year=False, month=False, week=False, tod=False, dow=
         Time of Day.
     dow    : bool
         Day of Week.
+    sparse  : bool
+        Add the one-hot columns as sparse columns.
     """
+    matrix, columns = build_time_features(data.index, year=year, month=month, week=week, tod=tod, dow=dow,
+                                          sparse=sparse)
+    if sparse:
+        dummies = pd.DataFrame.sparse.from_spmatrix(matrix, index=data.index, columns=columns)
+    else:
+        dummies = pd.DataFrame(matrix, index=data.index, columns=columns, copy=True)
 
-    var_to_expand = []
-
-    if year:
-        data["year"] = data.index.year
-        var_to_expand.append("year")
-    if month:
-        data["month"] = data.index.month
-        var_to_expand.append("month")
-    if week:
-        data["week"] = data.index.week
-        var_to_expand.append("week")
-    if tod:
-        data["tod"] = data.index.hour
-        var_to_expand.append("tod")
-    if dow:
-        data["dow"] = data.index.weekday
-        var_to_expand.append("dow")
-
-    # One-hot encode the time features
-    for var in var_to_expand:
-
-            add_var = pd.get_dummies(data[var], prefix=var, drop_first=True)
-
-            # Add all the columns to the model data
-            data = data.join(add_var)
-
-            # Drop the original column that was expanded
-            data.drop(columns=[var], inplace=True)
-            
-    return data
+    # Add all the columns to the model data
+    return pd.concat([data, dummies], axis=1)
 
 def train_model(df, st_training_period, et_training_period, with_occ_data=False):
     
@@ -127,4 +196,155 @@ def plot_data(project_df, testing_period, bldg_name, with_occ_data=False):
     ax.set_ylabel('Power (kW)')
 
     print('RMSE: ', sqrt(mean_squared_error(project_df.iloc[:,0], project_df.iloc[:,1])))
-    print('MAE: ', mean_absolute_error(project_df.iloc[:,0], project_df.iloc[:,1]))
\ No newline at end of file
+    print('MAE: ', mean_absolute_error(project_df.iloc[:,0], project_df.iloc[:,1]))
+
+def _design_matrix(features):
+    """ Intercept column followed by the features, as one float array. """
+    X = np.empty((features.shape[0], features.shape[1] + 1))
+    X[:, 0] = 1.0
+    X[:, 1:] = features.to_numpy(dtype=float)
+    return X
+
+def _fit_batch(X, Y, O=None):
+    """ Solve the least-squares problems of all buildings (columns of Y) at once.
+    Without occupancy the coefficients are the multi-output solution of X @ B = Y. With occupancy (column j of O is
+    the extra regressor of building j), the occupancy coefficient is found on the residuals of Y and O on X
+    (Frisch-Waugh-Lovell), so the shared design matrix is still solved only once.
+    Returns
+    -------
+    (B, beta)
+        Coefficients on X (n_features + 1, n_buildings) and occupancy coefficients (n_buildings,) or None.
+    """
+    if O is None:
+        return np.linalg.lstsq(X, Y, rcond=None)[0], None
+
+    n_buildings = Y.shape[1]
+    coefficients = np.linalg.lstsq(X, np.hstack([Y, O]), rcond=None)[0]
+    residuals = np.hstack([Y, O]) - X @ coefficients
+    r_y, r_o = residuals[:, :n_buildings], residuals[:, n_buildings:]
+    denominator = (r_o * r_o).sum(axis=0)
+    beta = np.divide((r_y * r_o).sum(axis=0), denominator, out=np.zeros(n_buildings), where=denominator > 0)
+    B = coefficients[:, :n_buildings] - coefficients[:, n_buildings:] * beta
+    return B, beta
+
+def _predict_batch(X, B, beta=None, O=None):
+    prediction = X @ B
+    if beta is not None:
+        prediction += O * beta
+    return prediction
+
+def _score_fold(X, Y, O, train, test):
+    """ Fit on the train rows and return the R2, RMSE and MAE of every building on the test rows. """
+    B, beta = _fit_batch(X[train], Y[train], None if O is None else O[train])
+    error = Y[test] - _predict_batch(X[test], B, beta, None if O is None else O[test])
+    ss_res = (error ** 2).sum(axis=0)
+    ss_tot = ((Y[test] - Y[test].mean(axis=0)) ** 2).sum(axis=0)
+    r2 = 1 - ss_res / ss_tot
+    return r2, np.sqrt(ss_res / len(test)), np.abs(error).mean(axis=0)
+
+def train_models_batch(power, features, occupancy=None, st_training_period=None, et_training_period=None,
+                       n_splits=3, max_workers=None, random_state=42):
+    """ Train the power models of all buildings together, with and without occupancy data.
+    The design matrix (intercept and shared features) is built once and every building's least-squares problem is
+    solved in one multi-output call; buildings whose power/occupancy data are missing at different times are solved
+    in separate groups. The cross-validation folds run in parallel threads.
+    Parameters
+    ----------
+    power       : pd.DataFrame
+        Power of every building (one column per building).
+    features    : pd.DataFrame
+        Regressors shared by all buildings on the same index (e.g. temperature and add_time_features dummies).
+    occupancy   : pd.DataFrame
+        Occupancy of every building, same columns as power. If None only the model without occupancy is trained.
+    st_training_period, et_training_period  : str
+        Training period.
+    n_splits    : int
+        Number of KFold splits.
+    max_workers : int
+        Number of threads running the folds.
+    random_state    : int
+        Seed of the KFold shuffle.
+    Returns
+    -------
+    (dict, pd.DataFrame)
+        Coefficients of the models trained on the whole period per variant ('without_occupancy',
+        'with_occupancy'), one column per building, and the cross-validation metrics (r2, adj_r2, rmse, mae)
+        indexed by (building, variant).
+    """
+    power = power.loc[st_training_period:et_training_period]
+    features = features.loc[power.index].dropna(how='any')
+    power = power.loc[features.index]
+    variants = {'without_occupancy': None}
+    if occupancy is not None:
+        occupancy = occupancy.loc[power.index, power.columns]
+        variants['with_occupancy'] = occupancy
+
+    # group buildings with the same missing data so each group shares one design matrix
+    available = power.notna() if occupancy is None else power.notna() & occupancy.notna()
+    groups = {}
+    for building in power.columns:
+        groups.setdefault(available[building].to_numpy().tobytes(), []).append(building)
+
+    names = ['intercept'] + list(features.columns)
+    models = {variant: pd.DataFrame(index=names + (['occupancy'] if O is not None else []), columns=power.columns,
+                                    dtype=float) for variant, O in variants.items()}
+    metrics = []
+    kfold = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for mask, buildings in groups.items():
+            rows = np.frombuffer(mask, dtype=bool)
+            X = _design_matrix(features[rows])
+            Y = power.loc[rows, buildings].to_numpy(dtype=float)
+            folds = list(kfold.split(X))
+
+            for variant, O in variants.items():
+                O = None if O is None else O.loc[rows, buildings].to_numpy(dtype=float)
+                scores = list(executor.map(lambda fold: _score_fold(X, Y, O, *fold), folds))
+                r2, rmse, mae = [np.mean([score[i] for score in scores], axis=0) for i in range(3)]
+                n_regressors = X.shape[1] - 1 + (O is not None)
+                metrics.append(pd.DataFrame({'building': buildings, 'variant': variant, 'r2': r2,
+                                             'adj_r2': calc_adj_r2(r2, X.shape[0], n_regressors),
+                                             'rmse': rmse, 'mae': mae}))
+
+                B, beta = _fit_batch(X, Y, O)
+                models[variant].loc[names, buildings] = B
+                if beta is not None:
+                    models[variant].loc['occupancy', buildings] = beta
+
+    metrics = pd.concat(metrics, ignore_index=True).set_index(['building', 'variant']).sort_index()
+    return models, metrics
+
+def make_predictions_batch(coefficients, features, testing_period, occupancy=None):
+    """ Predict the power of all buildings with coefficients returned by train_models_batch.
+    Parameters
+    ----------
+    coefficients    : pd.DataFrame
+        One variant of the models returned by train_models_batch.
+    features    : pd.DataFrame
+        Shared regressors, same columns as for training.
+    testing_period  : str
+        Testing period.
+    occupancy   : pd.DataFrame
+        Occupancy of every building, required by the 'with_occupancy' coefficients.
+    Returns
+    -------
+    pd.DataFrame
+        Predicted power, one column per building.
+    """
+    features = features.loc[testing_period].interpolate()
+    X = _design_matrix(features[coefficients.index[1:].drop('occupancy', errors='ignore')])
+    B = coefficients.drop(index='occupancy', errors='ignore').to_numpy(dtype=float)
+    beta, O = None, None
+    if 'occupancy' in coefficients.index:
+        beta = coefficients.loc['occupancy'].to_numpy(dtype=float)
+        O = occupancy.loc[features.index, coefficients.columns].interpolate().to_numpy(dtype=float)
+    return pd.DataFrame(_predict_batch(X, B, beta, O), index=features.index, columns=coefficients.columns)
+
+def save_models(models, filename):
+    """ Save the coefficients returned by train_models_batch (e.g. for the Online_Forecaster). """
+    pd.to_pickle(models, filename)
+
+def load_models(filename):
+    """ Load coefficients saved with save_models. """
+    return pd.read_pickle(filename)
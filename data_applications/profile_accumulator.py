@@ -0,0 +1,248 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Default histogram bin edges (lower edges, the last bin is open-ended): one bin per device up to 15 (access points)
+# or 60 (buildings), then bins growing by ~20% (access points) or ~5% (buildings)
+AP_BIN_EDGES = [*range(16), 20, 24, 30, 36, 44, 54, 66, 80, 100, 120, 150, 180, 220, 270, 330]
+BUILDING_BIN_EDGES = [*range(61)] + [int(edge) for edge in np.unique(np.round(np.geomspace(64, 20000, 120)))]
+LEVELS = {'ap': 'ap_name', 'building': 'building'}
+MAX_BIN_COUNT = np.iinfo(np.uint16).max
+# Rows allocated at least in the memory-mapped histogram files, which then double when full
+MIN_CAPACITY = 64
+
+
+class Profile_Accumulator(object):
+    """
+    This class keeps incremental weekday x hour occupancy profiles per access point and per building as fixed-bin
+    histograms of the device count, so median/IQR profiles can be served without rescanning the raw data.
+    Histograms of two accumulators with the same bins can be merged by adding them.
+    An accumulator opened on a directory (see open) keeps its histograms in memory-mapped .npy files that every update
+    modifies in place, so a poll never rewrites the whole state.
+    """
+
+    def __init__(self, timezone='US/Pacific', ap_bin_edges=None, building_bin_edges=None):
+        self.timezone = timezone
+        self.bin_edges = {'ap': np.asarray(ap_bin_edges if ap_bin_edges is not None else AP_BIN_EDGES),
+                          'building': np.asarray(building_bin_edges if building_bin_edges is not None
+                                                 else BUILDING_BIN_EDGES)}
+        self.names = {level: [] for level in LEVELS}
+        self.rows = {level: {} for level in LEVELS}
+        self.histograms = {level: np.zeros((0, 7, 24, len(self.bin_edges[level])), dtype=np.uint16)
+                           for level in LEVELS}
+        self.directory = None
+        self.storage = {}
+
+    def _get_path(self, level, kind):
+        return os.path.join(self.directory, '%s_%s' % (level, kind))
+
+    def _grow(self, level, n_rows):
+        """ reallocates the memory-mapped histogram file of the level with room for at least n_rows rows """
+        storage = self.storage[level]
+        capacity = max(n_rows, 2 * len(storage), MIN_CAPACITY)
+        filename = self._get_path(level, 'histograms.npy')
+        grown = np.lib.format.open_memmap(filename + '.tmp', mode='w+', dtype=np.uint16,
+                                          shape=(capacity,) + storage.shape[1:])
+        grown[:len(storage)] = storage
+        grown.flush()
+        del grown
+        os.replace(filename + '.tmp', filename)
+        self.storage[level] = np.load(filename, mmap_mode='r+')
+
+    def _get_rows(self, level, names):
+        """ row of each name in the level's histograms, adding rows for new names """
+        names = pd.Index(names)
+        new = [name for name in names.unique() if name not in self.rows[level]]
+        if new:
+            for name in new:
+                self.rows[level][name] = len(self.names[level])
+                self.names[level].append(name)
+            n_rows = len(self.names[level])
+            if self.directory is None:
+                shape = (len(new),) + self.histograms[level].shape[1:]
+                self.histograms[level] = np.concatenate([self.histograms[level], np.zeros(shape, dtype=np.uint16)])
+            else:
+                with open(self._get_path(level, 'names.txt'), 'a') as fp:
+                    fp.write(''.join('%s\n' % name for name in new))
+                if n_rows > len(self.storage[level]):
+                    self._grow(level, n_rows)
+                self.histograms[level] = self.storage[level][:n_rows]
+        return names.map(self.rows[level]).to_numpy(dtype=np.int64)
+
+    def _add(self, level, names, times, counts):
+        rows = self._get_rows(level, names)
+        bins = np.searchsorted(self.bin_edges[level], np.asarray(counts, dtype=float), side='right') - 1
+        valid = bins >= 0
+        cells = (rows[valid], times.weekday[valid], times.hour[valid], bins[valid])
+
+        n_bins = self.histograms[level].shape[-1]
+        histograms = self.histograms[level].reshape(-1)
+        cells, added = np.unique(np.ravel_multi_index(cells, self.histograms[level].shape), return_counts=True)
+        updated = histograms[cells].astype(np.int64) + added
+        overflow = updated > MAX_BIN_COUNT
+        if overflow.any():
+            # halve only the (row, weekday, hour) histograms that would overflow, the other cells keep their exact
+            # counts. In a halved histogram the older polls weigh half of the new ones and every bin loses at most
+            # half a sample of rounding (odd counts), against more than MAX_BIN_COUNT samples in the histogram
+            histograms.reshape(-1, n_bins)[np.unique(cells[overflow] // n_bins)] >>= 1
+            updated = histograms[cells].astype(np.int64) + added
+        histograms[cells] = np.minimum(updated, MAX_BIN_COUNT)
+
+    def update(self, df, time_column='time', ap_name_column='ap_name', building_column='building',
+               count_column='count'):
+        """
+        adds the rows of one or more polls (as written by get_wifi_data: time, ap_name, building, count) to the
+        access point histograms, and their per building totals to the building histograms
+        """
+        if df.empty:
+            return
+        times = pd.DatetimeIndex(df[time_column])
+        if times.tz is None:
+            times = times.tz_localize('UTC')
+        times = times.tz_convert(self.timezone)
+        self._add('ap', df[ap_name_column], times, df[count_column])
+
+        if building_column in df.columns:
+            totals = df.groupby([df[time_column], df[building_column]], sort=False)[count_column].sum().reset_index()
+            totals_times = pd.DatetimeIndex(totals[time_column])
+            if totals_times.tz is None:
+                totals_times = totals_times.tz_localize('UTC')
+            self._add('building', totals[building_column], totals_times.tz_convert(self.timezone),
+                      totals[count_column])
+
+    def merge(self, other):
+        """ adds the histograms of another accumulator with the same bins to this one """
+        for level in LEVELS:
+            if not np.array_equal(self.bin_edges[level], other.bin_edges[level]):
+                raise ValueError("cannot merge profiles with different %s bin edges" % level)
+            rows = self._get_rows(level, other.names[level])
+            merged = self.histograms[level][rows].astype(np.uint32) + other.histograms[level]
+            # halve only the merged (row, weekday, hour) histograms that would overflow, as _add does
+            overflow = (merged > MAX_BIN_COUNT).any(axis=-1)
+            merged[overflow] >>= 1
+            self.histograms[level][rows] = np.minimum(merged, MAX_BIN_COUNT).astype(np.uint16)
+
+    def _quantiles(self, histograms, bin_edges, quantiles):
+        """
+        quantiles of histograms (..., bins), interpolated over the integer counts of the bin that contains them
+        """
+        cumulative = histograms.cumsum(axis=-1, dtype=np.int64)
+        totals = cumulative[..., -1]
+        lower = bin_edges
+        upper = np.append(bin_edges[1:], bin_edges[-1] + 1)
+        results = []
+        for q in quantiles:
+            target = q * totals
+            index = (cumulative < target[..., None]).sum(axis=-1).clip(max=len(bin_edges) - 1)
+            below = np.where(index > 0, np.take_along_axis(cumulative, (index - 1).clip(min=0)[..., None],
+                                                           axis=-1)[..., 0], 0)
+            in_bin = np.take_along_axis(histograms, index[..., None], axis=-1)[..., 0].astype(float)
+            fraction = np.divide(target - below, in_bin, out=np.zeros(target.shape), where=in_bin > 0)
+            value = lower[index] + fraction.clip(0, 1) * (upper[index] - 1 - lower[index])
+            results.append(np.where(totals > 0, value, np.nan))
+        return results, totals
+
+    def profiles(self, level='building', quantiles=(0.25, 0.5, 0.75)):
+        """
+        returns the weekday x hour profile of every access point ('ap') or building ('building') as one long
+        DataFrame: name, weekday (0=Monday), hour, the requested quantiles (labelled like describe(), e.g. 50%) and
+        count, the number of samples in the cell
+        """
+        histograms = self.histograms[level]
+        values, totals = self._quantiles(histograms, self.bin_edges[level], quantiles)
+        n = len(self.names[level])
+        index = pd.MultiIndex.from_product([self.names[level], range(7), range(24)],
+                                           names=[LEVELS[level], 'weekday', 'hour'])
+        data = {'%g%%' % (100 * q): value.reshape(n * 7 * 24) for q, value in zip(quantiles, values)}
+        data['count'] = totals.reshape(n * 7 * 24)
+        return pd.DataFrame(data, index=index)
+
+    def profile(self, name, level='building', quantiles=(0.25, 0.5, 0.75)):
+        """ returns the weekday x hour profile of a single access point or building """
+        row = self.rows[level][name]
+        values, totals = self._quantiles(self.histograms[level][row], self.bin_edges[level], quantiles)
+        index = pd.MultiIndex.from_product([range(7), range(24)], names=['weekday', 'hour'])
+        data = {'%g%%' % (100 * q): value.reshape(7 * 24) for q, value in zip(quantiles, values)}
+        data['count'] = totals.reshape(7 * 24)
+        return pd.DataFrame(data, index=index)
+
+    def save(self, filename):
+        """ persists the accumulator to a .npz file (written to a temporary file first, then renamed) """
+        arrays = {'timezone': np.array(self.timezone)}
+        for level in LEVELS:
+            arrays['%s_names' % level] = np.array(self.names[level], dtype=str)
+            arrays['%s_bin_edges' % level] = self.bin_edges[level]
+            arrays['%s_histograms' % level] = self.histograms[level]
+        with open(filename + '.tmp', 'wb') as fp:
+            np.savez_compressed(fp, **arrays)
+        os.replace(filename + '.tmp', filename)
+
+    def save_directory(self, directory):
+        """
+        persists the accumulator to directory in the layout of open: per level a names text file (one name per line)
+        and a .npy histogram file with spare zero rows, then the settings.json (timezone and bin edges)
+        """
+        os.makedirs(directory, exist_ok=True)
+        for level in LEVELS:
+            histograms = self.histograms[level]
+            capacity = max(len(histograms), MIN_CAPACITY)
+            padded = np.zeros((capacity,) + histograms.shape[1:], dtype=np.uint16)
+            padded[:len(histograms)] = histograms
+            filename = os.path.join(directory, '%s_histograms.npy' % level)
+            with open(filename + '.tmp', 'wb') as fp:
+                np.save(fp, padded)
+            os.replace(filename + '.tmp', filename)
+            with open(os.path.join(directory, '%s_names.txt' % level), 'w') as fp:
+                fp.write(''.join('%s\n' % name for name in self.names[level]))
+        settings = {'timezone': self.timezone,
+                    'bin_edges': {level: self.bin_edges[level].tolist() for level in LEVELS}}
+        with open(os.path.join(directory, 'settings.json'), 'w') as fp:
+            json.dump(settings, fp)
+
+    @classmethod
+    def open(cls, directory, timezone='US/Pacific'):
+        """
+        opens the accumulator persisted in directory (see save_directory), creating an empty one if the directory has
+        none. Its histograms are memory-mapped: update writes the touched cells in place and appends the new names,
+        nothing has to be saved afterwards (flush forces the histograms to disk)
+        """
+        settings_filename = os.path.join(directory, 'settings.json')
+        if not os.path.exists(settings_filename):
+            cls(timezone=timezone).save_directory(directory)
+        with open(settings_filename) as fp:
+            settings = json.load(fp)
+        accumulator = cls(timezone=settings['timezone'], ap_bin_edges=settings['bin_edges']['ap'],
+                          building_bin_edges=settings['bin_edges']['building'])
+        accumulator.directory = directory
+        for level in LEVELS:
+            with open(accumulator._get_path(level, 'names.txt')) as fp:
+                accumulator.names[level] = fp.read().splitlines()
+            accumulator.rows[level] = {name: row for row, name in enumerate(accumulator.names[level])}
+            accumulator.storage[level] = np.load(accumulator._get_path(level, 'histograms.npy'), mmap_mode='r+')
+            n_rows = len(accumulator.names[level])
+            if n_rows > len(accumulator.storage[level]):
+                # names appended by an update that stopped before growing the histograms
+                accumulator._grow(level, n_rows)
+            accumulator.histograms[level] = accumulator.storage[level][:n_rows]
+        return accumulator
+
+    def flush(self):
+        """ writes the modified memory-mapped histograms to disk (no-op for an accumulator held in memory) """
+        for storage in self.storage.values():
+            storage.flush()
+
+    @classmethod
+    def load(cls, filename, timezone='US/Pacific'):
+        """ loads an accumulator saved with save, or returns a new one if filename does not exist """
+        if not os.path.exists(filename):
+            return cls(timezone=timezone)
+        with np.load(filename) as arrays:
+            accumulator = cls(timezone=str(arrays['timezone']), ap_bin_edges=arrays['ap_bin_edges'],
+                              building_bin_edges=arrays['building_bin_edges'])
+            for level in LEVELS:
+                accumulator.names[level] = arrays['%s_names' % level].tolist()
+                accumulator.rows[level] = {name: row for row, name in enumerate(accumulator.names[level])}
+                accumulator.histograms[level] = arrays['%s_histograms' % level]
+        return accumulator
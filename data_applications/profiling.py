@@ -1,14 +1,11 @@
 import pandas as pd
 import numpy as np
-import datetime
-import matplotlib.pyplot as plt
-import matplotlib
-import seaborn
-import logging
 import warnings
 import scipy.stats as st
-import statsmodels as sm
-import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+# Distributions checked by fit_distributions (same list as best_fit_distribution)
+DISTRIBUTION_NAMES = ['weibull_min', 'weibull_max', 'lognorm', 'norm', 'gamma', 'johnsonsu', 'burr']
 
 
 # Create models from data
@@ -77,6 +74,75 @@ def best_fit_distribution(data, bins=200, ax=None):
 
     return (best_distribution.name, best_params)
 
+def _fit_distribution(task):
+    """ fits one distribution to one site's data, called by fit_distributions (possibly in a worker process)"""
+    site, dist_name, data, bins, subsample, random_state = task
+
+    # Histogram of the full sample, the fit itself may only use a subsample
+    y, x = np.histogram(data, bins=bins, density=True)
+    x = (x + np.roll(x, -1))[:-1] / 2.0
+    if subsample is not None and len(data) > subsample:
+        data = np.random.default_rng(random_state).choice(data, size=subsample, replace=False)
+
+    distribution = getattr(st, dist_name)
+    try:
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore')
+            params = distribution.fit(data)
+            pdf = distribution.pdf(x, *params[:-2], loc=params[-2], scale=params[-1])
+            sse = np.sum(np.power(y - pdf, 2.0))
+    except Exception:
+        params, sse = None, np.inf
+
+    return {'site': site, 'distribution': dist_name, 'params': params, 'sse': sse}
+
+
+def fit_distributions(df, distributions=None, bins=200, subsample=None, max_workers=None, random_state=0):
+    """ Fits every distribution to every column (site) of df, fanning the (site x distribution) fits out over a
+    process pool
+
+    Parameters
+    ----------
+    df : DataFrame or Series
+        one column of data per site, e.g. the night hours device count of each building
+    distributions : list of str
+        scipy.stats distribution names, DISTRIBUTION_NAMES by default
+    bins : int
+        number of histogram bins the fitted pdfs are compared against
+    subsample : int
+        if set, the MLE fit uses a random subsample of at most this many points per site (the SSE is still
+        computed against the histogram of all the data)
+    max_workers : int
+        number of worker processes, 1 fits serially in this process
+    random_state : int
+        seed of the subsample
+
+    Returns
+    -------
+    DataFrame with one row per (site, distribution): site, distribution, params, sse and best, which flags the
+    distribution with the lowest positive SSE of each site (as best_fit_distribution picks it)
+    """
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    distributions = distributions if distributions is not None else DISTRIBUTION_NAMES
+
+    tasks = []
+    for site in df.columns:
+        data = df[site].to_numpy(dtype=float)
+        data = data[np.isfinite(data)]
+        tasks += [(site, dist_name, data, bins, subsample, random_state) for dist_name in distributions]
+
+    if max_workers == 1:
+        results = [_fit_distribution(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_fit_distribution, tasks))
+
+    results = pd.DataFrame(results, columns=['site', 'distribution', 'params', 'sse'])
+    candidates = results.loc[results['sse'] > 0].sort_values('sse', kind='stable')
+    results['best'] = results.index.isin(candidates.drop_duplicates(subset='site').index)
+    return results
+
 def make_pdf(dist, params, size=10000):
     """Generate distributions's Probability Distribution Function (called in find_dist)"""
 
@@ -101,7 +167,28 @@ def make_pdf(dist, params, size=10000):
 
 
 
-def find_dist(data,site,plots=True):
+def fit_best_distribution(data, bins=200):
+    """Finds the best fitting distribution of data and the statistics of that distribution, without plotting
+
+    Parameters
+    ----------
+    data : Series
+        data from the specifc site during "night" hours (12am-4am), and the specified period
+    bins : int
+        number of histogram bins the fitted pdfs are compared against
+
+    Returns
+    -------
+    dict with the best distribution name, its params, median, interval (middle 50%) and pdf (Series)
+    """
+    data = data[np.isfinite(data)]
+    best_fit_name, best_fit_params = best_fit_distribution(data, bins)
+    pdf, median, interval = make_pdf(getattr(st, best_fit_name), best_fit_params)
+    return {'distribution': best_fit_name, 'params': best_fit_params, 'median': median, 'interval': interval,
+            'pdf': pdf}
+
+
+def find_dist(data, site, plots=True):
     """Fits a list of distirbutions to the provided data and identifies the best distribution
     and then records statistics from this distribution
 
@@ -112,96 +199,68 @@ def find_dist(data,site,plots=True):
     site : string
         building name
     plots : True or False
-        If True plots are generated
+        If True plots are generated (matplotlib is only imported in that case)
 
     Returns
     -------
-    Updates prob_dist_stats and prob_dist_details dictionary
+    dict with the site, best distribution name, params, median and interval
 
     """
-    data=data[np.isfinite(data)]
+    data = data[np.isfinite(data)]
 
-    if plots==True:
-        plt.figure(figsize=(12,5))
-        ax = data.plot(kind='hist', bins=50, density=True, alpha=0.5)#, color=plt.rcParams['axes.color_cycle'][1])
-        # Save plot limits
-        dataYLim = ax.get_ylim()
-
-        # Find best fit distribution
-        best_fit_name, best_fit_params = best_fit_distribution(data, 200, ax)
-        best_dist = getattr(st, best_fit_name)
-
-        # Update plots
-        ax.set_ylim(dataYLim)
-        ax.set_title(u'Device Count Data \n All Fitted Distributions for '+' '+site)
-        ax.set_xlabel(u'Device Count')
-        ax.set_ylabel('Frequency')
+    if plots:
+        from data_applications.plotting import plot_fitted_distributions, plot_best_distribution
+        best_fit_name, best_fit_params = plot_fitted_distributions(data, site)
+        pdf, median, interval = make_pdf(getattr(st, best_fit_name), best_fit_params)
+        plot_best_distribution(data, site, best_fit_name, best_fit_params, pdf)
+    else:
+        best_fit = fit_best_distribution(data, 200)
+        best_fit_name, best_fit_params = best_fit['distribution'], best_fit['params']
+        median, interval = best_fit['median'], best_fit['interval']
 
-        # Make PDF with best params
-        pdf, median,interval = make_pdf(best_dist, best_fit_params)
+    return {'site': site, 'distribution': best_fit_name, 'params': best_fit_params, 'median': median,
+            'interval': interval}
 
-        # Display
-        plt.figure(figsize=(12,5))
-        ax = pdf.plot(lw=2, label='PDF', legend=True)
-        data.plot(kind='hist', bins=50, density=True, alpha=0.5, label='Data', legend=True, ax=ax)
 
-        param_names = (best_dist.shapes + ', loc, scale').split(', ') if best_dist.shapes else ['loc', 'scale']
-        param_str = ', '.join(['{}={:0.2f}'.format(k,v) for k,v in zip(param_names, best_fit_params)])
-        dist_str = '{}({})'.format(best_fit_name, param_str)
+def hourly_profile_stats(df, column=None):
+    """provides the hourly distribution profile of device count, without plotting
 
+    Parameters
+    ----------
+    df : Device Count DataFrame
+        DF at the building level
+    column : string
+        column to describe, all columns if None
 
-        #prob_dist_details[site]=[best_fit_name, best_fit_params]
-        #prob_dist_stats[site]=[median, interval]
+    Returns
+    -------
+    Dataframe where each row is a average profile description of the device count
+    """
+    if column is not None:
+        df = df[[column]]
+    return df.groupby([df.index.hour]).describe()
 
-        ax.set_title(u'Device Count Data with best fit distribution \n for '+site+' '+ dist_str)
-        ax.set_xlabel(u'Device Count')
-        ax.set_ylabel('Frequency')
 
-    else:
-        ax = data.plot(kind='hist', bins=50, density=True, alpha=0.5)#, color=plt.rcParams['axes.color_cycle'][1])
-        best_fit_name, best_fit_params = best_fit_distribution(data, 200, ax)
-        best_dist = getattr(st, best_fit_name)
-        print("best_fit_params",best_fit_params)
-        pdf,median,interval = make_pdf(best_dist, best_fit_params)
-        prob_dist_details[site]=[best_fit_name, best_fit_params]
-        prob_dist_stats[site]=[median, interval]
-        plt.close()
-
-    #return pdf, median,interval
-
-def hourly_profile(df):
+def hourly_profile(df, column='Building Device Count', plots=True):
     """provides the hourly distribution profile of device count 
 
     Parameters
     ----------
     df : Device Count DataFrame
         DF at the building level
+    column : string
+        column whose quartiles are plotted
+    plots : True or False
+        If True the profile is plotted (matplotlib is only imported in that case)
         
     Returns
     -------
     Dataframe where each row is a average profile description of the device count
     """
-    occ_desc = df.groupby([df.index.hour]).describe()
-    
-    hour_day = list(occ_desc.index)
-    hour_median = list(occ_desc[('Building Device Count',   '50%')])
-    hour_25 = list(occ_desc[('Building Device Count',   '25%')])
-    hour_75 = list(occ_desc[('Building Device Count',   '75%')])
-    
-    # plot initalizing
-    font = {'size'   : 12}
-    plt.rc('font', **font)
-    
-    fig, ax = plt.subplots(figsize=(12,10))
-    plt.grid(axis = 'y', linestyle = '--', linewidth = 0.5)
-    ax.bar(hour_day, hour_median, bottom=hour_25, label='Q1-Median') 
-    ax.bar(hour_day, hour_75, bottom=hour_median, label='Median-Q3')
-
-    ax.set_ylabel('Device Count')
-    ax.set_xlabel('Hour of Day')
-    ax.set_title('Distribution of Device Count by Hour')
-    ax.set_xticks(hour_day)
-    ax.legend()
-    plt.show()
-    
-    return occ_desc
\ No newline at end of file
+    occ_desc = hourly_profile_stats(df)
+
+    if plots:
+        from data_applications.plotting import plot_hourly_profile
+        plot_hourly_profile(occ_desc, column)
+
+    return occ_desc
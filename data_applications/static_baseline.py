@@ -1,19 +1,10 @@
 import pandas as pd
 import numpy as np
-import datetime
-import matplotlib.pyplot as plt
-import matplotlib
-import seaborn
-import logging
-import warnings
-import scipy.stats as st
-import statsmodels as sm
-import statistics
-
-
-def remove_static(df, unocc_st = '01:00:00', unocc_et = '04:00:00', quartile='75%'):
-                  
-    """Calculates the static devices during specified periods and removes the devices from the dataframe
+
+
+def compute_static_removal(df, unocc_st='01:00:00', unocc_et='04:00:00', quartile='75%'):
+    """Calculates the static devices during specified periods and removes the devices from the dataframe, without
+    plotting
 
     Parameters
     ----------
@@ -23,38 +14,130 @@ def remove_static(df, unocc_st = '01:00:00', unocc_et = '04:00:00', quartile='75
         Set to 1:00 am as standard
     unocc_et : unoccupied end time string input
         Set to 4:00 am as standard
-    ** Note: this is a time range in which you believe there would most likely not be people within the builing
     quartile : string input
         quartile level of how much you would like to be removed as the baseline, ( '25%', '50%', '75%')
-        
+
     Returns
     -------
-    Dataframe where the static baseline is removed from all the device counts for each building
+    Dataframe where the static baseline is removed, and the number of static devices removed
     """
-    # plot initalizing
-    font = {'size'   : 12}
-    plt.rc('font', **font)
-    
     # filtering df for unoccupied time range
     night_occ = df.between_time(unocc_st, unocc_et)
     # Retriving stats for unoccupied times
     removed_devices = night_occ.iloc[:,0].describe()[quartile]
-    
+
     no_static_df = df - removed_devices
-    
+
     no_static_df[no_static_df<0]=0
-    
-    kwargs = dict(alpha=0.5, bins=100)
-    
-    plt.figure(figsize=(10, 10), dpi=80)
-    
-    plt.xlim(xmax = df.iloc[:,0].describe()['75%'])
-    
-    plt.hist(df.iloc[:,0].values.tolist(), **kwargs, label='With Static Devices')
-    plt.hist(no_static_df.iloc[:,0].values.tolist(), **kwargs, label='Without Static Devices')
-    #plt.hist(df.iloc[:,0].values.tolist(), **kwargs, label='With Static Devices')
-    plt.gca().set(title='Static Removal Shift', xlabel='Device Count', ylabel='Device Count Frequency')
-    plt.legend()
-    
-    
-    return no_static_df
\ No newline at end of file
+
+    return no_static_df, removed_devices
+
+
+def remove_static(df, unocc_st = '01:00:00', unocc_et = '04:00:00', quartile='75%', plots=True):
+                  
+    """Calculates the static devices during specified periods and removes the devices from the dataframe
+
+    Parameters
+    ----------
+    df : DataFrame
+        DF at the building level
+    unocc_st : unoccupied start time string input
+        Set to 1:00 am as standard
+    unocc_et : unoccupied end time string input
+        Set to 4:00 am as standard
+    ** Note: this is a time range in which you believe there would most likely not be people within the builing
+    quartile : string input
+        quartile level of how much you would like to be removed as the baseline, ( '25%', '50%', '75%')
+    plots : True or False
+        If True the shift of the distribution is plotted (matplotlib is only imported in that case)
+        
+    Returns
+    -------
+    Dataframe where the static baseline is removed from all the device counts for each building
+    """
+    no_static_df, removed_devices = compute_static_removal(df, unocc_st=unocc_st, unocc_et=unocc_et,
+                                                           quartile=quartile)
+
+    if plots:
+        from data_applications.plotting import plot_static_removal
+        plot_static_removal(df, no_static_df)
+
+    return no_static_df
+
+
+def _to_quantile(quartile):
+    """converts a quartile given as '75%' (describe() label) or 0.75 to a quantile"""
+    if isinstance(quartile, str):
+        return float(quartile.rstrip('%')) / 100
+    return float(quartile)
+
+
+def static_baseline_wide(df, unocc_st='01:00:00', unocc_et='04:00:00', quartile='75%', freq=None, window=None):
+    """Calculates the static devices of every column (building) of df at once, from its unoccupied period quantile
+
+    Parameters
+    ----------
+    df : DataFrame
+        DF with one device count column per building
+    unocc_st : unoccupied start time string input
+        Set to 1:00 am as standard
+    unocc_et : unoccupied end time string input
+        Set to 4:00 am as standard
+    quartile : string or float input
+        quantile of the unoccupied period removed as the baseline, ('25%', '50%', '75%' or 0.25, ...)
+    freq : string input
+        if set, one baseline per calendar period (e.g. 'W' or 'D') from that period's unoccupied hours
+    window : string input
+        if set, a rolling baseline over the unoccupied hours of the last window (e.g. '14D'), carried forward
+        through the occupied hours
+
+    Returns
+    -------
+    Series with one baseline per building (freq and window not set) or DataFrame aligned with df, NaN where df has no
+    unoccupied hours to take the baseline from
+    """
+    q = _to_quantile(quartile)
+
+    if freq is not None and window is not None:
+        raise ValueError("freq and window cannot be used together")
+
+    if window is not None:
+        night_occ = df.between_time(unocc_st, unocc_et).sort_index(kind='stable')
+        if night_occ.empty:
+            # no unoccupied hours to take the baseline from, as the NaN quantiles without window
+            return pd.DataFrame(np.nan, index=df.index, columns=df.columns)
+        baseline = night_occ.rolling(window).quantile(q)
+        # each row gets the latest baseline at or before its time (the first one before the first unoccupied period)
+        position = night_occ.index.searchsorted(df.index, side='right') - 1
+        return pd.DataFrame(baseline.to_numpy()[position.clip(min=0)], index=df.index, columns=df.columns)
+
+    if freq is not None:
+        night = pd.Series(False, index=df.index)
+        night.iloc[df.index.indexer_between_time(unocc_st, unocc_et)] = True
+        periods = df.where(night, axis=0).groupby(pd.Grouper(freq=freq))
+        baseline = periods.quantile(q)
+        # periods without unoccupied hours use the previous period's baseline
+        baseline = baseline.ffill().bfill()
+        return pd.DataFrame(baseline.to_numpy()[periods.ngroup().to_numpy()], index=df.index, columns=df.columns)
+
+    return df.between_time(unocc_st, unocc_et).quantile(q)
+
+
+def remove_static_wide(df, unocc_st='01:00:00', unocc_et='04:00:00', quartile='75%', freq=None, window=None):
+    """Removes the static devices from every column (building) of df at once, vectorized over the buildings
+
+    Parameters
+    ----------
+    see static_baseline_wide
+
+    Returns
+    -------
+    Dataframe where the static baseline of each building is removed from its device counts (clipped at 0)
+    """
+    baseline = static_baseline_wide(df, unocc_st=unocc_st, unocc_et=unocc_et, quartile=quartile, freq=freq,
+                                    window=window)
+    if isinstance(baseline, pd.Series):
+        no_static_df = df.sub(baseline, axis=1)
+    else:
+        no_static_df = df - baseline
+    return no_static_df.clip(lower=0)
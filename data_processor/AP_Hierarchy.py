@@ -0,0 +1,146 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Aggregation levels below the access point, finest first; a group is identified by its path from the campus down
+LEVELS = ['floor', 'building', 'campus']
+# building = second dash separated part of the ap name (e.g. AP-BLDG90-1F-12), as the former str.split('-')[1]
+DEFAULT_PATTERN = r'^[^-]*-(?P<building>[^-]*)'
+TOTAL_COLUMNS = ['level', 'campus', 'building', 'floor', 'count']
+
+
+class AP_Hierarchy(object):
+    """
+    This class resolves every access point once to integer codes of its floor, building and campus, from a hierarchy
+    table (columns ap_name, building and optionally floor and campus) or, for the access points the table does not
+    list, from the named groups floor and building of a regular expression on the ap name. The per floor, building and
+    campus totals of a poll are then summed in a single bincount over the codes, without any groupby.
+    Floors are grouped per building and buildings per campus, an access point without building only counts in its
+    campus total.
+    """
+
+    def __init__(self, hierarchy=None, pattern=DEFAULT_PATTERN, campus='campus'):
+        self.pattern = re.compile(pattern)
+        self.campus = campus
+        self.table = {}
+        if hierarchy is not None:
+            if 'ap_name' not in hierarchy.columns or 'building' not in hierarchy.columns:
+                raise Exception("the ap hierarchy needs the columns ap_name and building, got %s" % list(
+                    hierarchy.columns))
+            hierarchy = hierarchy.drop_duplicates(subset='ap_name', keep='last')
+            columns = [hierarchy[column] if column in hierarchy.columns else pd.Series(None, index=hierarchy.index)
+                       for column in ('floor', 'building', 'campus')]
+            self.table = {name: tuple(None if pd.isna(value) else str(value) for value in path)
+                          for name, *path in zip(hierarchy['ap_name'].astype(str), *columns)}
+
+        self.ap_names = []
+        self.index = pd.Index([], dtype=object)
+        self.buildings = np.empty(0, dtype=object)
+        self.groups = {level: {} for level in LEVELS}
+        self.codes = {level: np.empty(0, dtype=np.int32) for level in LEVELS}
+        self._groups_columns = None
+        # ap names and positions of the last resolve, and group layout of the last totals positions
+        self._resolved = None
+        self._layout = None
+
+    def _get_path(self, ap_name):
+        """ floor, building and campus of an access point, None where unknown """
+        if ap_name in self.table:
+            floor, building, campus = self.table[ap_name]
+        else:
+            match = self.pattern.match(ap_name)
+            groups = match.groupdict() if match else {}
+            floor, building, campus = groups.get('floor'), groups.get('building'), groups.get('campus')
+        campus = campus if campus is not None else self.campus
+        if building is None:
+            return None, None, campus
+        return floor, building, campus
+
+    def _add(self, ap_names):
+        codes = {level: [] for level in LEVELS}
+        buildings = []
+        for ap_name in ap_names:
+            floor, building, campus = self._get_path(ap_name)
+            keys = {'floor': (campus, building, floor) if floor is not None else None,
+                    'building': (campus, building) if building is not None else None,
+                    'campus': (campus,)}
+            for level in LEVELS:
+                key = keys[level]
+                codes[level].append(-1 if key is None else self.groups[level].setdefault(key, len(self.groups[level])))
+            buildings.append(building)
+            self.ap_names.append(ap_name)
+
+        for level in LEVELS:
+            self.codes[level] = np.concatenate([self.codes[level], np.asarray(codes[level], dtype=np.int32)])
+        self.buildings = np.concatenate([self.buildings, np.asarray(buildings, dtype=object)])
+        self.index = pd.Index(self.ap_names, dtype=object)
+        self._groups_columns = None
+        self._resolved = None
+        self._layout = None
+
+    def resolve(self, ap_names):
+        """
+        returns the position of every ap name in the resolved access points (the index of self.codes), resolving the
+        access points seen for the first time. The positions of the last call are returned as is when the ap names
+        are the same
+        """
+        values = np.asarray(ap_names, dtype=object)
+        if self._resolved is not None and np.array_equal(self._resolved[0], values):
+            return self._resolved[1]
+        ap_names = pd.Index(values, dtype=object).astype(str)
+        positions = self.index.get_indexer(ap_names)
+        new = positions < 0
+        if new.any():
+            self._add(ap_names[new].unique())
+            positions = self.index.get_indexer(ap_names)
+        self._resolved = (values, positions)
+        return positions
+
+    def get_buildings(self, positions):
+        return self.buildings[positions]
+
+    def _get_groups_columns(self):
+        """ level, campus, building and floor arrays of every group of every level, in the order of the offsets """
+        if self._groups_columns is None:
+            keys = [(level, key) for level in LEVELS for key in self.groups[level]]
+            self._groups_columns = {
+                'level': np.array([level for level, _ in keys], dtype=object),
+                'campus': np.array([key[0] for _, key in keys], dtype=object),
+                'building': np.array([key[1] if len(key) > 1 else None for _, key in keys], dtype=object),
+                'floor': np.array([key[2] if len(key) > 2 else None for _, key in keys], dtype=object)}
+        return self._groups_columns
+
+    def _get_layout(self, positions):
+        """
+        group codes of the access points at positions, offset into one group space and renumbered over the groups
+        present in the poll, the index of the count of each code and the frame of the present groups; kept for the
+        positions of the last call
+        """
+        if self._layout is not None and np.array_equal(self._layout[0], positions):
+            return self._layout[1:]
+        codes, count_index = [], []
+        offset = 0
+        for level in LEVELS:
+            level_codes = self.codes[level][positions]
+            known = np.flatnonzero(level_codes >= 0)
+            codes.append(level_codes[known] + offset)
+            count_index.append(known)
+            offset += len(self.groups[level])
+        codes = np.concatenate(codes)
+        present = np.unique(codes)
+        groups = pd.DataFrame({name: values[present] for name, values in self._get_groups_columns().items()},
+                              columns=TOTAL_COLUMNS[:-1])
+        self._layout = (np.array(positions), np.searchsorted(present, codes), np.concatenate(count_index), groups)
+        return self._layout[1:]
+
+    def totals(self, positions, counts):
+        """
+        returns the floor, building and campus totals (columns level, campus, building, floor and count) of the counts
+        of the access points at positions (see resolve); the codes of all levels are offset into one group space
+        and summed with one bincount. Groups without any access point in the poll are left out
+        """
+        codes, count_index, groups = self._get_layout(positions)
+        counts = np.asarray(counts, dtype=float)
+        sums = np.bincount(codes, weights=counts[count_index], minlength=len(groups))
+        return groups.assign(count=sums.astype(np.int64))
@@ -0,0 +1,126 @@
+from data_processor.Cisco_Processor import Cisco_Processor, pd
+import numpy as np
+import re
+
+# bsnApIfNoOfUsers: associated clients of an access point radio, indexed by the ap mac address (6 arcs) and the slot
+AP_COUNTER_OID = ".1.3.6.1.4.1.14179.2.2.2.1.15"
+HEX_MAC_PATTERN = re.compile(r'^[0-9a-f]{1,2}([:-])[0-9a-f]{1,2}(\1[0-9a-f]{1,2}){4}$')
+CISCO_MAC_PATTERN = re.compile(r'^[0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4}$')
+PLAIN_MAC_PATTERN = re.compile(r'^[0-9a-f]{12}$')
+DECIMAL_MAC_PATTERN = re.compile(r'^\.?\d+(\.\d+){5,}$')
+MAC_ARC_WEIGHTS = 256 ** np.arange(5, -1, -1, dtype=np.int64)
+
+
+def mac_to_int(mac):
+    """
+    returns the 48 bit integer of an ap mac address written as 00:1a:2b:3c:4d:5e, 00-1A-2B-3C-4D-5E, 001a.2b3c.4d5e,
+    001a2b3c4d5e or as the last 6 decimal arcs of an oid (e.g. a client table key of the ap mac address map), or None
+    """
+    mac = str(mac).strip().lower()
+    if HEX_MAC_PATTERN.match(mac):
+        return int("".join(part.zfill(2) for part in re.split('[:-]', mac)), 16)
+    if CISCO_MAC_PATTERN.match(mac):
+        return int(mac.replace('.', ''), 16)
+    if PLAIN_MAC_PATTERN.match(mac):
+        return int(mac, 16)
+    if DECIMAL_MAC_PATTERN.match(mac):
+        arcs = [int(arc) for arc in mac.strip('.').split('.')[-6:]]
+        if max(arcs) <= 255:
+            return int(np.dot(arcs, MAC_ARC_WEIGHTS))
+    return None
+
+
+def int_to_mac(mac):
+    return ":".join("%02x" % ((int(mac) >> shift) & 0xff) for shift in range(40, -8, -8))
+
+
+class Cisco_AP_Counter_Processor(Cisco_Processor):
+    """
+    This class parses a walk of the per radio associated client counters of the controller (AP_COUNTER_OID, set as
+    the snmp count_oid) instead of the per client table: one row per access point radio instead of one per device.
+    The radios are summed per access point. The ap mac address map is the one of Cisco_Processor, its keys are
+    normalized to the ap mac address whatever their format. Unlike the client table, access points without clients
+    are reported with a count of 0.
+    """
+
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="data_processor", context=None):
+        super().__init__(project_path, config_file, section, context)
+
+    def _get_ap_index_path(self):
+        return self.project_path + "/" + self.data_folder + "/." + self.ap_mac_address_filename + ".mac-idx.pkl"
+
+    def _build_ap_index(self):
+        """
+        index from the ap mac address (as a 48 bit integer) to the position of the ap name in the sorted self.ap_names
+        """
+        macs = np.array([mac_to_int(mac) for mac in self.mapping['ap_mac_address']], dtype=object)
+        invalid = pd.isna(macs)
+        if invalid.any():
+            ignored = self.mapping['ap_mac_address'][invalid].astype(str)
+            self.logger.warning("%d entries of %s are not ap mac addresses and are ignored: %s" % (
+                invalid.sum(), self.ap_mac_address_filename,
+                ", ".join(ignored.iloc[:self.max_logged_unknown_ap_mac_addresses])))
+        mapping = pd.DataFrame({'ap_mac_address': macs[~invalid].astype(np.int64),
+                                'id': self.mapping['id'].to_numpy()[~invalid]})
+        mapping = mapping.drop_duplicates(subset='ap_mac_address')
+        codes, self.ap_names = pd.factorize(mapping['id'], sort=True)
+        self.ap_index = pd.Index(mapping['ap_mac_address'])
+        self.ap_codes = codes.astype(np.int32)
+
+    def _get_radio_counters(self, df, column_name='output'):
+        """
+        the ap mac address (as a 48 bit integer) and the client count of every radio row; rows whose oid is not
+        count_oid.mac.slot get -1 as ap mac address
+        """
+        if column_name not in df.columns and 'oid_suffix' in df.columns:
+            oids, values = df['oid_suffix'], df['value']
+        else:
+            # snmpwalk lines carry the full oid, keep the part after count_oid
+            prefix = '.' + str(self.oid).strip('.') + '.'
+            lines = [line.split(None, 1) for line in df[column_name]]
+            oids = [line[0][len(prefix):] if line[0].startswith(prefix) else '' for line in lines]
+            values = [line[1] if len(line) > 1 else None for line in lines]
+
+        arcs = [oid.split('.') for oid in oids]
+        valid = np.array([len(arc) == 7 and all(part.isdigit() for part in arc) for arc in arcs], dtype=bool)
+        macs = np.full(len(arcs), -1, dtype=np.int64)
+        if valid.any():
+            radios = np.array([arc for arc, ok in zip(arcs, valid) if ok], dtype=np.int64)
+            macs[valid] = radios[:, :6] @ MAC_ARC_WEIGHTS
+        counts = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+        return macs, counts
+
+    def get_unknown_ap_mac_addresses(self, df, column_name='output'):
+        """
+        returns the number of radio rows per ap mac address that is missing from the ap mac address map
+        """
+        macs, counts = self._get_radio_counters(df, column_name=column_name)
+        macs = macs[(macs >= 0) & ~np.isnan(counts)]
+        macs = macs[self.ap_index.get_indexer(macs) < 0]
+        return pd.Series([int_to_mac(mac) for mac in macs], dtype=object).value_counts()
+
+    def parse(self, df, column_name='output'):
+        """
+        sums the client counters of the radios of every known access point
+        """
+        self.reload_ap_mac_address()
+        macs, counts = self._get_radio_counters(df, column_name=column_name)
+        invalid = (macs < 0) | np.isnan(counts)
+        if invalid.any():
+            self.logger.warning("%d of %d rows are not ap radio client counters (count_oid=%s) and are dropped" % (
+                invalid.sum(), len(macs), AP_COUNTER_OID))
+            macs, counts = macs[~invalid], counts[~invalid]
+
+        positions = self.ap_index.get_indexer(macs)
+        known = positions >= 0
+        if not known.all():
+            unknown = pd.Series([int_to_mac(mac) for mac in macs[~known]], dtype=object).value_counts()
+            self._log_unknown_ap_mac_addresses(unknown)
+        codes = self.ap_codes[positions[known]]
+        totals = np.bincount(codes, weights=counts[known], minlength=len(self.ap_names))
+        present = np.flatnonzero(np.bincount(codes, minlength=len(self.ap_names)))
+        parsed = pd.DataFrame({'ap_name': self.ap_names.take(present), 'count': totals[present].astype(np.int64)})
+
+        if 'time' in df.columns and not df.empty:
+            parsed['time'] = df['time'].iloc[0]
+        return parsed
@@ -1,16 +1,28 @@
 from data_processor.Data_Processor import Data_Processor, pd
+from data_processor.AP_Hierarchy import AP_Hierarchy, DEFAULT_PATTERN, TOTAL_COLUMNS
+import numpy as np
 import os
+import pickle
 
 
 class Cisco_Processor(Data_Processor):
-    def __init__(self, project_path=".", config_file="count_config.yaml", section="data_processor"):
-        super.__init__(project_path, config_file, section)
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="data_processor", context=None):
+        super().__init__(project_path, config_file, section, context)
 
         try:
             cfg = self.config[self.data_processor_section]
             self.ap_mac_address_filename = cfg.get('access_point_mac_address_filename', 'ap_mac_address.csv')
             self.oid = cfg.get('count_oid')
+            self.parse_method = cfg.get('parse_method', 'vectorized')
+            if self.parse_method not in ('vectorized', 'merge'):
+                raise Exception("unknown parse_method=%s, expected vectorized or merge" % self.parse_method)
             self.data_folder = 'data'
+            self.max_logged_unknown_ap_mac_addresses = cfg.get('max_logged_unknown_ap_mac_addresses', 20)
+            self.unknown_ap_mac_addresses = set()
+            self.hierarchy_filename = cfg.get('hierarchy_filename')
+            self.hierarchy_pattern = cfg.get('hierarchy_pattern', DEFAULT_PATTERN)
+            self.campus = cfg.get('campus', 'campus')
+            self.totals = pd.DataFrame(columns=TOTAL_COLUMNS)
 
         except Exception as e:
             self.logger.error(
@@ -19,20 +31,157 @@ class Cisco_Processor(Data_Processor):
             raise e
 
         self._get_ap_mac_address()
+        self._get_hierarchy()
+
+    def _get_ap_mac_address_path(self):
+        return self.project_path + "/" + self.data_folder + "/" + self.ap_mac_address_filename
+
+    def _get_ap_index_path(self):
+        return self.project_path + "/" + self.data_folder + "/." + self.ap_mac_address_filename + ".idx.pkl"
+
+    @staticmethod
+    def _get_file_signature(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
 
     def _get_ap_mac_address(self):
-        if not os.path.exists(self.project_path + "/" + self.data_folder + "/" + self.ap_mac_address_filename):
+        """
+        loads the ap mac address index from its binary sidecar when the csv is unchanged, otherwise rebuilds it from
+        the csv and rewrites the sidecar
+        """
+        if not os.path.exists(self._get_ap_mac_address_path()):
             self.logger.error("cannot find mac address to ap_name map filename=%s" % self.ap_mac_address_filename)
             raise Exception("cannot find mac address to ap_name map filename=%s" % self.ap_mac_address_filename)
 
+        self.ap_mac_address_signature = self._get_file_signature(self._get_ap_mac_address_path())
+        if not self._load_ap_index():
+            self._read_ap_mac_address()
+            self._build_ap_index()
+            self._save_ap_index()
+
+        self.mapping = pd.DataFrame({'ap_mac_address': self.ap_index, 'id': self.ap_names.take(self.ap_codes)})
+
+    def _get_hierarchy(self):
+        """
+        resolves the floor, building and campus codes of every access point of the map, from the hierarchy csv if
+        hierarchy_filename is set and from hierarchy_pattern otherwise
+        """
+        hierarchy = None
+        self.hierarchy_signature = None
+        if self.hierarchy_filename:
+            path = self.project_path + "/" + self.data_folder + "/" + self.hierarchy_filename
+            try:
+                self.hierarchy_signature = self._get_file_signature(path)
+                hierarchy = pd.read_csv(path, dtype=str)
+            except Exception as e:
+                self.logger.error("cannot read access point hierarchy file=%s, error=%s" % (self.hierarchy_filename,
+                                                                                          str(e)))
+                raise Exception("cannot read access point hierarchy file=%s" % self.hierarchy_filename)
+        self.hierarchy = AP_Hierarchy(hierarchy, pattern=self.hierarchy_pattern, campus=self.campus)
+        self.hierarchy.resolve(self.ap_names)
+        self.logger.info("resolved the hierarchy of %d access points" % len(self.ap_names))
+
+    def _read_ap_mac_address(self):
         try:
-            self.mapping = pd.read_csv(self.project_path + "/" + self.data_folder + "/" + self.ap_mac_address_filename)
-            self.mapping.columns = ['ap_mac_address', 'id']
+            mapping = pd.read_csv(self._get_ap_mac_address_path())
+            mapping.columns = ['ap_mac_address', 'id']
+            self.mapping = mapping
             self.logger.info("successfully retrieved access point mac addresses")
         except Exception as e:
             self.logger.error("cannot read access point mac address file=%s" % self.ap_mac_address_filename)
             raise Exception("cannot read access point mac address file=%s" % self.ap_mac_address_filename)
 
+    def _build_ap_index(self):
+        """
+        hash index from the ap mac address oid prefix to the position of the ap name in the sorted self.ap_names
+        """
+        mapping = self.mapping.drop_duplicates(subset='ap_mac_address')
+        codes, self.ap_names = pd.factorize(mapping['id'], sort=True)
+        self.ap_index = pd.Index(mapping['ap_mac_address'])
+        self.ap_codes = codes.astype(np.int32)
+
+    def _load_ap_index(self):
+        if not os.path.exists(self._get_ap_index_path()):
+            return False
+        try:
+            with open(self._get_ap_index_path(), "rb") as fp:
+                ap_index = pickle.load(fp)
+        except Exception as e:
+            self.logger.warning("cannot read access point index file=%s, rebuilding it, error=%s" % (
+                self._get_ap_index_path(), str(e)))
+            return False
+
+        if ap_index.get('signature') != self.ap_mac_address_signature:
+            return False
+        self.ap_index = pd.Index(ap_index['ap_mac_address'])
+        self.ap_names = pd.Index(ap_index['ap_names'])
+        self.ap_codes = ap_index['ap_codes']
+        self.logger.info("successfully loaded access point index for file=%s" % self.ap_mac_address_filename)
+        return True
+
+    def _save_ap_index(self):
+        ap_index = {'signature': self.ap_mac_address_signature,
+                    'ap_mac_address': self.ap_index.to_numpy(dtype=object),
+                    'ap_names': self.ap_names.to_numpy(dtype=object),
+                    'ap_codes': self.ap_codes}
+        try:
+            with open(self._get_ap_index_path() + ".tmp", "wb") as fp:
+                pickle.dump(ap_index, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self._get_ap_index_path() + ".tmp", self._get_ap_index_path())
+            self.logger.info("saved access point index for file=%s" % self.ap_mac_address_filename)
+        except Exception as e:
+            self.logger.warning("cannot write access point index file=%s, error=%s" % (self._get_ap_index_path(),
+                                                                                     str(e)))
+
+    def reload_ap_mac_address(self):
+        """
+        reloads the ap mac address map if the csv changed since it was loaded; called on every parse so that a long
+        running collector picks up new access points
+        """
+        try:
+            signature = self._get_file_signature(self._get_ap_mac_address_path())
+        except OSError as e:
+            self.logger.error("cannot stat mac address to ap_name map filename=%s, keeping the loaded map, error=%s" % (
+                self.ap_mac_address_filename, str(e)))
+            return False
+
+        hierarchy_changed = False
+        if self.hierarchy_filename:
+            try:
+                hierarchy_changed = self._get_file_signature(self.project_path + "/" + self.data_folder + "/" +
+                                                             self.hierarchy_filename) != self.hierarchy_signature
+            except OSError as e:
+                self.logger.error("cannot stat access point hierarchy file=%s, keeping the loaded hierarchy, "
+                                  "error=%s" % (self.hierarchy_filename, str(e)))
+        if hierarchy_changed:
+            self._get_hierarchy()
+            self.logger.info("reloaded changed access point hierarchy file=%s" % self.hierarchy_filename)
+
+        if signature == self.ap_mac_address_signature:
+            return hierarchy_changed
+        self._get_ap_mac_address()
+        self.hierarchy.resolve(self.ap_names)
+        self.unknown_ap_mac_addresses = set()
+        self.logger.info("reloaded changed mac address to ap_name map filename=%s" % self.ap_mac_address_filename)
+        return True
+
+    def get_unknown_ap_mac_addresses(self, df, column_name='output'):
+        """
+        returns the number of rows per ap mac address oid prefix that is missing from the ap mac address map
+        """
+        prefixes = pd.Series(self._get_ap_oid_prefixes(df, column_name=column_name), dtype=object)
+        return prefixes[self.ap_index.get_indexer(prefixes) < 0].value_counts()
+
+    def _log_unknown_ap_mac_addresses(self, unknown):
+        new = [mac for mac in unknown.index if mac not in self.unknown_ap_mac_addresses]
+        if new:
+            self.unknown_ap_mac_addresses.update(new)
+            shown = new[:self.max_logged_unknown_ap_mac_addresses]
+            self.logger.warning("%d access point mac addresses are not in %s and their rows are dropped: %s%s" % (
+                len(new), self.ap_mac_address_filename,
+                ", ".join("%s (%d rows)" % (mac, unknown[mac]) for mac in shown),
+                "" if len(new) == len(shown) else ", ..."))
+
     def _aggregate(self, df, group_by_col='id', agg_fn='count'):
         df = df.groupby(group_by_col).agg(agg_fn)
         df = df[[df.columns[0]]]
@@ -42,16 +191,70 @@ class Cisco_Processor(Data_Processor):
         return df
 
     def parse(self, df, column_name='output'):
-        df['ap_mac_address'] = df[column_name].str.split('\s+', expand=True)[0].str.rsplit('.', n=3, expand=True)[0]
+        self.reload_ap_mac_address()
+        if self.parse_method == 'vectorized':
+            parsed = self._parse_vectorized(df, column_name=column_name)
+        else:
+            self._log_unknown_ap_mac_addresses(self.get_unknown_ap_mac_addresses(df, column_name=column_name))
+            parsed = self._parse_merge(df, column_name=column_name)
+
+        if 'time' in df.columns and not df.empty:
+            parsed['time'] = df['time'].iloc[0]
+        return parsed
+
+    def _get_ap_oid_prefixes(self, df, column_name='output'):
+        """
+        the access point part of each oid: the first token of the snmpwalk line without its last three arcs
+        """
+        if column_name not in df.columns and 'oid_suffix' in df.columns:
+            oid = '.' + str(self.oid).strip('.') + '.'
+            return [oid + suffix.rsplit('.', 3)[0] for suffix in df['oid_suffix']]
+        return [line.split(None, 1)[0].rsplit('.', 3)[0] for line in df[column_name]]
+
+    def _parse_vectorized(self, df, column_name='output'):
+        """
+        a single scan extracts the ap oid prefix, the prebuilt index maps it to an ap and bincount counts per ap
+        """
+        prefixes = pd.Series(self._get_ap_oid_prefixes(df, column_name=column_name), dtype=object)
+        positions = self.ap_index.get_indexer(prefixes)
+        known = positions >= 0
+        if not known.all():
+            self._log_unknown_ap_mac_addresses(prefixes[~known].value_counts())
+        codes = self.ap_codes[positions[known]]
+        counts = np.bincount(codes, minlength=len(self.ap_names))
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({'ap_name': self.ap_names.take(present), 'count': counts[present]})
+
+    def _parse_merge(self, df, column_name='output'):
+        if column_name not in df.columns and 'oid_suffix' in df.columns:
+            # rows from the native snmp backend carry the oid relative to count_oid
+            oid = '.' + str(self.oid).strip('.') + '.'
+            df['ap_mac_address'] = oid + df['oid_suffix'].str.rsplit('.', n=3, expand=True)[0]
+        else:
+            df['ap_mac_address'] = df[column_name].str.split('\s+', expand=True)[0].str.rsplit('.', n=3, expand=True)[0]
         df = df.merge(self.mapping, left_on='ap_mac_address', right_on='ap_mac_address', how='inner')
-        df = df[['output', 'ap_mac_address', 'id']]
+        df = df[['ap_mac_address', 'id']]
         df = self._aggregate(df, group_by_col='id', agg_fn='count')
         return df
 
     def process(self, df, ap_name_column='ap_name'):
-        df['building'] = df[ap_name_column].str.split('-', expand=True)[1]
+        """
+        sets the building of every access point from the resolved hierarchy and computes the floor, building and
+        campus totals of the poll (see get_totals)
+        """
+        positions = self.hierarchy.resolve(df[ap_name_column])
+        df['building'] = self.hierarchy.get_buildings(positions)
+        self.totals = self.hierarchy.totals(positions, df['count'])
+        if 'time' in df.columns and not df.empty:
+            self.totals['time'] = df['time'].iloc[0]
         return df
 
+    def get_totals(self):
+        """
+        returns the floor, building and campus totals of the last processed poll
+        """
+        return self.totals
+
     def filter(self, df):
         return df
 
@@ -0,0 +1,99 @@
+import socket
+import threading
+from bisect import bisect_right
+
+from data_source.SNMP_Bulk_Walker import _decode_message, _encode_message, _encode_tlv, _encode_integer, \
+    END_OF_MIB_VIEW, GET_BULK_REQUEST, GET_NEXT_REQUEST, GET_RESPONSE, OCTET_STRING
+
+
+class Fake_SNMP_Agent(object):
+    """
+    This class is a local SNMPv2c agent answering GetNext/GetBulk requests from an in-memory table.
+    It is meant for testing the Wifi_Gatherer native backend without a WLAN controller, e.g. replaying a recorded
+    snmpwalk -Onaq output with from_snmpwalk_file.
+    """
+
+    def __init__(self, table, community="public", host="127.0.0.1", port=0, max_datagram_size=60000):
+        self.community = community.encode('utf-8')
+        self.max_datagram_size = max_datagram_size
+        self.oids = sorted(table, key=lambda oid: tuple(int(arc) for arc in oid.strip('.').split('.')))
+        self.keys = [tuple(int(arc) for arc in oid.strip('.').split('.')) for oid in self.oids]
+        self.values = [self._encode_value(table[oid]) for oid in self.oids]
+        self.requests = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.host, self.port = self.sock.getsockname()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_snmpwalk_file(cls, filename, **kwargs):
+        table = {}
+        with open(filename, "r") as fp:
+            for line in fp:
+                parts = line.strip().split(None, 1)
+                if parts:
+                    table[parts[0]] = parts[1].strip('"') if len(parts) > 1 else ""
+        return cls(table, **kwargs)
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, int):
+            return _encode_integer(value)
+        return _encode_tlv(OCTET_STRING, str(value).encode('utf-8'))
+
+    def _next_index(self, oid):
+        return bisect_right(self.keys, tuple(int(arc) for arc in oid.strip('.').split('.')))
+
+    def _respond(self, data):
+        community, pdu_tag, request_id, field_2, field_3, varbinds = _decode_message(data)
+        if community != self.community or pdu_tag not in (GET_BULK_REQUEST, GET_NEXT_REQUEST) or not varbinds:
+            return None
+
+        oid = varbinds[0][0]
+        repetitions = field_3 if pdu_tag == GET_BULK_REQUEST else 1
+        start = self._next_index(oid)
+        indexes = range(start, min(start + max(repetitions, 1), len(self.oids)))
+
+        oids = [self.oids[i] for i in indexes]
+        values = [self.values[i] for i in indexes]
+        if not oids:
+            oids, values = [oid], [_encode_tlv(END_OF_MIB_VIEW, b'')]
+
+        response = _encode_message(community, GET_RESPONSE, request_id, oids, values=values)
+        while len(response) > self.max_datagram_size and len(oids) > 1:
+            oids, values = oids[:len(oids) // 2], values[:len(values) // 2]
+            response = _encode_message(community, GET_RESPONSE, request_id, oids, values=values)
+        return response
+
+    def _serve(self):
+        self.sock.settimeout(0.1)
+        while not self._stop.is_set():
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.requests += 1
+            response = self._respond(data)
+            if response is not None:
+                self.sock.sendto(response, address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
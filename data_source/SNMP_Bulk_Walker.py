@@ -0,0 +1,250 @@
+import socket
+import logging
+import time
+
+# minimal BER encoding/decoding of the SNMPv2c messages needed to walk a table with GetBulkRequest
+SEQUENCE = 0x30
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+IP_ADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIME_TICKS = 0x43
+OPAQUE = 0x44
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+GET_NEXT_REQUEST = 0xA1
+GET_RESPONSE = 0xA2
+GET_BULK_REQUEST = 0xA5
+
+SNMP_VERSION_2C = 1
+UNSIGNED_TYPES = (COUNTER32, GAUGE32, TIME_TICKS, COUNTER64)
+
+
+def _encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def _encode_tlv(tag, payload):
+    return bytes([tag]) + _encode_length(len(payload)) + payload
+
+
+def _encode_integer(value, tag=INTEGER):
+    n_bytes = ((value if value >= 0 else ~value).bit_length() + 8) // 8
+    return _encode_tlv(tag, value.to_bytes(n_bytes, 'big', signed=True))
+
+
+def _encode_base128(value):
+    encoded = [value & 0x7f]
+    value >>= 7
+    while value:
+        encoded.append(0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(reversed(encoded))
+
+
+def _encode_oid(oid):
+    arcs = [int(arc) for arc in oid.strip('.').split('.')]
+    payload = bytearray(_encode_base128(arcs[0] * 40 + arcs[1]))
+    for arc in arcs[2:]:
+        payload += _encode_base128(arc)
+    return _encode_tlv(OBJECT_IDENTIFIER, bytes(payload))
+
+
+def _read_tlv(data, pos):
+    """
+    returns the tag and the start/end offsets of the value of the TLV starting at pos
+    """
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        n_bytes = length & 0x7f
+        length = int.from_bytes(data[pos:pos + n_bytes], 'big')
+        pos += n_bytes
+    return tag, pos, pos + length
+
+
+def _decode_oid(data, start, end):
+    arcs = []
+    value = 0
+    for byte in data[start:end]:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            arcs.append(value)
+            value = 0
+    first = min(arcs[0] // 40, 2)
+    return '.'.join([str(first), str(arcs[0] - 40 * first)] + [str(arc) for arc in arcs[1:]])
+
+
+def _decode_value(tag, data, start, end):
+    if tag == INTEGER:
+        return int.from_bytes(data[start:end], 'big', signed=True)
+    if tag in UNSIGNED_TYPES:
+        return int.from_bytes(data[start:end], 'big')
+    if tag == OCTET_STRING or tag == OPAQUE:
+        raw = data[start:end]
+        try:
+            text = raw.decode('utf-8')
+            if text.isprintable():
+                return text
+        except UnicodeDecodeError:
+            pass
+        return raw.hex(' ').upper()
+    if tag == OBJECT_IDENTIFIER:
+        return '.' + _decode_oid(data, start, end)
+    if tag == IP_ADDRESS:
+        return '.'.join(str(byte) for byte in data[start:end])
+    return None
+
+
+def _encode_message(community, pdu_tag, request_id, oids, non_repeaters=0, max_repetitions=0, values=None,
+                    error_status=0, error_index=0):
+    """
+    encodes a SNMPv2c message, used for GetBulk/GetNext requests and (by the fake agent) for responses
+    """
+    varbinds = bytearray()
+    for i, oid in enumerate(oids):
+        value = _encode_tlv(NULL, b'') if values is None else values[i]
+        varbinds += _encode_tlv(SEQUENCE, _encode_oid(oid) + value)
+
+    if pdu_tag == GET_BULK_REQUEST:
+        header = _encode_integer(request_id) + _encode_integer(non_repeaters) + _encode_integer(max_repetitions)
+    else:
+        header = _encode_integer(request_id) + _encode_integer(error_status) + _encode_integer(error_index)
+    pdu = _encode_tlv(pdu_tag, header + _encode_tlv(SEQUENCE, bytes(varbinds)))
+    return _encode_tlv(SEQUENCE, _encode_integer(SNMP_VERSION_2C) + _encode_tlv(OCTET_STRING, community) + pdu)
+
+
+def _decode_message(data):
+    """
+    decodes a SNMPv2c message into (community, pdu_tag, request_id, field_2, field_3, varbinds)
+    field_2/field_3 are error-status/error-index for responses and non-repeaters/max-repetitions for GetBulk;
+    varbinds is a list of (oid, value_tag, value_start, value_end) over data
+    """
+    _, pos, _ = _read_tlv(data, 0)
+    _, start, pos = _read_tlv(data, pos)
+    _, start, pos = _read_tlv(data, pos)
+    community = bytes(data[start:pos])
+    pdu_tag, pos, pdu_end = _read_tlv(data, pos)
+
+    fields = []
+    for _ in range(3):
+        _, start, pos = _read_tlv(data, pos)
+        fields.append(int.from_bytes(data[start:pos], 'big', signed=True))
+
+    varbinds = []
+    _, pos, varbinds_end = _read_tlv(data, pos)
+    while pos < varbinds_end:
+        _, varbind_start, varbind_end = _read_tlv(data, pos)
+        _, oid_start, oid_end = _read_tlv(data, varbind_start)
+        value_tag, value_start, value_end = _read_tlv(data, oid_end)
+        varbinds.append((_decode_oid(data, oid_start, oid_end), value_tag, value_start, value_end))
+        pos = varbind_end
+
+    return community, pdu_tag, fields[0], fields[1], fields[2], varbinds
+
+
+class SNMP_Bulk_Walker(object):
+    """
+    This class walks a SNMP table in-process with SNMPv2c GetBulkRequests over a single reused UDP socket.
+    It is the "native" backend of the Wifi_Gatherer and avoids forking snmpwalk and re-parsing its text output.
+    """
+
+    def __init__(self, host, community, port=161, max_repetitions=50, timeout=5, retries=2, logger=None):
+        self.host = host
+        self.port = port
+        self.community = community.encode('utf-8')
+        self.max_repetitions = max_repetitions
+        self.timeout = timeout
+        self.retries = retries
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.sock = None
+        self.request_id = 0
+
+    def _get_socket(self):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.connect((self.host, self.port))
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _get_remaining_time(self, deadline):
+        remaining = self.timeout if deadline is None else min(self.timeout, deadline - time.monotonic())
+        if remaining <= 0:
+            raise Exception("SNMP walk of %s:%s did not finish before its deadline" % (self.host, self.port))
+        return remaining
+
+    def _get_bulk(self, oid, deadline=None):
+
+        """
+        this method sends one GetBulkRequest and returns the decoded response, retrying on timeouts; every attempt
+        waits timeout seconds at most, and never past the deadline (time.monotonic) of the walk
+        """
+        sock = self._get_socket()
+        for attempt in range(self.retries + 1):
+            self.request_id = (self.request_id + 1) & 0x7fffffff
+            request = _encode_message(self.community, GET_BULK_REQUEST, self.request_id, [oid],
+                                      max_repetitions=self.max_repetitions)
+            sock.settimeout(self._get_remaining_time(deadline))
+            sock.send(request)
+            try:
+                while True:
+                    data = sock.recv(65535)
+                    response = _decode_message(data)
+                    # drop late answers to requests that already timed out
+                    if response[1] == GET_RESPONSE and response[2] == self.request_id:
+                        return data, response
+                    sock.settimeout(self._get_remaining_time(deadline))
+            except socket.timeout:
+                self.logger.warning("no response from %s:%s to GetBulk of oid=%s, attempt %d of %d" % (
+                    self.host, self.port, oid, attempt + 1, self.retries + 1))
+        raise Exception("SNMP GetBulk to %s:%s timed out after %d attempts" % (self.host, self.port,
+                                                                              self.retries + 1))
+
+    def walk(self, oid, timeout=None):
+
+        """
+        this method walks the subtree under oid and returns two columns (lists): the oid suffixes relative to oid and
+        the decoded values; the whole walk is given up after timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        root = oid.strip('.')
+        prefix = root + '.'
+        prefix_length = len(prefix)
+        suffixes = []
+        values = []
+
+        next_oid = root
+        while True:
+            data, (_, _, _, error_status, error_index, varbinds) = self._get_bulk(next_oid, deadline)
+            if error_status != 0:
+                raise Exception("SNMP agent %s:%s returned error-status=%d error-index=%d" % (
+                    self.host, self.port, error_status, error_index))
+            if not varbinds:
+                break
+
+            for varbind_oid, tag, start, end in varbinds:
+                if tag == END_OF_MIB_VIEW or not varbind_oid.startswith(prefix):
+                    return suffixes, values
+                suffixes.append(varbind_oid[prefix_length:])
+                values.append(_decode_value(tag, data, start, end))
+
+            last_oid = varbinds[-1][0]
+            if last_oid == next_oid:
+                raise Exception("SNMP agent %s:%s returned a non-increasing oid=%s" % (self.host, self.port, last_oid))
+            next_oid = last_oid
+
+        return suffixes, values
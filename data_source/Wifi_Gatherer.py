@@ -2,9 +2,11 @@ import subprocess
 import pandas as pd
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import StringIO
-from logging.handlers import TimedRotatingFileHandler
-import yaml
+
+from common.Count_Context import Count_Context
+from data_source.SNMP_Bulk_Walker import SNMP_Bulk_Walker
 
 class Wifi_Gatherer(object):
     """
@@ -12,34 +14,17 @@ class Wifi_Gatherer(object):
     This also hashes the mac addresses (currently not used)
     """
 
-    def __init__(self, project_path=".", config_file="count_config.yaml", section="snmp_config"):
-
-        self.project_path = project_path
-        """
-        initialize logging
-        """
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
-        if not os.path.exists(self.project_path + "/" + 'logs'):
-            os.makedirs(self.project_path + "/" + 'logs')
-        handler = TimedRotatingFileHandler(self.project_path + "/" + "logs/wifi_gatherer.log", when='D', interval=1,
-                                           backupCount=5)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="snmp_config", context=None):
 
         """
-        read config file
+        initialize logging and read config file, once per process (see Count_Context)
         """
-        self.config_file = config_file
+        self.context = context if context is not None else Count_Context.get_context(project_path, config_file)
+        self.project_path = self.context.project_path
+        self.logger = self.context.get_logger(__name__, "wifi_gatherer.log")
+        self.config_file = self.context.config_file
         self.snmp_section = section
-        if not os.path.exists(self.project_path + "/" + self.config_file):
-            self.logger.error("cannot find config_file=%s" % self.config_file)
-            raise Exception("config file not found")
-
-        with open(self.project_path + "/" + self.config_file, "r") as fp:
-            self.config = yaml.safe_load(fp)
-        self.logger.info("successfully loaded config_file=%s" % self.config_file)
+        self.config = self.context.get_config(self.logger)
 
         try:
             snmp_cfg = self.config[self.snmp_section]
@@ -52,44 +37,169 @@ class Wifi_Gatherer(object):
 
             self.community = str(snmp_cfg.get("community"))
             self.controller_ip = str(snmp_cfg.get("controller_ip"))
-            self.oid = str(snmp_cfg.get("count_oid"))
-            if not self.oid.startswith('.'):
-                self.oid = '.'+self.oid
-            if self.oid.endswith('.'):
-                self.oid = self.oid[:-1]
+            self.oid = self._format_oid(snmp_cfg.get("count_oid"))
+            self.timeout = snmp_cfg.get("timeout", 120)
+            self.max_workers = snmp_cfg.get("max_workers", 8)
+            self.backend = snmp_cfg.get("backend", "snmpwalk")
+            if self.backend not in ("snmpwalk", "native"):
+                raise Exception("unknown snmp backend=%s, expected snmpwalk or native" % self.backend)
+            self.fallback_to_snmpwalk = snmp_cfg.get("fallback_to_snmpwalk", True)
+            self.max_repetitions = snmp_cfg.get("max_repetitions", 50)
+            self.port = snmp_cfg.get("port", 161)
+            self.retries = snmp_cfg.get("retries", 2)
+            self.request_timeout = snmp_cfg.get("request_timeout", 5)
+            self.controllers = self._get_controllers(snmp_cfg)
         except Exception as e:
             self.logger.error(
                 "unexpected error while setting configuration from config_file=%s, section=%s, error=%s" % (
                 self.config_file, self.snmp_section, str(e)))
             raise e
 
+    @staticmethod
+    def _format_oid(oid):
+        oid = str(oid)
+        if not oid.startswith('.'):
+            oid = '.' + oid
+        if oid.endswith('.'):
+            oid = oid[:-1]
+        return oid
+
+    def _get_controllers(self, snmp_cfg):
+
+        """
+        This method builds the list of controllers to query. Each entry of the optional "controllers" list can override
+        community, count_oid and timeout; without the list, the single controller_ip of the section is used
+        """
+        controllers_cfg = snmp_cfg.get("controllers")
+        if not controllers_cfg:
+            controllers_cfg = [{"controller_ip": self.controller_ip}]
+
+        controllers = []
+        for controller_cfg in controllers_cfg:
+            if isinstance(controller_cfg, str):
+                controller_cfg = {"controller_ip": controller_cfg}
+            if not controller_cfg.get("controller_ip"):
+                raise Exception("Missing configuration parameter: controller_ip")
+            controller_ip = str(controller_cfg["controller_ip"])
+            controllers.append({
+                "name": str(controller_cfg.get("name", controller_ip)),
+                "controller_ip": controller_ip,
+                "community": str(controller_cfg.get("community", self.community)),
+                "oid": self._format_oid(controller_cfg.get("count_oid", self.oid)),
+                "timeout": controller_cfg.get("timeout", self.timeout),
+                "port": controller_cfg.get("port", self.port),
+            })
+        return controllers
+
+    def _get_walker(self, controller):
+
+        """
+        This method returns the native SNMP walker of a controller; it is created once so its UDP socket is reused
+        across polls
+        """
+        if "walker" not in controller:
+            controller["walker"] = SNMP_Bulk_Walker(host=controller["controller_ip"], community=controller["community"],
+                                                    port=controller["port"], max_repetitions=self.max_repetitions,
+                                                    timeout=self.request_timeout, retries=self.retries,
+                                                    logger=self.logger)
+        return controller["walker"]
+
+    def _bulk_walk_controller(self, controller):
+
+        """
+        This method walks a single controller with the in-process GetBulk backend and returns the oid suffixes and
+        values as columns tagged with the controller name
+        """
+        try:
+            suffixes, values = self._get_walker(controller).walk(controller["oid"], timeout=controller["timeout"])
+        except Exception as e:
+            self.logger.error("native snmp walk of controller=%s failed, error=%s" % (controller["name"], str(e)))
+            if not self.fallback_to_snmpwalk:
+                raise
+            self.logger.warning("falling back to snmpwalk for controller=%s" % controller["name"])
+            return self._to_oid_columns(self._walk_controller(controller), controller["oid"])
+
+        df = pd.DataFrame({'oid_suffix': suffixes, 'value': values})
+        df['controller'] = controller["name"]
+        self.logger.info("successfully walked %d rows from controller=%s" % (len(df), controller["name"]))
+        return df
+
+    @staticmethod
+    def _to_oid_columns(df, oid):
+
+        """
+        This method splits snmpwalk -Onaq output lines into the oid_suffix/value columns of the native backend
+        """
+        columns = df['output'].str.split(n=1, expand=True).reindex(columns=[0, 1])
+        df['oid_suffix'] = columns[0].str[len(oid) + 1:]
+        df['value'] = columns[1]
+        return df[['oid_suffix', 'value', 'controller']]
+
+    def _walk_controller(self, controller):
+
+        """
+        This method runs snmpwalk against a single controller and returns its output tagged with the controller name
+        """
+        cmd = ['snmpwalk', '-v', '2c', '-c', controller["community"], '-Onaq', controller["controller_ip"],
+               controller["oid"]]
+        try:
+            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=controller["timeout"])
+        except subprocess.TimeoutExpired:
+            self.logger.error("snmpwalk to controller=%s timed out after %ss" % (controller["name"],
+                                                                                 controller["timeout"]))
+            raise
+        except Exception as e:
+            self.logger.error("unexpected error when running snmpwalk command on controller=%s, error=%s" % (
+                controller["name"], str(e)))
+            raise
+
+        if p.returncode != 0:
+            self.logger.error("snmpwalk on controller=%s exited with status %r: %r" % (controller["name"],
+                                                                                       p.returncode, p.stderr))
+            raise Exception('snmpwalk exited with status %r: %r' % (p.returncode, p.stderr))
+
+        output = p.stdout.decode('utf-8')
+        if output.strip():
+            df = pd.read_csv(StringIO(output), header=None, names=['output'])
+        else:
+            df = pd.DataFrame(columns=['output'])
+        df['controller'] = controller["name"]
+        self.logger.info("successfully imported %d rows from snmp output of controller=%s" % (len(df),
+                                                                                             controller["name"]))
+        return df
+
     def _get_data_SMNP(self):
 
         """
         This method calls SNMP through subprocess #inputs parms of the SNMP query from config file
+        (or in-process when backend is "native"). The controllers are walked concurrently, a controller that fails or
+        times out is logged and left out of the merged result
         """
 
         if not self.input_from_file:
-            cmd = ['snmpwalk', '-v', '2c', '-c', self.community, '-Onaq', self.controller_ip, self.oid]
-            try:
-                p = subprocess.Popen(cmd,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE)
-                out, err = p.communicate()
-
-            except Exception as e:
-                self.logger.error("unexpected error when running snmpwalk command, error=%s" % str(e))
-
-            if p.returncode != 0:
-                self.logger.error("snmpwalk exited with status %r: %r" % (p.returncode, err))
-                raise Exception('snmpwalk exited with status %r: %r' % (p.returncode, err))
-            else:
-                try:
-                    df = pd.read_csv(StringIO(out.decode('utf-8')), header=None, names=['output'])
-                    self.logger.info("successfully imported dataFrame from snmp output", )
-                    return df
-                except Exception as e:
-                    self.logger.error("unexpected error while reading from snmp output, error=%s" % (str(e)))
+            walk = self._bulk_walk_controller if self.backend == "native" else self._walk_controller
+            if len(self.controllers) == 1:
+                return walk(self.controllers[0])
+
+            frames = []
+            failed = []
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.controllers))) as executor:
+                futures = {executor.submit(walk, controller): controller["name"]
+                           for controller in self.controllers}
+                for future in as_completed(futures):
+                    try:
+                        frames.append(future.result())
+                    except Exception:
+                        failed.append(futures[future])
+
+            if not frames:
+                self.logger.error("snmpwalk failed on all controllers=%s" % failed)
+                raise Exception("snmpwalk failed on all controllers=%s" % failed)
+            if failed:
+                self.logger.warning("snmpwalk failed on controllers=%s, continuing with %d of %d controllers" % (
+                    failed, len(frames), len(self.controllers)))
+
+            return pd.concat(frames, ignore_index=True)
 
         else:
             self.logger.error("currently non implemented AP - SNMP query")
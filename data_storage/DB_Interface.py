@@ -1,42 +1,24 @@
 from abc import ABC, abstractmethod
-import logging
-from logging.handlers import TimedRotatingFileHandler
-import yaml
-import os
 import pandas as pd
 import datetime
 import pytz
 
+from common.Count_Context import Count_Context
+
 
 class DB_Interface(ABC):
-    def __init__(self, project_path=".", config_file="count_config", section="local_db"):
+    def __init__(self, project_path=".", config_file="count_config", section="local_db", context=None):
         super().__init__()
-        self.project_path = project_path
-        """
-        initialize logging
         """
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
-        if not os.path.exists(self.project_path + "/" + 'logs'):
-            os.makedirs(self.project_path + "/" + 'logs')
-        handler = TimedRotatingFileHandler(self.project_path + "/" + "logs/%s.log" % section, when='D', interval=1,
-                                           backupCount=5)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
+        initialize logging and read config file, once per process (see Count_Context)
+        one logger per section, so that every database logs to its own file only
         """
-        read config file
-        """
-        self.config_file = config_file
+        self.context = context if context is not None else Count_Context.get_context(project_path, config_file)
+        self.project_path = self.context.project_path
+        self.logger = self.context.get_logger("%s.%s" % (__name__, section), "%s.log" % section)
+        self.config_file = self.context.config_file
         self.database_section = section
-        if not os.path.exists(self.project_path + "/" + self.config_file):
-            self.logger.error("cannot find config_file=%s" % self.config_file)
-            raise Exception("config file not found")
-
-        with open(self.project_path + "/" + self.config_file, "r") as fp:
-            self.config = yaml.safe_load(fp)
-        self.logger.info("successfully loaded config_file=%s" % self.config_file)
+        self.config = self.context.get_config(self.logger)
 
     @abstractmethod
     def save_to_db(self, data: pd.DataFrame, *args) -> bool:
@@ -1,10 +1,18 @@
-from influxdb import DataFrameClient
+from influxdb import DataFrameClient, InfluxDBClient
 from data_storage.DB_Interface import DB_Interface, pd
+import numpy as np
+import requests
+import gzip
+import re
+import time
+
+AGGREGATIONS = ("mean", "median", "mode", "sum", "count", "min", "max", "first", "last", "spread", "stddev")
+GROUP_BY_TIME_PATTERN = re.compile(r"^\d+(ns|u|ms|s|m|h|d|w)$")
 
 
 class InfluxDB_Connector(DB_Interface):
-    def __init__(self, project_path=".", config_file="count_config.yaml", section="remote_db"):
-        super.__init__(project_path, config_file, section)
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="remote_db", context=None):
+        super().__init__(project_path, config_file, section, context)
 
         try:
             db_cfg = self.config[self.database_section]
@@ -16,6 +24,14 @@ class InfluxDB_Connector(DB_Interface):
             self.ssl = db_cfg.get("ssl", False)
             self.verify_ssl = db_cfg.get("verify_ssl", False)
             self.measurement = db_cfg.get("measurement", "wifi_count")
+            self.writer = db_cfg.get("writer", "dataframe")
+            if self.writer not in ("dataframe", "line_protocol"):
+                raise Exception("unknown influxDB writer={0}, expected dataframe or line_protocol".format(self.writer))
+            self.batch_size = db_cfg.get("batch_size", 5000)
+            self.gzip = db_cfg.get("gzip", True)
+            self.max_retries = db_cfg.get("max_retries", 5)
+            self.backoff = db_cfg.get("backoff", 0.5)
+            self.timeout = db_cfg.get("timeout", 10)
 
         except Exception as e:
             self.logger.error("unexpected error while setting configuration from config_file={0}, error={1}".format(
@@ -35,16 +51,35 @@ class InfluxDB_Connector(DB_Interface):
             self.client = DataFrameClient(host=self.host, port=self.port, username=self.username,
                                           password=self.password,
                                           database=self.database, ssl=self.ssl, verify_ssl=self.verify_ssl)
+            # chunked queries go through a plain client, DataFrameClient.query cannot read a chunked response
+            self.query_client = InfluxDBClient(host=self.host, port=self.port, username=self.username,
+                                               password=self.password, database=self.database, ssl=self.ssl,
+                                               verify_ssl=self.verify_ssl)
             self.logger.info("successfully created influxDB client to {0}".format(self.host))
         except Exception as e:
             self.logger.error("failed to create client to influxDB due to {0}".format(str(e)))
             raise e
 
+        """
+        the line protocol writer keeps one keep-alive http session for all its requests
+        """
+        self.session = None
+        if self.writer == "line_protocol":
+            self.session = requests.Session()
+            if self.username:
+                self.session.auth = (self.username, self.password)
+            self.session.verify = self.verify_ssl
+            host = self.host if self.host.startswith("http") else ("https://" if self.ssl else "http://") + self.host
+            self.write_url = "{0}:{1}/write".format(host.rstrip("/"), self.port)
+
     def close_connection(self):
         """
         this method closes the influxDB client
         """
         self.client.close()
+        self.query_client.close()
+        if self.session is not None:
+            self.session.close()
         self.logger.info("closed influxDB client")
 
     def save_to_db(self, data, tag_columns=None, field_columns=None):
@@ -66,6 +101,9 @@ class InfluxDB_Connector(DB_Interface):
             for col in field_columns:
                 tag_columns.remove(col)
 
+        if self.writer == "line_protocol":
+            return self._write_line_protocol(data, tag_columns=tag_columns, field_columns=field_columns)
+
         try:
             ret = self.client.write_points(dataframe=data, measurement=self.measurement, tag_columns=tag_columns,
                                            field_columns=field_columns)
@@ -81,33 +119,267 @@ class InfluxDB_Connector(DB_Interface):
 
         return ret
 
-    def read_from_db(self, start_time=None, end_time=None):
+    @staticmethod
+    def _escape(values, characters):
+        values = values.astype(str).str.replace("\\", "\\\\", regex=False)
+        for character in characters:
+            values = values.str.replace(character, "\\" + character, regex=False)
+        return values
+
+    @staticmethod
+    def _join(left, right):
+        separator = np.where((left != "") & (right != ""), ",", "")
+        return left + separator + right
+
+    def _format_field(self, name, values):
+
         """
-        this method queries data (between timestamps if specified) from the database
+        this method formats one field column as name=value, with an empty string where the value is missing
         """
+        key = self._escape(pd.Series([name]), ",= ").iloc[0] + "="
+        missing = values.isna().to_numpy()
+        if pd.api.types.is_bool_dtype(values.dtype):
+            formatted = key + values.map({True: "true", False: "false"}).astype(str)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            formatted = key + values.astype(str) + "i"
+        elif pd.api.types.is_float_dtype(values.dtype):
+            formatted = key + values.map(repr)
+        else:
+            formatted = key + '"' + self._escape(values, '"') + '"'
+        return pd.Series(np.where(missing, "", formatted.to_numpy(dtype=object)), index=values.index)
 
-        if start_time is not None:
-            start_time = DB_Interface.format_time(start_time).strftime("%Y-%m-%dT%H:%M:%SZ")
+    def _format_tag(self, name, values):
+
+        """
+        this method formats one tag column as ,name=value, with an empty string where the value is missing or empty
+        """
+        key = "," + self._escape(pd.Series([name]), ",= ").iloc[0] + "="
+        missing = (values.isna() | (values.astype(str) == "")).to_numpy()
+        formatted = key + self._escape(values, ",= ")
+        return pd.Series(np.where(missing, "", formatted.to_numpy(dtype=object)), index=values.index)
+
+    def to_line_protocol(self, data, tag_columns, field_columns):
+
+        """
+        this method serializes a time indexed dataframe to influxDB line protocol (one string per row, nanosecond
+        timestamps), building the strings column by column
+        """
+        data = data.reset_index(drop=True).assign(_time=data.index)
+        times = pd.DatetimeIndex(data["_time"])
+        if times.tz is None:
+            times = times.tz_localize("UTC")
+
+        lines = pd.Series(self._escape(pd.Series([self.measurement]), ", ").iloc[0], index=data.index)
+        for column in sorted(tag_columns):
+            lines = lines + self._format_tag(column, data[column])
+
+        fields = pd.Series("", index=data.index)
+        for column in field_columns:
+            fields = self._join(fields, self._format_field(column, data[column]))
+
+        lines = lines + " " + fields + " " + pd.Series(times.as_unit("ns").asi8, index=data.index).astype(str)
+        return lines[fields != ""]
+
+    def _post_lines(self, body):
+
+        """
+        this method posts one batch of line protocol, retrying with exponential backoff on timeouts, connection
+        errors and 5xx responses
+        """
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.gzip:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        params = {"db": self.database, "precision": "ns"}
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.write_url, params=params, data=body, headers=headers,
+                                             timeout=self.timeout)
+                if response.status_code < 300:
+                    return True
+                if response.status_code < 500:
+                    self.logger.error("influxDB rejected the write to measurement {0}, status={1}, error={2}".format(
+                        self.measurement, response.status_code, response.text))
+                    return False
+                error = "status={0}, error={1}".format(response.status_code, response.text)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+
+            if attempt < self.max_retries:
+                delay = self.backoff * 2 ** attempt
+                self.logger.warning("write to influxDB measurement {0} failed ({1}), retrying in {2}s".format(
+                    self.measurement, error, delay))
+                time.sleep(delay)
+            else:
+                self.logger.error("write to influxDB measurement {0} failed after {1} attempts, error={2}".format(
+                    self.measurement, self.max_retries + 1, error))
+        return False
+
+    def _write_line_protocol(self, data, tag_columns, field_columns):
+
+        """
+        this method writes the data as gzip compressed line protocol in batches of batch_size rows
+        """
+        try:
+            lines = self.to_line_protocol(data, tag_columns=tag_columns, field_columns=field_columns)
+        except Exception as e:
+            self.logger.error(
+                "Unexpected error while serializing data for influxDB {0}, error={1}".format(self.measurement, str(e)))
+            return False
+
+        for start in range(0, len(lines), self.batch_size):
+            body = "\n".join(lines.iloc[start:start + self.batch_size]).encode("utf-8")
+            if not self._post_lines(body):
+                return False
+
+        self.logger.info("{0} values successfully inserted into InfluxDB measurement {1}".format(
+            len(lines), self.measurement))
+        return True
+
+    @staticmethod
+    def _quote(identifier):
+        return '"' + str(identifier).replace('"', '\\"') + '"'
+
+    @staticmethod
+    def _format_query_time(ts):
+        ts = pd.Timestamp(DB_Interface.format_time(ts))
+        if ts.tzinfo is None:
+            ts = ts.tz_localize("UTC")
+        return ts.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def _build_query(self, start_time=None, end_time=None, end_inclusive=True, tags=None, fields=None,
+                     group_by_time=None, aggregation="mean", group_by_tags=None):
 
+        """
+        this method builds an InfluxQL select and its bind parameters; tag values and times are bound, identifiers
+        are quoted and the aggregation/interval are validated
+        """
+        if group_by_time is not None:
+            if aggregation not in AGGREGATIONS:
+                raise Exception("unknown aggregation={0}, expected one of {1}".format(aggregation, AGGREGATIONS))
+            if not GROUP_BY_TIME_PATTERN.match(str(group_by_time)):
+                raise Exception("invalid group_by_time={0}, expected e.g. 15m or 1h".format(group_by_time))
+            select = ", ".join("{0}({1}) AS {1}".format(aggregation, self._quote(field))
+                               for field in (fields or ["count"]))
+        else:
+            select = ", ".join(self._quote(field) for field in fields) if fields else "*"
+
+        conditions = []
+        bind_params = {}
+        if start_time is not None:
+            conditions.append("time >= $start_time")
+            bind_params["start_time"] = self._format_query_time(start_time)
         if end_time is not None:
-            end_time = DB_Interface.format_time(end_time).strftime("%Y-%m-%dT%H:%M:%SZ")
+            conditions.append("time <= $end_time" if end_inclusive else "time < $end_time")
+            bind_params["end_time"] = self._format_query_time(end_time)
+        for i, (tag, values) in enumerate(sorted((tags or {}).items())):
+            if isinstance(values, str) or not hasattr(values, "__iter__"):
+                values = [values]
+            alternatives = []
+            for j, value in enumerate(values):
+                bind_params["tag_{0}_{1}".format(i, j)] = str(value)
+                alternatives.append("{0} = $tag_{1}_{2}".format(self._quote(tag), i, j))
+            conditions.append("(" + " OR ".join(alternatives) + ")")
+
+        query = "SELECT {0} FROM {1}".format(select, self._quote(self.measurement))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
 
-        query = "select * from {0}".format(self.measurement)
+        group_by = ["time({0})".format(group_by_time)] if group_by_time is not None else []
+        group_by += [self._quote(tag) for tag in (group_by_tags or [])]
+        if group_by:
+            query += " GROUP BY " + ", ".join(group_by)
+        if group_by_time is not None:
+            query += " fill(none)"
+        return query, bind_params
 
+    def _query_frame(self, query, bind_params, chunk_size):
+
+        """
+        this method runs a select as a chunked query and builds one frame from the result sets of its chunks (one per
+        chunk_size points), indexed on the UTC time and with the group by tags as columns
+        """
+        result_sets = self.query_client.query(query, bind_params=bind_params, epoch="ns", chunked=True,
+                                              chunk_size=chunk_size)
+        frames = []
+        for result_set in result_sets:
+            for (_, tags), points in result_set.items():
+                frame = pd.DataFrame(list(points))
+                if tags:
+                    frame = frame.assign(**tags)
+                frames.append(frame)
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames, ignore_index=True)
+        data.index = pd.DatetimeIndex(pd.to_datetime(data.pop("time"), unit="ns", utc=True), name="time")
+        return data
+
+    def iter_query(self, start_time, end_time, tags=None, fields=None, group_by_time=None, aggregation="mean",
+                   group_by_tags=None, window="1D", chunk_size=10000):
+
+        """
+        this method queries the measurement between start_time and end_time one time window at a time and yields a
+        dataframe per window, so long ranges never have to be held in memory at once
+        Each window is streamed from influxDB in chunks of chunk_size points
+        tags: {tag: value or list of values} filter, e.g. {"building": ["B1", "B2"]}
+        fields: field names to select (default all fields and tags, or count when downsampling)
+        group_by_time: downsampling interval, e.g. "15m", aggregated with aggregation (mean, max, ...)
+        """
+        start_time = pd.Timestamp(DB_Interface.format_time(start_time))
+        end_time = pd.Timestamp(DB_Interface.format_time(end_time))
+        window = pd.Timedelta(window)
+
+        window_start = start_time
+        while window_start <= end_time:
+            window_end = min(window_start + window, end_time)
+            query, bind_params = self._build_query(window_start, window_end, end_inclusive=window_end == end_time,
+                                                   tags=tags, fields=fields, group_by_time=group_by_time,
+                                                   aggregation=aggregation, group_by_tags=group_by_tags)
+            try:
+                data = self._query_frame(query, bind_params, chunk_size)
+            except Exception as e:
+                self.logger.error("failed to retrieve data from influxDB measurement {0} error={1}".format(
+                    self.measurement, str(e)))
+                raise e
+
+            if not data.empty:
+                yield data
+            if window_end == end_time:
+                break
+            window_start = window_end
+
+    def query(self, start_time=None, end_time=None, tags=None, fields=None, group_by_time=None, aggregation="mean",
+              group_by_tags=None, window="1D", chunk_size=10000):
+
+        """
+        this method returns the result of iter_query as one dataframe; without start_time/end_time it runs a single
+        (chunked) query
+        """
         if start_time is not None and end_time is not None:
-            query += " and time >= '{0}' and time <= '{1}'".format(start_time, end_time)
-        elif start_time is not None:
-            query += " and time >= '{0}'".format(start_time)
-        elif end_time is not None:
-            query += " and time <= '{0}'".format(end_time)
+            frames = list(self.iter_query(start_time, end_time, tags=tags, fields=fields, group_by_time=group_by_time,
+                                          aggregation=aggregation, group_by_tags=group_by_tags, window=window,
+                                          chunk_size=chunk_size))
+            return pd.concat(frames) if frames else pd.DataFrame()
+
+        query, bind_params = self._build_query(start_time, end_time, tags=tags, fields=fields,
+                                               group_by_time=group_by_time, aggregation=aggregation,
+                                               group_by_tags=group_by_tags)
+        return self._query_frame(query, bind_params, chunk_size)
 
+    def read_from_db(self, start_time=None, end_time=None):
+        """
+        this method queries data (between timestamps if specified) from the database
+        """
         try:
-            data = self.influx_client.query(query)
+            data = self.query(start_time=start_time, end_time=end_time)
             self.logger.info("successfully read values from the influxDB measurement {0}".format(self.measurement))
+            return data
         except Exception as e:
             self.logger.error(
                 "failed to retrieve data to influxDB measurement {0} error={1}".format(self.measurement, str(e)))
-        return data.get(self.measurement, pd.DataFrame())
+            return pd.DataFrame()
 
     def clean_db(self):
         """
@@ -115,7 +387,7 @@ class InfluxDB_Connector(DB_Interface):
         """
         try:
             query = "drop measurement {0}".format(self.measurement)
-            self.influx_client.query(query)
+            self.client.query(query)
             self.logger.info("successfully dropped InfluxDB measurement {0}".format(self.measurement))
         except Exception as e:
             self.logger.error(
@@ -1,10 +1,15 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import SQLAlchemyError, DBAPIError
 import pytz
 
 from data_storage.DB_Interface import DB_Interface
 
+# Rollups maintained on save_to_db: level -> (column of the names, period)
+ROLLUP_LEVELS = {'ap_hour': ('ap_name', 'hour'), 'ap_day': ('ap_name', 'day'),
+                 'building_hour': ('building', 'hour'), 'building_day': ('building', 'day')}
+
 
 class SQLite_Connector(DB_Interface):
     """
@@ -12,13 +17,22 @@ class SQLite_Connector(DB_Interface):
     to another DB/API.
     """
 
-    def __init__(self, project_path=".", config_file="count_config.yaml", section="local_db"):
-        super.__init__(project_path, config_file, section)
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="local_db", context=None):
+        super().__init__(project_path, config_file, section, context)
 
         try:
             db_cfg = self.config[self.database_section]
             self.db = db_cfg.get("filename", "sqlite:///%s/wifi_buffer.db")
             self.table = db_cfg.get("table", "wifi_buffer_table")
+            self.fast_insert = db_cfg.get("fast_insert", False)
+            self.journal_mode = db_cfg.get("journal_mode", "WAL")
+            self.synchronous = db_cfg.get("synchronous", "NORMAL")
+            self.storage = db_cfg.get("storage", "rows")
+            if self.storage not in ("rows", "delta"):
+                raise Exception("unknown storage={0}, expected rows or delta".format(self.storage))
+            self.keyframe_interval = db_cfg.get("keyframe_interval", 144)
+            self.rollups = db_cfg.get("rollups", False)
+            self.rollup_timezone = db_cfg.get("rollup_timezone", "US/Pacific")
         except Exception as e:
             self.logger.error("unexpected error while setting configuration from config_file={0}, error={1}".format(
                 self.config_file, str(e)))
@@ -28,6 +42,9 @@ class SQLite_Connector(DB_Interface):
         create a sqlachemy engine (pool of connections) to connect to the db
         """
         self.engine = self._create_db_engine()
+        self.table_created = False
+        self.time_index_created = False
+        self._reset_delta_cache()
 
     def _create_db_engine(self):
 
@@ -37,6 +54,8 @@ class SQLite_Connector(DB_Interface):
 
         try:
             engine = create_engine(self.db % self.project_path, echo=False)
+            if self.fast_insert:
+                event.listen(engine, "connect", self._set_pragmas)
             self.logger.info("sql alchemy engine successfully created")
             return engine
 
@@ -44,6 +63,463 @@ class SQLite_Connector(DB_Interface):
             self.logger.error("cannot create sqlalchemy engine, error={0}".format(str(e)))
             raise e
 
+    def _set_pragmas(self, dbapi_connection, connection_record):
+
+        """
+        this method sets the journal mode and synchronous level of every new sqlite connection (fast_insert mode)
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode={0}".format(self.journal_mode))
+        cursor.execute("PRAGMA synchronous={0}".format(self.synchronous))
+        cursor.close()
+
+    @staticmethod
+    def _get_column_type(dtype):
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return "TIMESTAMP"
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            return "INTEGER"
+        if pd.api.types.is_float_dtype(dtype):
+            return "REAL"
+        return "TEXT"
+
+    def _create_table(self, data):
+
+        """
+        this method creates the buffer table with a typed schema derived from the dataframe, if it does not exist
+        """
+        columns = ", ".join('"{0}" {1}'.format(column, self._get_column_type(dtype))
+                            for column, dtype in data.dtypes.items())
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE IF NOT EXISTS "{0}" ({1})'.format(self.table, columns))
+        self.table_created = True
+
+    @staticmethod
+    def _to_sqlite_values(column):
+
+        """
+        this method converts a column to python values; timestamps are stored as naive UTC text, as sqlalchemy does
+        for the to_sql path, so both paths read back the same way
+        """
+        if pd.api.types.is_datetime64_any_dtype(column.dtype):
+            # a poll shares a single timestamp, so only the distinct values are formatted
+            codes, uniques = pd.factorize(column)
+            if uniques.tz is not None:
+                uniques = uniques.tz_convert("UTC").tz_localize(None)
+            values = uniques.strftime("%Y-%m-%d %H:%M:%S.%f").to_numpy(dtype=object).take(codes)
+            values[codes < 0] = None
+            return values.tolist()
+        return column.astype(object).where(column.notna(), None).tolist()
+
+    def _save_to_db_fast(self, data):
+
+        """
+        this method writes the dataframe with a single executemany, and its rollups, inside one transaction
+        """
+        if not self.table_created:
+            self._create_table(data)
+
+        columns = ", ".join('"{0}"'.format(column) for column in data.columns)
+        placeholders = ", ".join("?" for _ in data.columns)
+        rows = list(zip(*[self._to_sqlite_values(data[column]) for column in data.columns]))
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany('INSERT INTO "{0}" ({1}) VALUES ({2})'.format(self.table, columns, placeholders), rows)
+            if self.rollups:
+                self._upsert_rollups(cursor, data)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def _reset_delta_cache(self):
+        self.ap_ids = None
+        self.building_ids = None
+        self.delta_state = None
+        self.delta_state_time = None
+        self.polls_since_keyframe = None
+
+    def _create_delta_tables(self, cursor):
+
+        """
+        this method creates the tables of the delta storage: the access point and building dimensions, one row per
+        poll (keyframe = 1 when the poll holds the full state) and the (time, ap_id, count) rows of the counts that
+        changed since the previous poll, NULL when the access point left the poll
+        """
+        cursor.execute('CREATE TABLE IF NOT EXISTS "{0}_building" (building_id INTEGER PRIMARY KEY, '
+                       'building TEXT UNIQUE)'.format(self.table))
+        cursor.execute('CREATE TABLE IF NOT EXISTS "{0}_ap" (ap_id INTEGER PRIMARY KEY, ap_name TEXT, '
+                       'building_id INTEGER, UNIQUE (ap_name, building_id))'.format(self.table))
+        cursor.execute('CREATE TABLE IF NOT EXISTS "{0}_polls" (time TIMESTAMP PRIMARY KEY, keyframe INTEGER)'.format(
+            self.table))
+        cursor.execute('CREATE TABLE IF NOT EXISTS "{0}" (time TIMESTAMP, ap_id INTEGER, count INTEGER)'.format(
+            self.table))
+        cursor.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_time" ON "{0}" (time)'.format(self.table))
+        self.table_created = True
+
+    def _get_ids(self, cursor, dimension, columns, keys, cache):
+
+        """
+        this method returns the integer id of every key (tuple of column values) of a dimension table, inserting the
+        new keys
+        """
+        for key in dict.fromkeys(keys):
+            if key not in cache:
+                cursor.execute('INSERT OR IGNORE INTO "{0}_{1}" ({2}) VALUES ({3})'.format(
+                    self.table, dimension, ", ".join(columns), ", ".join("?" for _ in columns)), key)
+                cache[key] = cursor.execute('SELECT {1}_id FROM "{0}_{1}" WHERE {2}'.format(
+                    self.table, dimension, " AND ".join("{0} IS ?".format(column) for column in columns)),
+                    key).fetchone()[0]
+        return [cache[key] for key in keys]
+
+    def _get_ap_ids(self, cursor, poll):
+
+        """
+        this method returns the ap_id of every row of a poll; an access point that moves to another building gets a
+        new ap_id, so the building of past rows is kept
+        """
+        if self.ap_ids is None:
+            self.building_ids = {(building,): building_id for building_id, building in cursor.execute(
+                'SELECT building_id, building FROM "{0}_building"'.format(self.table)).fetchall()}
+            self.ap_ids = {(ap_name, building_id): ap_id for ap_id, ap_name, building_id in cursor.execute(
+                'SELECT ap_id, ap_name, building_id FROM "{0}_ap"'.format(self.table)).fetchall()}
+
+        buildings = [None] * len(poll)
+        if 'building' in poll.columns:
+            buildings = poll['building'].astype(object).where(poll['building'].notna(), None).tolist()
+        known = [(building,) for building in buildings if building is not None]
+        building_ids = iter(self._get_ids(cursor, "building", ("building",), known, self.building_ids))
+        building_ids = [None if building is None else next(building_ids) for building in buildings]
+        keys = list(zip(poll['ap_name'].astype(str).tolist(), building_ids))
+        return np.array(self._get_ids(cursor, "ap", ("ap_name", "building_id"), keys, self.ap_ids), dtype=np.int64)
+
+    def _load_delta_state(self, cursor, latest_time):
+
+        """
+        this method loads the counts of the latest poll and the number of polls since the last keyframe
+        """
+        self.delta_state_time = latest_time
+        self.delta_state = pd.Series(dtype=np.int64)
+        self.polls_since_keyframe = None
+        if latest_time is None:
+            return
+        times, ap_ids, counts = self._read_delta_grid(cursor, latest_time, latest_time)
+        self.delta_state = pd.Series(counts, index=ap_ids)
+        self.polls_since_keyframe = cursor.execute(
+            'SELECT COUNT(*) FROM "{0}_polls" WHERE time > '
+            '(SELECT MAX(time) FROM "{0}_polls" WHERE keyframe = 1)'.format(self.table)).fetchone()[0]
+
+    def _save_delta_poll(self, cursor, time, poll):
+
+        """
+        this method writes the counts of one poll that differ from the previous poll, or all of them as a keyframe
+        every keyframe_interval polls
+        """
+        current = pd.Series(poll['count'].to_numpy(dtype=np.int64), index=self._get_ap_ids(cursor, poll))
+        current = current[~current.index.duplicated(keep='last')]
+        keyframe = self.polls_since_keyframe is None or self.polls_since_keyframe + 1 >= self.keyframe_interval
+        if keyframe:
+            changes = list(zip(current.index.tolist(), current.tolist()))
+        else:
+            changed = current[current.ne(self.delta_state.reindex(current.index))]
+            removed = self.delta_state.index.difference(current.index)
+            changes = list(zip(changed.index.tolist(), changed.tolist()))
+            changes += [(ap_id, None) for ap_id in removed.tolist()]
+
+        time = self._format_db_time(time)
+        cursor.executemany('INSERT INTO "{0}" (time, ap_id, count) VALUES (?, ?, ?)'.format(self.table),
+                           [(time, ap_id, count) for ap_id, count in changes])
+        cursor.execute('INSERT OR REPLACE INTO "{0}_polls" (time, keyframe) VALUES (?, ?)'.format(self.table),
+                       (time, int(keyframe)))
+        self.delta_state = current
+        self.delta_state_time = time
+        self.polls_since_keyframe = 0 if keyframe else self.polls_since_keyframe + 1
+        return len(changes)
+
+    def _save_to_db_delta(self, data):
+
+        """
+        this method writes the polls of the dataframe in change only rows, and their rollups, inside one write
+        transaction; the state
+        of the latest poll is reloaded when another connector wrote or trimmed the buffer since
+        """
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if not self.table_created:
+                self._create_delta_tables(cursor)
+                connection.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            latest_time = cursor.execute('SELECT MAX(time) FROM "{0}_polls"'.format(self.table)).fetchone()[0]
+            if self.delta_state is None or latest_time != self.delta_state_time:
+                self._load_delta_state(cursor, latest_time)
+
+            n_rows = 0
+            for time, poll in data.groupby('time', sort=True):
+                n_rows += self._save_delta_poll(cursor, time, poll)
+            if self.rollups:
+                self._upsert_rollups(cursor, data)
+            connection.commit()
+            self.logger.info("{0} changed counts of {1} rows inserted into SQLite table {2}".format(
+                n_rows, len(data), self.table))
+        except Exception:
+            connection.rollback()
+            self._reset_delta_cache()
+            raise
+        finally:
+            connection.close()
+
+    def _read_delta_grid(self, cursor, start_time=None, end_time=None):
+
+        """
+        this method rebuilds the full grid of the polls from start_time to end_time (formatted db times) by replaying
+        the change only rows from the last keyframe before start_time, and returns the poll time, ap_id and count of
+        every access point present in each poll
+        """
+        base_time = None
+        if start_time is not None:
+            base_time = cursor.execute('SELECT MAX(time) FROM "{0}_polls" WHERE keyframe = 1 AND time <= ?'.format(
+                self.table), (start_time,)).fetchone()[0]
+        if base_time is None:
+            base_time = cursor.execute('SELECT MIN(time) FROM "{0}_polls"'.format(self.table)).fetchone()[0]
+        if base_time is None:
+            return np.array([], dtype=object), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        params = {"base_time": base_time, "end_time": end_time}
+        condition = "time >= :base_time" + (" AND time <= :end_time" if end_time is not None else "")
+        polls = cursor.execute('SELECT time, keyframe FROM "{0}_polls" WHERE {1} ORDER BY time'.format(
+            self.table, condition), params).fetchall()
+        rows = cursor.execute('SELECT time, ap_id, count FROM "{0}" WHERE {1}'.format(self.table, condition),
+                              params).fetchall()
+        poll_times = np.array([poll[0] for poll in polls], dtype=object)
+        keyframes = np.array([poll[1] == 1 for poll in polls], dtype=bool)
+        row_times, row_ap_ids, row_counts = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+
+        # polls x access points, NaN where the count did not change and -1 where the access point was absent
+        ap_ids, columns = np.unique(np.array(row_ap_ids, dtype=np.int64), return_inverse=True)
+        grid = np.full((len(poll_times), len(ap_ids)), np.nan)
+        grid[np.searchsorted(poll_times, np.array(row_times, dtype=object)), columns] = np.array(
+            [-1 if count is None else count for count in row_counts], dtype=float)
+        grid[keyframes] = np.where(np.isnan(grid[keyframes]), -1, grid[keyframes])
+        last_change = np.where(np.isnan(grid), 0, np.arange(len(poll_times))[:, None])
+        np.maximum.accumulate(last_change, axis=0, out=last_change)
+        grid = grid[last_change, np.arange(len(ap_ids))]
+
+        first = 0 if start_time is None else np.searchsorted(poll_times, start_time)
+        poll_rows, ap_columns = np.nonzero(grid[first:] >= 0)
+        return poll_times[first + poll_rows], ap_ids[ap_columns], grid[first + poll_rows, ap_columns].astype(np.int64)
+
+    def _get_delta_dimensions(self):
+        query = ('SELECT a.ap_id, a.ap_name, b.building FROM "{0}_ap" a LEFT JOIN "{0}_building" b '
+                 'ON a.building_id = b.building_id'.format(self.table))
+        return pd.read_sql_query(text(query), self.engine).set_index('ap_id')
+
+    def _to_delta_frame(self, times, ap_ids, counts):
+
+        """
+        this method names the access points and buildings of (time, ap_id, count) rows; NULL counts (access points
+        that left the poll) are kept as NaN
+        """
+        dimensions = self._get_delta_dimensions()
+        data = pd.DataFrame({'time': pd.to_datetime(pd.Series(times, dtype=object)),
+                             'ap_name': dimensions['ap_name'].reindex(ap_ids).to_numpy(),
+                             'building': dimensions['building'].reindex(ap_ids).to_numpy(),
+                             'count': counts})
+        data['time'] = data['time'].dt.tz_localize(pytz.timezone("UTC"))
+        return data
+
+    def _read_from_db_delta(self, start_time=None, end_time=None, changes_only=False):
+        start_time = self._format_db_time(start_time) if start_time is not None else None
+        end_time = self._format_db_time(end_time) if end_time is not None else None
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if changes_only:
+                params, conditions = {}, []
+                if start_time is not None:
+                    params["start_time"] = start_time
+                    conditions.append("time >= :start_time")
+                if end_time is not None:
+                    params["end_time"] = end_time
+                    conditions.append("time <= :end_time")
+                query = 'SELECT time, ap_id, count FROM "{0}"'.format(self.table)
+                if conditions:
+                    query += " WHERE " + " AND ".join(conditions)
+                rows = cursor.execute(query + " ORDER BY time, ap_id", params).fetchall()
+                columns = list(zip(*rows)) if rows else ([], [], [])
+                times, ap_ids = np.array(columns[0], dtype=object), np.array(columns[1], dtype=np.int64)
+                counts = np.array([np.nan if count is None else count for count in columns[2]], dtype=float)
+            else:
+                times, ap_ids, counts = self._read_delta_grid(cursor, start_time, end_time)
+        finally:
+            connection.close()
+        return self._to_delta_frame(times, ap_ids, counts).sort_values(['time', 'ap_name'], ignore_index=True)
+
+    def _read_chunk_delta(self, after_time=None, max_rows=50000, changes_only=False):
+
+        """
+        this method reads the oldest complete polls newer than after_time, about max_rows rows of them
+        """
+        params = {}
+        query = 'SELECT time FROM "{0}"'.format(self.table if changes_only else self.table + "_polls")
+        if after_time is not None:
+            params["after_time"] = self._format_db_time(after_time)
+            query += " WHERE time > :after_time"
+        if not changes_only:
+            # a poll of the full grid has about as many rows as there are access points
+            with self.engine.connect() as connection:
+                n_aps = connection.exec_driver_sql('SELECT COUNT(*) FROM "{0}_ap"'.format(self.table)).scalar()
+            max_rows = max(1, max_rows // max(1, n_aps))
+        params["limit"] = max_rows
+        with self.engine.connect() as connection:
+            times = connection.execute(text("SELECT MIN(time), MAX(time) FROM ({0} ORDER BY time LIMIT :limit)".format(
+                query)), params).fetchone()
+        if times[0] is None:
+            return self._to_delta_frame([], [], [])
+        return self._read_from_db_delta(pd.Timestamp(times[0]).tz_localize(pytz.UTC),
+                                        pd.Timestamp(times[1]).tz_localize(pytz.UTC), changes_only=changes_only)
+
+    def _delete_delta(self, watermark, inclusive=True):
+
+        """
+        this method deletes the polls up to watermark; the first poll kept is rewritten as a keyframe (full state)
+        first, so the buffer can still be rebuilt without the deleted rows
+        """
+        operator = "<=" if inclusive else "<"
+        watermark = self._format_db_time(watermark)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            first = cursor.execute('SELECT time, keyframe FROM "{0}_polls" WHERE NOT (time {1} ?) ORDER BY time '
+                                   'LIMIT 1'.format(self.table, operator), (watermark,)).fetchone()
+            if first is not None and first[1] != 1:
+                _, ap_ids, counts = self._read_delta_grid(cursor, first[0], first[0])
+                cursor.execute('DELETE FROM "{0}" WHERE time = ?'.format(self.table), (first[0],))
+                cursor.executemany('INSERT INTO "{0}" (time, ap_id, count) VALUES (?, ?, ?)'.format(self.table),
+                                   [(first[0], int(ap_id), int(count)) for ap_id, count in zip(ap_ids, counts)])
+                cursor.execute('UPDATE "{0}_polls" SET keyframe = 1 WHERE time = ?'.format(self.table), (first[0],))
+            n_rows = cursor.execute('DELETE FROM "{0}" WHERE time {1} ?'.format(self.table, operator),
+                                    (watermark,)).rowcount
+            cursor.execute('DELETE FROM "{0}_polls" WHERE time {1} ?'.format(self.table, operator), (watermark,))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        # the writer reloads its state if this emptied the buffer or rewrote its latest poll
+        self.delta_state = None
+        return n_rows
+
+    def _get_rollup_table(self, level):
+        if level not in ROLLUP_LEVELS:
+            raise ValueError("unknown rollup level={0}, expected one of {1}".format(level, list(ROLLUP_LEVELS)))
+        return "{0}_rollup_{1}".format(self.table, level)
+
+    def _get_rollup_periods(self, times, period):
+
+        """
+        this method returns the start of the hour or of the day (in rollup_timezone) of every time
+        """
+        times = pd.DatetimeIndex(times)
+        if times.tz is None:
+            times = times.tz_localize(pytz.UTC)
+        if period == "hour":
+            # hours are floored in UTC, where they never repeat or vanish with daylight saving time
+            return times.tz_convert(pytz.UTC).floor("h")
+        return times.tz_convert(self.rollup_timezone).normalize()
+
+    @staticmethod
+    def _group(keys, names, n_names, values, aggregates):
+
+        """
+        this method returns the distinct keys * n_names + names and the min, max, sum and count (in the order of
+        aggregates) of the values of each of them
+        """
+        cells, inverse = np.unique(np.asarray(keys, dtype=np.int64) * n_names + names, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+        ordered = np.asarray(values, dtype=np.int64)[order]
+        functions = {"min": lambda: np.minimum.reduceat(ordered, starts),
+                     "max": lambda: np.maximum.reduceat(ordered, starts),
+                     "sum": lambda: np.add.reduceat(ordered, starts),
+                     "count": lambda: np.diff(np.r_[starts, len(ordered)])}
+        return cells, [functions[aggregate]() for aggregate in aggregates]
+
+    def _upsert_rollups(self, cursor, data):
+
+        """
+        this method adds the counts of the polls to the hourly and daily rollups of every access point and building
+        (per poll building totals): min, max, sum and number of samples. The upserts run on the cursor of the save,
+        so the rollups are committed or rolled back with the polls
+        """
+        levels = [level for level in ROLLUP_LEVELS if ROLLUP_LEVELS[level][0] in data.columns]
+        # a poll shares a single time, so the periods are computed on the distinct times only
+        time_codes, times = pd.factorize(data['time'])
+        counts = data['count'].to_numpy(dtype=np.int64)
+        for level in levels:
+            column, period = ROLLUP_LEVELS[level]
+            table = self._get_rollup_table(level)
+            name_codes, names = pd.factorize(data[column].to_numpy(dtype=object))
+            known = name_codes >= 0
+            if not known.any():
+                continue
+            # one sample per poll and name: the access point count, or the building total
+            samples, (level_counts,) = self._group(time_codes[known], name_codes[known], len(names), counts[known],
+                                                   ["sum"])
+            sample_times, sample_names = np.divmod(samples, len(names))
+            period_codes, periods = pd.factorize(self._get_rollup_periods(times, period).take(sample_times))
+            cells, (mins, maxs, sums, ns) = self._group(period_codes, sample_names, len(names), level_counts,
+                                                        ["min", "max", "sum", "count"])
+            cell_periods, cell_names = np.divmod(cells, len(names))
+            periods = periods.tz_convert(pytz.UTC).strftime("%Y-%m-%d %H:%M:%S.%f").to_numpy(dtype=object)
+            rows = list(zip(periods[cell_periods].tolist(), np.asarray(names, dtype=str)[cell_names].tolist(),
+                            mins.tolist(), maxs.tolist(), sums.tolist(), ns.tolist()))
+
+            cursor.execute('CREATE TABLE IF NOT EXISTS "{0}" (period TIMESTAMP, name TEXT, "min" INTEGER, '
+                           '"max" INTEGER, "sum" INTEGER, n INTEGER, PRIMARY KEY (period, name)) '
+                           'WITHOUT ROWID'.format(table))
+            cursor.executemany(
+                'INSERT INTO "{0}" (period, name, "min", "max", "sum", n) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (period, name) DO UPDATE SET "min" = MIN("min", excluded."min"), '
+                '"max" = MAX("max", excluded."max"), "sum" = "sum" + excluded."sum", n = n + excluded.n'.format(
+                    table), rows)
+
+    def read_rollup(self, level, start_time=None, end_time=None):
+
+        """
+        this method reads a rollup (ap_hour, ap_day, building_hour or building_day) back to a pandas dataframe:
+        period (start of the hour or day, in rollup_timezone), ap_name or building, min, max, mean, sum and n, the
+        number of samples; start_time and end_time (inclusive) select the periods
+        """
+        table = self._get_rollup_table(level)
+        column = ROLLUP_LEVELS[level][0]
+        params = {}
+        conditions = []
+        if start_time is not None:
+            params["start_time"] = self._format_db_time(start_time)
+            conditions.append("period >= :start_time")
+        if end_time is not None:
+            params["end_time"] = self._format_db_time(end_time)
+            conditions.append("period <= :end_time")
+        query = 'SELECT period, name AS {1}, "min", "max", "sum", n FROM "{0}"'.format(table, column)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        try:
+            data = pd.read_sql_query(text(query + " ORDER BY period, name"), self.engine, params=params)
+        except Exception as e:
+            self.logger.error("cannot read rollup {0} from SQLite table {1}, error={2}".format(level, table, str(e)))
+            return pd.DataFrame()
+        data['period'] = pd.to_datetime(data['period']).dt.tz_localize(pytz.UTC).dt.tz_convert(self.rollup_timezone)
+        data.insert(4, 'mean', data['sum'] / data['n'])
+        return data
+
     def save_to_db(self, data, mode="append"):
 
         """
@@ -51,7 +527,20 @@ class SQLite_Connector(DB_Interface):
         """
         try:
             if not data.empty:
-                data.to_sql(name=self.table, con=self.engine, if_exists=mode, index=False)
+                if self.storage == "delta":
+                    if mode != "append":
+                        raise ValueError("the delta storage only appends polls")
+                    self._save_to_db_delta(data)
+                else:
+                    if self.fast_insert and mode == "append":
+                        self._save_to_db_fast(data)
+                    else:
+                        with self.engine.begin() as connection:
+                            data.to_sql(name=self.table, con=connection, if_exists=mode, index=False)
+                            if self.rollups:
+                                self._upsert_rollups(connection.connection.cursor(), data)
+                    if not self.time_index_created or mode == "replace":
+                        self._create_time_index()
                 self.logger.info("values successfully inserted into SQLite database table {0}".format(self.table))
             else:
                 self.logger.warning("no data to save to SQLite database")
@@ -66,29 +555,60 @@ class SQLite_Connector(DB_Interface):
             return False
         return True
 
-    def read_from_db(self, start_time=None, end_time=None, query=None):
+    @staticmethod
+    def _format_db_time(ts):
+
+        """
+        this method formats a timestamp like the stored time column (naive UTC text), so that comparisons on the
+        indexed column are correct
+        """
+        ts = pd.Timestamp(DB_Interface.format_time(ts))
+        if ts.tzinfo is None:
+            ts = ts.tz_localize(pytz.UTC)
+        return ts.tz_convert(pytz.UTC).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    def _create_time_index(self):
 
         """
-        this method reads the data from a db table back to a pandas dataframe
+        this method creates the index on the time column used by range reads and deletes
         """
         try:
+            with self.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'CREATE INDEX IF NOT EXISTS "ix_{0}_time" ON "{0}" (time)'.format(self.table))
+            self.time_index_created = True
+        except Exception as e:
+            self.logger.warning("cannot create time index on SQLite table {0}, error={1}".format(self.table, str(e)))
+
+    def read_from_db(self, start_time=None, end_time=None, query=None, params=None, changes_only=False):
+
+        """
+        this method reads the data from a db table back to a pandas dataframe, ordered by time
+        start_time and end_time (inclusive) are bound parameters of an indexed range query
+        With the delta storage the full grid of the polls is rebuilt, or only the changed counts are read with
+        changes_only (NaN count: the access point left the poll)
+        """
+        try:
+            if self.storage == "delta" and query is None:
+                data = self._read_from_db_delta(start_time, end_time, changes_only=changes_only)
+                self.logger.info("successfully read values from SQLite table {0}".format(self.table))
+                return data
             if query is None:
+                params = {}
+                conditions = []
                 if start_time is not None:
-                    start_time = DB_Interface.format_time(start_time).strftime("%s")
-
+                    params["start_time"] = self._format_db_time(start_time)
+                    conditions.append("time >= :start_time")
                 if end_time is not None:
-                    end_time = DB_Interface.format_time(end_time).strftime("%s")
+                    params["end_time"] = self._format_db_time(end_time)
+                    conditions.append("time <= :end_time")
 
-                query = "SELECT * FROM {}".format(self.table)
+                query = 'SELECT * FROM "{0}"'.format(self.table)
+                if conditions:
+                    query += " WHERE " + " AND ".join(conditions)
+                query += " ORDER BY time"
 
-                if start_time is not None and end_time is not None:
-                    query += " and time >= '{0}' and time <= '{1}'".format(start_time, end_time)
-                elif start_time is not None:
-                    query += " and time >= '{0}'".format(start_time)
-                elif end_time is not None:
-                    query += " and time <= '{0}'".format(end_time)
-
-            data = pd.read_sql_query(query, self.engine)
+            data = pd.read_sql_query(text(query), self.engine, params=params)
             data['time'] = pd.to_datetime(data['time'])
             data['time'] = data['time'].dt.tz_localize(pytz.timezone("UTC"))
             self.logger.info("successfully read values from SQLite table {0}".format(self.table))
@@ -97,13 +617,103 @@ class SQLite_Connector(DB_Interface):
             self.logger.error("The SQLite table {0} was not found, error={1}".format(self.table, str(e)))
             return pd.DataFrame()
 
+    def read_chunk_from_db(self, after_time=None, max_rows=50000, changes_only=False):
+
+        """
+        this method reads the oldest rows newer than after_time, about max_rows of them, ordered by time
+        The chunk always ends on a complete poll: the rows sharing the last time are read completely
+        """
+        if self.storage == "delta":
+            try:
+                return self._read_chunk_delta(after_time, max_rows, changes_only=changes_only)
+            except Exception as e:
+                self.logger.error("cannot read chunk from SQLite table {0}, error={1}".format(self.table, str(e)))
+                return pd.DataFrame()
+
+        params = {"limit": max_rows}
+        query = 'SELECT * FROM "{0}"'.format(self.table)
+        if after_time is not None:
+            params["after_time"] = self._format_db_time(after_time)
+            query += " WHERE time > :after_time"
+        data = self.read_from_db(query=query + " ORDER BY time LIMIT :limit", params=params)
+
+        if len(data) >= max_rows:
+            last_time = data['time'].iloc[-1]
+            last_poll = self.read_from_db(start_time=last_time, end_time=last_time)
+            data = pd.concat([data.loc[data['time'] < last_time], last_poll], ignore_index=True)
+        return data
+
+    def get_latest_time(self):
+
+        """
+        this method returns the newest time in the buffer (from the time index), or None if the buffer is empty
+        """
+        try:
+            with self.engine.connect() as connection:
+                row = connection.exec_driver_sql('SELECT MAX(time) FROM "{0}"'.format(
+                    self.table + "_polls" if self.storage == "delta" else self.table)).fetchone()
+        except Exception as e:
+            self.logger.error("cannot read latest time from SQLite table {0}, error={1}".format(self.table, str(e)))
+            return None
+
+        if row is None or row[0] is None:
+            return None
+        return pd.Timestamp(row[0]).tz_localize(pytz.UTC)
+
+    def _create_state_table(self, connection):
+        connection.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS "{0}_state" (name TEXT PRIMARY KEY, time TIMESTAMP)'.format(self.table))
+
+    def get_high_water_mark(self, name="remote_db"):
+
+        """
+        this method returns the persisted time up to which the buffer was acknowledged by the consumer name, or None
+        """
+        try:
+            with self.engine.begin() as connection:
+                self._create_state_table(connection)
+                row = connection.execute(text('SELECT time FROM "{0}_state" WHERE name = :name'.format(self.table)),
+                                         {"name": name}).fetchone()
+        except Exception as e:
+            self.logger.error("cannot read high water mark of {0} from SQLite table {1}_state, error={2}".format(
+                name, self.table, str(e)))
+            raise e
+
+        if row is None or row[0] is None:
+            return None
+        return pd.Timestamp(row[0]).tz_localize(pytz.UTC)
+
+    def set_high_water_mark(self, time, name="remote_db"):
+
+        """
+        this method persists the time up to which the buffer was acknowledged by the consumer name
+        """
+        try:
+            with self.engine.begin() as connection:
+                self._create_state_table(connection)
+                connection.execute(text('INSERT OR REPLACE INTO "{0}_state" (name, time) VALUES (:name, :time)'.format(
+                    self.table)), {"name": name, "time": self._format_db_time(time)})
+        except Exception as e:
+            self.logger.error("cannot save high water mark of {0} to SQLite table {1}_state, error={2}".format(
+                name, self.table, str(e)))
+            raise e
+
     def clean_db(self):
 
         """
         this method drops the whole table on the db; use delete_data_sent for normal operation
         """
         try:
-            pd.io.sql.execute("DROP TABLE IF EXISTS {}".format(self.table), self.engine)
+            with self.engine.begin() as connection:
+                connection.exec_driver_sql('DROP TABLE IF EXISTS "{0}"'.format(self.table))
+                if self.storage == "delta":
+                    for suffix in ("_polls", "_ap", "_building"):
+                        connection.exec_driver_sql('DROP TABLE IF EXISTS "{0}{1}"'.format(self.table, suffix))
+                for level in ROLLUP_LEVELS:
+                    connection.exec_driver_sql('DROP TABLE IF EXISTS "{0}"'.format(self._get_rollup_table(level)))
+            self.table_created = False
+            self.time_index_created = False
+            self._reset_delta_cache()
             self.logger.info("successfully dropped SQLite table {0}".format(self.table))
         except Exception as e:
             self.logger.error("unexpected error while dropping SQLite table {0}, error={1}".format(self.table, str(e)))
@@ -117,44 +727,50 @@ class SQLite_Connector(DB_Interface):
         self.logger.info("closed sqlalchemy engine")
         return
 
-    def _select_timestamps(self, data, time_threshold):
+    def _get_watermark(self, data, time_threshold):
 
         """
-        this method selects the dates to be removed form local database based on a time threshold check
-        It uses data time comparison and manipulation in pandas. The method is called by "delete_data_sent"
+        this method returns the newest time of the data that was sent which is older than time_threshold. Polls are
+        written in time order, so every buffered row up to that time is part of the data that was sent
         """
-        try:
-            if not data.empty:
-                data_to_be_removed = data.loc[data.time < time_threshold]
-                times_to_be_removed = '("' + '","'.join(
-                    list((data_to_be_removed.time.dt.tz_localize(None).astype(str).unique()))) + '")'
-                return times_to_be_removed
-            else:
-                self.logger.warning("data to be selected to be removed is empty, check this")
-                return '()'
-        except Exception as e:
-            self.logger.error(
-                "unexpected error while selecting data to be remove from SQLite db, error={0}".format(str(e)))
-            return '()'
-        # ex datetime_to_remove = "('20180627141830', '20180627141834', '20180627142745', '20180627142753'')"
+        if data is None or data.empty:
+            return None
+        times = data.time.loc[data.time < time_threshold]
+        if times.empty:
+            return None
+        return times.max()
 
     def delete_data_from_db_based_on_time(self, data, time_threshold=None, *args):
 
         """
-        this method deletes data until a partcular time from the SQLite database
+        this method deletes the data that was sent (up to a partcular time) from the SQLite database with a single
+        DELETE ... WHERE time <= watermark on the indexed time column
+        When data is None every row older than time_threshold is deleted
         """
 
         if time_threshold is None:
-            time_threshold = pd.Timestamp.utcnow()
+            time_threshold = pd.Timestamp.now(tz=pytz.UTC)
         else:
             time_threshold = DB_Interface.format_time(time_threshold)
 
-        datetime_to_remove = self._select_timestamps(data, time_threshold=time_threshold)
+        if data is None:
+            query = 'DELETE FROM "{0}" WHERE time < :watermark'.format(self.table)
+            watermark = time_threshold
+        else:
+            query = 'DELETE FROM "{0}" WHERE time <= :watermark'.format(self.table)
+            watermark = self._get_watermark(data, time_threshold)
+            if watermark is None:
+                self.logger.warning("data to be selected to be removed is empty, check this")
+                return True
 
         try:
-            self.engine.execute(
-                "DELETE FROM {} WHERE time in {} ".format(self.table, datetime_to_remove))  # or engine.engine
-            self.logger.info("data that was sent has been removed from the SQLITE db table {0}".format(self.table))
+            if self.storage == "delta":
+                rowcount = self._delete_delta(watermark, inclusive=data is not None)
+            else:
+                with self.engine.begin() as connection:
+                    rowcount = connection.execute(text(query), {"watermark": self._format_db_time(watermark)}).rowcount
+            self.logger.info("{0} rows that were sent have been removed from the SQLITE db table {1}".format(
+                rowcount, self.table))
             return True
         except Exception as e:
             self.logger.error(
@@ -0,0 +1,486 @@
+import contextlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pytz
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, the spool is then only safe within one process
+    fcntl = None
+
+from data_storage.DB_Interface import DB_Interface
+
+# One fixed-width record per access point and poll: UTC epoch nanoseconds, ap id (aps.tsv) and count
+RECORD_DTYPE = np.dtype([('time', '<i8'), ('ap_id', '<i4'), ('count', '<i4')])
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{12})\.bin$')
+
+
+class Spool_Connector(DB_Interface):
+    """
+    This class is a local buffer backed by append-only segment files of fixed-width binary records instead of SQLite.
+    Polls are appended to the active segment, which is rolled over to a new file once it holds segment_records
+    records; reads memory-map the segments; deletes drop whole segments and hide the acknowledged records of the
+    segment they end in. The access point names and buildings are kept once in aps.tsv.
+    Several connectors can share a spool (e.g. get_wifi_data.py writing and push_to_remote_db.py draining, or the
+    collect and push jobs of count_daemon.py): every method holds a thread lock and an flock of spool.lock, and
+    reloads the segments, the state and the new access points from disk first. The active segment is always the
+    newest one on disk: only save_to_db rolls over, and deletes never remove the newest segment.
+    """
+
+    def __init__(self, project_path=".", config_file="count_config.yaml", section="local_db", context=None):
+        super().__init__(project_path, config_file, section, context)
+
+        try:
+            db_cfg = self.config[self.database_section]
+            self.directory = self.project_path + "/" + db_cfg.get("directory", "spool")
+            self.segment_records = db_cfg.get("segment_records", 1000000)
+            self.fsync = db_cfg.get("fsync", False)
+        except Exception as e:
+            self.logger.error("unexpected error while setting configuration from config_file={0}, error={1}".format(
+                self.config_file, str(e)))
+            raise e
+
+        self.lock = threading.RLock()
+        self.lock_depth = 0
+        self.lock_file = None
+        self.segment_file = None
+        self.active_segment = None
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            self._open_spool()
+
+    @contextlib.contextmanager
+    def _locked(self):
+
+        """
+        this method holds the thread lock of the connector and, across processes, the flock of spool.lock
+        """
+        with self.lock:
+            if self.lock_file is None:
+                self.lock_file = open(self.directory + "/spool.lock", "a")
+            self.lock_depth += 1
+            try:
+                if self.lock_depth == 1 and fcntl is not None:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+                yield
+            finally:
+                if self.lock_depth == 1 and fcntl is not None:
+                    fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+                self.lock_depth -= 1
+
+    def _get_segment_path(self, sequence):
+        return self.directory + "/" + "segment-%012d.bin" % sequence
+
+    def _list_segments(self):
+        return sorted(int(match.group(1)) for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if match)
+
+    def _sync(self, fp, force=False):
+        fp.flush()
+        if self.fsync or force:
+            os.fsync(fp.fileno())
+
+    def _sync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _open_spool(self):
+
+        """
+        this method cuts off a record or access point line torn by a crash in the middle of a write, then loads the
+        spool; called with the lock held, so no other connector is writing
+        """
+        aps_path = self.directory + "/aps.tsv"
+        if os.path.exists(aps_path):
+            with open(aps_path, "rb") as fp:
+                content = fp.read()
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                self.logger.warning("cutting off a torn access point line in {0}".format(aps_path))
+                with open(aps_path, "r+b") as fp:
+                    fp.truncate(complete)
+
+        segments = self._list_segments()
+        if segments:
+            path = self._get_segment_path(segments[-1])
+            size = os.path.getsize(path)
+            if size % RECORD_DTYPE.itemsize:
+                self.logger.warning("cutting off a torn record at the end of {0}".format(path))
+                with open(path, "r+b") as fp:
+                    fp.truncate(size - size % RECORD_DTYPE.itemsize)
+
+        self.ap_ids = {}
+        self.aps = []
+        self.aps_offset = 0
+        self.aps_inode = None
+        self._refresh()
+        self.logger.info("opened spool {0} with {1} segments".format(self.directory, len(self.segments)))
+
+    def _load_aps(self):
+
+        """
+        this method loads the access point lines appended to aps.tsv since the last load (all of them if the file was
+        recreated by clean_db)
+        """
+        aps_path = self.directory + "/aps.tsv"
+        if not os.path.exists(aps_path):
+            stat = None
+        else:
+            stat = os.stat(aps_path)
+        if stat is None or stat.st_ino != self.aps_inode or stat.st_size < self.aps_offset:
+            self.ap_ids = {}
+            self.aps = []
+            self.aps_offset = 0
+            self.aps_inode = None if stat is None else stat.st_ino
+        if stat is None or stat.st_size == self.aps_offset:
+            return
+        with open(aps_path, "rb") as fp:
+            fp.seek(self.aps_offset)
+            content = fp.read()
+        content = content[:content.rfind(b"\n") + 1]
+        for line in content.decode("utf-8").splitlines():
+            ap_name, building = line.split("\t")
+            self.ap_ids[(ap_name, building)] = len(self.aps)
+            self.aps.append((ap_name, building))
+        self.aps_offset += len(content)
+
+    def _refresh(self):
+
+        """
+        this method reloads what other connectors may have changed: the segments, the state and the access points
+        """
+        self.state = {"deleted_through": None, "high_water_marks": {}}
+        if os.path.exists(self.directory + "/state.json"):
+            with open(self.directory + "/state.json", "r") as fp:
+                self.state.update(json.load(fp))
+        self.segments = self._list_segments()
+        self._load_aps()
+        self.latest_time = None
+        for sequence in reversed(self.segments):
+            records = self._map_segment(sequence)
+            if len(records):
+                self.latest_time = int(records['time'][-1])
+                break
+
+    def _save_state(self):
+
+        """
+        this method persists the delete watermark and the high water marks (written to a temporary file first, then
+        renamed)
+        """
+        with open(self.directory + "/state.json.tmp", "w") as fp:
+            json.dump(self.state, fp)
+            self._sync(fp, force=True)
+        os.replace(self.directory + "/state.json.tmp", self.directory + "/state.json")
+        self._sync_directory()
+
+    def _map_segment(self, sequence):
+
+        """
+        this method returns the records of a segment as a read-only memory map (an empty array for an empty segment)
+        """
+        path = self._get_segment_path(sequence)
+        n_records = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        if n_records == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(n_records,))
+
+    def _close_segment_file(self, force_sync=False):
+        if self.segment_file is not None:
+            self._sync(self.segment_file, force=force_sync)
+            self.segment_file.close()
+            self.segment_file = None
+            self.active_segment = None
+
+    def _get_segment_file(self):
+
+        """
+        this method returns the active segment, the newest one on disk, opened for append; the segment held open is
+        reopened when it is no longer the newest one or was removed (e.g. by clean_db of another connector)
+        """
+        newest = self.segments[-1] if self.segments else 0
+        if self.segment_file is None or self.active_segment != newest or not os.path.exists(
+                self._get_segment_path(newest)):
+            self._close_segment_file()
+            self.segment_file = open(self._get_segment_path(newest), "ab")
+            self.active_segment = newest
+            if not self.segments:
+                self.segments = [newest]
+                self._sync_directory()
+        return self.segment_file
+
+    def _roll_over(self):
+
+        """
+        this method seals the active segment (synced to disk) and starts a new one; a crash in between leaves at
+        most an empty new segment
+        """
+        sequence = self.active_segment + 1
+        self._close_segment_file(force_sync=True)
+        open(self._get_segment_path(sequence), "ab").close()
+        self.segments.append(sequence)
+        self._sync_directory()
+
+    def _get_ap_ids(self, data):
+
+        """
+        this method returns the ap id of every row, appending the new (ap_name, building) pairs to aps.tsv
+        """
+        buildings = data['building'] if 'building' in data.columns else pd.Series("", index=data.index)
+        keys = list(zip(data['ap_name'].astype(str), buildings.fillna("").astype(str)))
+        new = [key for key in dict.fromkeys(keys) if key not in self.ap_ids]
+        if new:
+            for key in new:
+                if "\t" in key[0] + key[1] or "\n" in key[0] + key[1]:
+                    raise ValueError("ap_name and building cannot contain tabs or new lines: {0}".format(key))
+            with open(self.directory + "/aps.tsv", "ab") as fp:
+                fp.write("".join("{0}\t{1}\n".format(*key) for key in new).encode("utf-8"))
+                self._sync(fp)
+            self._load_aps()
+        return np.fromiter((self.ap_ids[key] for key in keys), dtype=np.int32, count=len(keys))
+
+    @staticmethod
+    def _to_nanoseconds(ts):
+        ts = pd.Timestamp(DB_Interface.format_time(ts))
+        if ts.tzinfo is None:
+            ts = ts.tz_localize(pytz.UTC)
+        return ts.tz_convert(pytz.UTC).as_unit('ns').value
+
+    def save_to_db(self, data, *args):
+
+        """
+        this method appends the polls of the dataframe (time, ap_name, building, count) to the active segment, in
+        time order; polls older than the newest buffered poll are refused
+        """
+        if data.empty:
+            self.logger.warning("no data to save to the spool")
+            return True
+        try:
+            times = pd.DatetimeIndex(data['time'])
+            if times.tz is None:
+                times = times.tz_localize(pytz.UTC)
+            times = times.tz_convert(pytz.UTC).as_unit('ns').asi8
+            order = np.argsort(times, kind='stable')
+
+            with self._locked():
+                self._refresh()
+                if self.latest_time is not None and times[order[0]] < self.latest_time:
+                    raise ValueError("polls must be saved in time order, {0} is older than the newest buffered "
+                                     "poll".format(pd.Timestamp(times[order[0]], tz=pytz.UTC)))
+                records = np.empty(len(data), dtype=RECORD_DTYPE)
+                records['time'] = times[order]
+                records['ap_id'] = self._get_ap_ids(data)[order]
+                records['count'] = data['count'].to_numpy(dtype=np.int64)[order]
+                segment_file = self._get_segment_file()
+                segment_file.write(records.tobytes())
+                self._sync(segment_file)
+                self.latest_time = int(records['time'][-1])
+                if os.fstat(segment_file.fileno()).st_size // RECORD_DTYPE.itemsize >= self.segment_records:
+                    self._roll_over()
+            self.logger.info("{0} records successfully appended to the spool {1}".format(len(records), self.directory))
+        except Exception as e:
+            self.logger.error("Unexpected error while appending values to the spool {0}, error={1}".format(
+                self.directory, str(e)))
+            return False
+        return True
+
+    def read_records(self, start_time=None, end_time=None, after_time=None):
+
+        """
+        this method returns the records from start_time (or after after_time) to end_time (inclusive) as a list of
+        zero copy views of the memory-mapped segments, hiding the deleted records
+        """
+        lower, side = start_time, 'left'
+        if after_time is not None:
+            lower, side = after_time, 'right'
+        lower = self._to_nanoseconds(lower) if lower is not None else None
+        upper = self._to_nanoseconds(end_time) if end_time is not None else None
+
+        with self._locked():
+            self._refresh()
+            if self.state["deleted_through"] is not None and (lower is None or lower <= self.state["deleted_through"]):
+                lower, side = self.state["deleted_through"], 'right'
+            views = []
+            for sequence in self.segments:
+                records = self._map_segment(sequence)
+                if len(records) == 0 or (upper is not None and records['time'][0] > upper):
+                    continue
+                first = 0 if lower is None else np.searchsorted(records['time'], lower, side=side)
+                last = len(records) if upper is None else np.searchsorted(records['time'], upper, side='right')
+                if first < last:
+                    views.append(records[first:last])
+            return views
+
+    def _to_frame(self, records):
+        ap_ids = records['ap_id']
+        aps = np.array(self.aps + [("", "")], dtype=object).reshape(-1, 2)
+        data = pd.DataFrame({'time': pd.DatetimeIndex(records['time'].view('M8[ns]')).tz_localize(pytz.UTC),
+                             'ap_name': aps[ap_ids, 0], 'building': aps[ap_ids, 1],
+                             'count': records['count'].astype(np.int64)})
+        data['building'] = data['building'].replace("", None)
+        return data
+
+    def read_from_db(self, start_time=None, end_time=None, changes_only=False):
+
+        """
+        this method reads the records from start_time to end_time (inclusive) back to a pandas dataframe, ordered by
+        time (changes_only is ignored, see read_chunk_from_db)
+        """
+        try:
+            with self._locked():
+                views = self.read_records(start_time=start_time, end_time=end_time)
+                records = np.concatenate(views) if views else np.empty(0, dtype=RECORD_DTYPE)
+                data = self._to_frame(records)
+            self.logger.info("successfully read {0} records from the spool {1}".format(len(records), self.directory))
+            return data
+        except Exception as e:
+            self.logger.error("cannot read from the spool {0}, error={1}".format(self.directory, str(e)))
+            return pd.DataFrame()
+
+    def read_chunk_from_db(self, after_time=None, max_rows=50000, changes_only=False):
+
+        """
+        this method reads the oldest records newer than after_time, about max_rows of them, ordered by time
+        The chunk always ends on a complete poll: the records sharing the last time are read completely. The spool
+        stores every count, changes_only is accepted for compatibility with SQLite_Connector and ignored
+        """
+        try:
+            with self._locked():
+                chunk = []
+                n_records = 0
+                views = self.read_records(after_time=after_time)
+                for i, records in enumerate(views):
+                    if n_records + len(records) < max_rows:
+                        chunk.append(records)
+                        n_records += len(records)
+                        continue
+                    last_time = records['time'][max(max_rows - n_records, 1) - 1]
+                    for records in views[i:]:
+                        records = records[:np.searchsorted(records['time'], last_time, side='right')]
+                        if len(records) == 0:
+                            break
+                        chunk.append(records)
+                    break
+                records = np.concatenate(chunk) if chunk else np.empty(0, dtype=RECORD_DTYPE)
+                return self._to_frame(records)
+        except Exception as e:
+            self.logger.error("cannot read chunk from the spool {0}, error={1}".format(self.directory, str(e)))
+            return pd.DataFrame()
+
+    def get_latest_time(self):
+
+        """
+        this method returns the newest time in the spool, or None if it is empty
+        """
+        with self._locked():
+            self._refresh()
+            if self.latest_time is None or (self.state["deleted_through"] is not None and
+                                            self.latest_time <= self.state["deleted_through"]):
+                return None
+            return pd.Timestamp(self.latest_time, tz=pytz.UTC)
+
+    def get_high_water_mark(self, name="remote_db"):
+
+        """
+        this method returns the persisted time up to which the spool was acknowledged by the consumer name, or None
+        """
+        with self._locked():
+            self._refresh()
+            time = self.state["high_water_marks"].get(name)
+        return None if time is None else pd.Timestamp(time, tz=pytz.UTC)
+
+    def set_high_water_mark(self, time, name="remote_db"):
+
+        """
+        this method persists the time up to which the spool was acknowledged by the consumer name
+        """
+        with self._locked():
+            self._refresh()
+            self.state["high_water_marks"][name] = self._to_nanoseconds(time)
+            self._save_state()
+
+    def delete_data_from_db_based_on_time(self, data, time_threshold=None, *args):
+
+        """
+        this method deletes the records that were sent (up to a particular time): the segments that only hold
+        deleted records are removed, except the newest one that a writer may still append to, and the delete
+        watermark hides the deleted records of the others
+        When data is None every record older than time_threshold is deleted
+        """
+        if time_threshold is None:
+            time_threshold = pd.Timestamp.now(tz=pytz.UTC)
+        threshold = self._to_nanoseconds(time_threshold)
+        if data is None:
+            watermark = threshold - 1
+        else:
+            times = pd.DatetimeIndex(data['time'])
+            times = times.tz_localize(pytz.UTC) if times.tz is None else times.tz_convert(pytz.UTC)
+            times = times.as_unit('ns').asi8
+            times = times[times < threshold]
+            if len(times) == 0:
+                self.logger.warning("data to be selected to be removed is empty, check this")
+                return True
+            watermark = int(times.max())
+
+        try:
+            with self._locked():
+                self._refresh()
+                if self.state["deleted_through"] is None or watermark > self.state["deleted_through"]:
+                    self.state["deleted_through"] = watermark
+                    self._save_state()
+
+                removed = 0
+                for sequence in self.segments[:-1]:
+                    records = self._map_segment(sequence)
+                    if len(records) and records['time'][-1] > watermark:
+                        break
+                    del records
+                    os.remove(self._get_segment_path(sequence))
+                    removed += 1
+                self.segments = self.segments[removed:]
+                self._sync_directory()
+            self.logger.info("{0} segments that were sent have been removed from the spool {1}".format(
+                removed, self.directory))
+            return True
+        except Exception as e:
+            self.logger.error("unexpected error occurred while removing data sent from the spool {0}, error={1}".format(
+                self.directory, str(e)))
+            return False
+
+    def clean_db(self):
+
+        """
+        this method removes every segment, access point and state file of the spool
+        """
+        try:
+            with self._locked():
+                self._close_segment_file()
+                for name in os.listdir(self.directory):
+                    if SEGMENT_PATTERN.match(name) or name in ("aps.tsv", "state.json"):
+                        os.remove(self.directory + "/" + name)
+                self._open_spool()
+            self.logger.info("successfully removed the spool {0}".format(self.directory))
+        except Exception as e:
+            self.logger.error("unexpected error while removing the spool {0}, error={1}".format(self.directory,
+                                                                                              str(e)))
+
+    def close_connection(self):
+
+        """
+        this method closes the active segment and the lock file
+        """
+        with self.lock:
+            self._close_segment_file()
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+        self.logger.info("closed spool {0}".format(self.directory))
@@ -1,23 +1,93 @@
 from data_source.Wifi_Gatherer import Wifi_Gatherer
 from data_processor.Cisco_Processor import Cisco_Processor
+from data_processor.Cisco_AP_Counter_Processor import Cisco_AP_Counter_Processor
 from data_storage.SQLite_Connector import SQLite_Connector
+from data_storage.Spool_Connector import Spool_Connector
+from data_applications.profile_accumulator import Profile_Accumulator
+from pipeline.Collection_Pipeline import Collection_Pipeline
+from common.Count_Context import Count_Context
 import os
 
-project_path = os.path.dirname(os.path.realpath(__file__))
-config_file = "count_config.yaml"
+# Data processors, selected with the collection_mode parameter of the data_processor config section
+DATA_PROCESSORS = {'clients': Cisco_Processor, 'ap_counters': Cisco_AP_Counter_Processor}
+# Local buffers, selected with the backend parameter of the local_db config section
+LOCAL_DATABASES = {'sqlite': SQLite_Connector, 'spool': Spool_Connector}
 
-data_source_obj = Wifi_Gatherer(project_path=project_path, config_file=config_file, section="snmp")
-data_processor_obj = Cisco_Processor(project_path=project_path, config_file=config_file, section="data_processor")
-local_database_obj = SQLite_Connector(project_path=project_path, config_file=config_file, section="local_db")
 
-data = data_source_obj.get_wifi_data()
+def get_profile_accumulator(project_path, config, section="profiles"):
+    """
+    returns the profile accumulator persisted in the directory of the profiles config section, or None if the section
+    is not configured. A profiles file saved by a former version (filename) is imported when the directory is created
+    """
+    profiles_cfg = config.get(section)
+    if not profiles_cfg:
+        return None
+    timezone = profiles_cfg.get("timezone", "US/Pacific")
+    directory = os.path.join(project_path, profiles_cfg.get("directory", "profiles"))
+    filename = os.path.join(project_path, profiles_cfg.get("filename", "profiles.npz"))
+    if not os.path.exists(os.path.join(directory, "settings.json")) and os.path.exists(filename):
+        Profile_Accumulator.load(filename, timezone=timezone).save_directory(directory)
+    return Profile_Accumulator.open(directory, timezone=timezone)
 
-data = data_processor_obj.parse(df=data)
-data = data_processor_obj.process(df=data)
-data = data_processor_obj.filter(df=data)
 
-save_status = local_database_obj.save_to_db(data)
-if not save_status:
-    raise Exception("Failed to save data to local buffer")
+def get_data_processor(project_path, config_file, section="data_processor", context=None):
+    """
+    returns the data processor of the collection_mode of the data_processor config section: clients (walk of the per
+    client table, the default) or ap_counters (walk of the per radio client counters)
+    """
+    if context is None:
+        context = Count_Context.get_context(project_path, config_file)
+    collection_mode = (context.get_config().get(section) or {}).get("collection_mode", "clients")
+    if collection_mode not in DATA_PROCESSORS:
+        raise Exception("unknown collection_mode=%s, expected one of %s" % (collection_mode, list(DATA_PROCESSORS)))
+    return DATA_PROCESSORS[collection_mode](section=section, context=context)
 
-local_database_obj.close_connection()
\ No newline at end of file
+
+def get_local_database(project_path, config_file, section="local_db", context=None):
+    """
+    returns the local buffer of the backend of the local_db config section: sqlite (SQLite_Connector, the default) or
+    spool (Spool_Connector, append-only segment files)
+    """
+    if context is None:
+        context = Count_Context.get_context(project_path, config_file)
+    backend = (context.get_config().get(section) or {}).get("backend", "sqlite")
+    if backend not in LOCAL_DATABASES:
+        raise Exception("unknown backend=%s, expected one of %s" % (backend, list(LOCAL_DATABASES)))
+    return LOCAL_DATABASES[backend](section=section, context=context)
+
+
+def get_pipeline(project_path, config_file, data_source_obj, data_processor_obj, local_database_obj, context=None):
+    """
+    returns the instrumented collection pipeline (gather, parse, process, filter, save), with a profiles stage if the
+    profiles config section is set
+    """
+    pipeline = Collection_Pipeline(data_source_obj, data_processor_obj, local_database_obj, project_path=project_path,
+                                   config_file=config_file, section="pipeline", context=context)
+    profile_accumulator = get_profile_accumulator(project_path, pipeline.config)
+    if profile_accumulator is not None:
+        def update_profiles(data):
+            # the memory-mapped histograms are updated in place, there is nothing to save
+            profile_accumulator.update(data)
+            return data
+        pipeline.add_stage("profiles", update_profiles)
+    return pipeline
+
+
+if __name__ == "__main__":
+    project_path = os.path.dirname(os.path.realpath(__file__))
+    config_file = "count_config.yaml"
+
+    context = Count_Context(project_path=project_path, config_file=config_file)
+
+    data_source_obj = Wifi_Gatherer(section="snmp", context=context)
+    data_processor_obj = get_data_processor(project_path, config_file, section="data_processor", context=context)
+    local_database_obj = get_local_database(project_path, config_file, section="local_db", context=context)
+
+    pipeline = get_pipeline(project_path, config_file, data_source_obj, data_processor_obj, local_database_obj,
+                            context=context)
+
+    pipeline.run()
+
+    pipeline.close_connection()
+    local_database_obj.close_connection()
+    context.close()
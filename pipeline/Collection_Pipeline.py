@@ -0,0 +1,215 @@
+import os
+import time
+import tracemalloc
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the rss memory mode is disabled there
+    resource = None
+
+from common.Count_Context import Count_Context
+from data_storage.SQLite_Connector import SQLite_Connector
+
+PROMETHEUS_METRICS = [
+    ("seconds", "Wall time of the stage in the last collection run"),
+    ("rows", "Rows returned by the stage in the last collection run"),
+    ("peak_memory_bytes", "Peak memory of the stage in the last collection run (rss: process peak resident size "
+                          "after the stage, tracemalloc: peak python allocations during the stage)"),
+    ("over_budget", "1 if the stage exceeded its configured time budget in the last collection run"),
+]
+
+
+class Collection_Pipeline(object):
+    """
+    This class runs the collection stages (gather -> parse -> process -> filter -> save, plus optional extra stages)
+    of a Wifi data source, a Data_Processor and a DB_Interface, and records the wall time, row count and peak memory
+    of every stage. The metrics of each run are saved to a metrics database table and/or a Prometheus text file
+    (node_exporter textfile collector), and a warning is logged for every stage over its configured budget.
+    """
+
+    def __init__(self, data_source_obj, data_processor_obj, local_database_obj, project_path=".",
+                 config_file="count_config.yaml", section="pipeline", metrics_database_obj=None, context=None):
+        """
+        initialize logging and read config file, once per process (see Count_Context)
+        """
+        self.context = context if context is not None else Count_Context.get_context(project_path, config_file)
+        self.project_path = self.context.project_path
+        self.logger = self.context.get_logger(__name__, "collection_pipeline.log")
+        self.config_file = self.context.config_file
+        self.pipeline_section = section
+        self.config = self.context.get_config(self.logger)
+
+        try:
+            pipeline_cfg = self.config.get(self.pipeline_section) or {}
+            self.budgets = pipeline_cfg.get("budgets") or {}
+            self.memory = pipeline_cfg.get("memory", "rss")
+            if self.memory not in ("rss", "tracemalloc", "none"):
+                raise Exception("unknown pipeline memory=%s, expected rss, tracemalloc or none" % self.memory)
+            if self.memory == "rss" and resource is None:
+                self.memory = "none"
+            self.prometheus_file = pipeline_cfg.get("prometheus_file")
+            self.metrics_prefix = pipeline_cfg.get("metrics_prefix", "count_pipeline")
+            self.metrics_db_section = pipeline_cfg.get("metrics_db")
+            self.totals_db_section = pipeline_cfg.get("totals_db")
+        except Exception as e:
+            self.logger.error("unexpected error while setting configuration from config_file=%s, section=%s, "
+                              "error=%s" % (self.config_file, self.pipeline_section, str(e)))
+            raise e
+
+        self.data_source_obj = data_source_obj
+        self.data_processor_obj = data_processor_obj
+        self.local_database_obj = local_database_obj
+        self.metrics_database_obj = metrics_database_obj
+        if self.metrics_database_obj is None and self.metrics_db_section:
+            self.metrics_database_obj = SQLite_Connector(section=self.metrics_db_section,
+                                                         context=self.context)
+        self.stages = [
+            ("gather", lambda data: self.data_source_obj.get_wifi_data()),
+            ("parse", lambda data: self.data_processor_obj.parse(df=data)),
+            ("process", lambda data: self.data_processor_obj.process(df=data)),
+            ("filter", lambda data: self.data_processor_obj.filter(df=data)),
+            ("save", self._save),
+        ]
+        self.totals_database_obj = None
+        if self.totals_db_section:
+            self.totals_database_obj = SQLite_Connector(section=self.totals_db_section, context=self.context)
+            self.stages.append(("totals", self._save_totals))
+        self.last_metrics = None
+
+    def _save(self, data):
+        if not self.local_database_obj.save_to_db(data):
+            raise Exception("Failed to save data to local buffer")
+        return data
+
+    def _save_totals(self, data):
+        totals = self.data_processor_obj.get_totals()
+        if not totals.empty and not self.totals_database_obj.save_to_db(totals):
+            raise Exception("Failed to save floor, building and campus totals")
+        return data
+
+    def add_stage(self, name, fn, budget=None):
+
+        """
+        this method appends a stage: fn receives the output of the previous stage and returns the data passed to the
+        next one (return the input unchanged for side-effect stages)
+        """
+        self.stages.append((name, fn))
+        if budget is not None:
+            self.budgets[name] = budget
+
+    def _get_peak_memory(self, memory_before=0):
+        if self.memory == "rss":
+            # ru_maxrss is in kilobytes on Linux
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        if self.memory == "tracemalloc":
+            return tracemalloc.get_traced_memory()[1] - memory_before
+        return None
+
+    def _run_stage(self, name, fn, data):
+
+        """
+        this method runs one stage and returns its output and its metrics
+        """
+        memory_before = 0
+        if self.memory == "tracemalloc":
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            data = fn(data)
+        except Exception:
+            status = "failed"
+            raise
+        finally:
+            seconds = time.perf_counter() - t0
+            peak_memory = self._get_peak_memory(memory_before)
+            rows = len(data) if isinstance(data, pd.DataFrame) and status == "ok" else None
+            budget = self.budgets.get(name)
+            over_budget = budget is not None and seconds > budget
+            if over_budget:
+                self.logger.warning("stage=%s took %.3fs, over its budget of %ss" % (name, seconds, budget))
+            self._metrics.append({"stage": name, "seconds": seconds, "rows": rows, "peak_memory_bytes": peak_memory,
+                                  "over_budget": over_budget, "status": status})
+        return data
+
+    def run(self):
+
+        """
+        this method runs all the stages once, saves their metrics and returns the output of the last stage
+        """
+        run_time = pd.Timestamp.now(tz="UTC")
+        self._metrics = []
+        started_tracemalloc = self.memory == "tracemalloc" and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+
+        data = None
+        try:
+            for name, fn in self.stages:
+                data = self._run_stage(name, fn, data)
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            metrics = pd.DataFrame(self._metrics, columns=["stage", "seconds", "rows", "peak_memory_bytes",
+                                                           "over_budget", "status"])
+            metrics.insert(0, "time", run_time)
+            metrics = metrics.astype({"seconds": float, "rows": float, "peak_memory_bytes": float, "over_budget": bool})
+            self.last_metrics = metrics
+            self.logger.info("collection run: %s" % ", ".join(
+                "%s=%.3fs" % (stage, seconds) for stage, seconds in zip(metrics["stage"], metrics["seconds"])))
+            self._export_metrics(metrics)
+        return data
+
+    def close_connection(self):
+        if self.metrics_database_obj is not None:
+            self.metrics_database_obj.close_connection()
+        if self.totals_database_obj is not None:
+            self.totals_database_obj.close_connection()
+
+    def _export_metrics(self, metrics):
+
+        """
+        this method saves the metrics of a run; an export failure is logged and never fails the collection
+        """
+        if self.metrics_database_obj is not None:
+            try:
+                if not self.metrics_database_obj.save_to_db(metrics):
+                    self.logger.error("failed to save pipeline metrics")
+            except Exception as e:
+                self.logger.error("failed to save pipeline metrics, error=%s" % str(e))
+
+        if self.prometheus_file is not None:
+            try:
+                self.write_prometheus_file(metrics, os.path.join(self.project_path, self.prometheus_file))
+            except Exception as e:
+                self.logger.error("failed to write prometheus file=%s, error=%s" % (self.prometheus_file, str(e)))
+
+    def write_prometheus_file(self, metrics, filename):
+
+        """
+        this method writes the metrics of a run in the Prometheus text format, atomically (temporary file + rename)
+        as the node_exporter textfile collector expects
+        """
+        lines = []
+        for column, description in PROMETHEUS_METRICS:
+            name = "%s_stage_%s" % (self.metrics_prefix, column)
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s gauge" % name)
+            for stage, value in zip(metrics["stage"], metrics[column]):
+                if value is not None and not pd.isna(value):
+                    lines.append('%s{stage="%s"} %s' % (name, stage, repr(float(value))))
+
+        success = int((metrics["status"] == "ok").all() and len(metrics) == len(self.stages))
+        for name, description, value in [
+                ("last_run_success", "1 if every stage of the last collection run succeeded", success),
+                ("last_run_timestamp_seconds", "Start time of the last collection run",
+                 metrics["time"].iloc[0].timestamp())]:
+            name = "%s_%s" % (self.metrics_prefix, name)
+            lines += ["# HELP %s %s" % (name, description), "# TYPE %s gauge" % name, "%s %s" % (name, repr(value))]
+
+        with open(filename + ".tmp", "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+        os.replace(filename + ".tmp", filename)
@@ -1,19 +1,85 @@
-from data_storage.SQLite_Connector import SQLite_Connector
+from get_wifi_data import get_local_database
 from data_storage.InfluxDB_Connector import InfluxDB_Connector
+from common.Count_Context import Count_Context
+import numpy as np
+import pandas as pd
 import os
 
-project_path = os.path.dirname(os.path.realpath(__file__))
-config_file = "count_config.yaml"
 
-local_database_obj = SQLite_Connector(project_path=project_path, config_file=config_file, section="local_db")
-remote_database_obj = InfluxDB_Connector(project_path=project_path, config_file=config_file, section="remote_db")
+def _get_acknowledged_time(times, n_sent):
+    """
+    newest time whose rows were all sent, given the time ordered times of a chunk and the number of rows sent
+    """
+    if n_sent == 0:
+        return None
+    if n_sent == len(times) or times[n_sent] != times[n_sent - 1]:
+        return times[n_sent - 1]
+    # the last batch ended inside a poll, only the polls before it are complete
+    first_of_poll = np.searchsorted(times, times[n_sent], side="left")
+    return times[first_of_poll - 1] if first_of_poll > 0 else None
 
-data = local_database_obj.read_from_db()
-save_status = remote_database_obj.save_to_db(data)
-if not save_status:
-    raise Exception("Failed to save data to remote database")
 
-local_database_obj.delete_data_from_db_based_on_time(data)
+def push(local_database_obj, remote_database_obj, chunk_rows=None, batch_size=None):
+    """
+    drains the local buffer to the remote database chunk by chunk: each chunk is sent in batches, the newest time
+    acknowledged by the remote is persisted as high water mark and only then deleted from the buffer, so an
+    interrupted drain resumes after the last acknowledged poll. With push: changes_only and the delta storage of the
+    local buffer, only the counts that changed are sent
+    """
+    push_cfg = local_database_obj.config.get("push") or {}
+    chunk_rows = chunk_rows if chunk_rows is not None else push_cfg.get("chunk_rows", 50000)
+    batch_size = batch_size if batch_size is not None else push_cfg.get("batch_size", 5000)
+    changes_only = push_cfg.get("changes_only", False)
+    logger = local_database_obj.logger
 
-local_database_obj.close_connection()
-remote_database_obj.close_connection()
\ No newline at end of file
+    high_water_mark = local_database_obj.get_high_water_mark()
+    if high_water_mark is not None:
+        # rows acknowledged by a previous drain that was interrupted before its delete
+        local_database_obj.delete_data_from_db_based_on_time(
+            None, time_threshold=high_water_mark + pd.Timedelta(microseconds=1))
+
+    n_pushed = 0
+    while True:
+        data = local_database_obj.read_chunk_from_db(after_time=high_water_mark, max_rows=chunk_rows,
+                                                     changes_only=changes_only)
+        if data.empty:
+            break
+        if changes_only:
+            # an access point that left the poll has no client left
+            data['count'] = data['count'].fillna(0).astype(np.int64)
+
+        n_sent = 0
+        for start in range(0, len(data), batch_size):
+            if not remote_database_obj.save_to_db(data.iloc[start:start + batch_size]):
+                break
+            n_sent = min(start + batch_size, len(data))
+
+        acknowledged_time = _get_acknowledged_time(data['time'].dt.tz_convert(None).to_numpy(), n_sent)
+        if acknowledged_time is not None:
+            high_water_mark = pd.Timestamp(acknowledged_time, tz="UTC")
+            local_database_obj.set_high_water_mark(high_water_mark)
+            local_database_obj.delete_data_from_db_based_on_time(
+                None, time_threshold=high_water_mark + pd.Timedelta(microseconds=1))
+            n_pushed += n_sent
+
+        if n_sent < len(data):
+            raise Exception("Failed to save data to remote database after pushing %d rows" % n_pushed)
+
+    logger.info("drained %d rows from the local buffer to the remote database" % n_pushed)
+    return n_pushed
+
+
+if __name__ == "__main__":
+    project_path = os.path.dirname(os.path.realpath(__file__))
+    config_file = "count_config.yaml"
+
+    context = Count_Context(project_path=project_path, config_file=config_file)
+
+    local_database_obj = get_local_database(project_path, config_file, section="local_db", context=context)
+    remote_database_obj = InfluxDB_Connector(section="remote_db", context=context)
+
+    push(local_database_obj, remote_database_obj)
+
+    local_database_obj.close_connection()
+    remote_database_obj.close_connection()
+    context.close()
@@ -0,0 +1,267 @@
+"""
+Tests of the line protocol writer and of the queries of InfluxDB_Connector against a local stub of the influxDB
+/write and /query endpoints
+usage: python -m unittest discover tests (or python -m pytest tests)
+"""
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.Count_Context import Count_Context
+from data_storage.InfluxDB_Connector import InfluxDB_Connector
+
+CONFIG = """
+remote_db:
+  host: 127.0.0.1
+  port: %d
+  database: wifi
+  measurement: wifi count
+  writer: line_protocol
+  batch_size: %d
+  max_retries: 2
+  backoff: 0.05
+  timeout: 0.3
+"""
+
+
+class Stub_InfluxDB(object):
+    """
+    http server on a background thread that records the write requests and answers them with the scripted
+    (status, delay) responses, then 204. Chunked queries are answered from points (dicts of time, tags and fields)
+    filtered on their bound time and tag parameters, chunk_size points per json line
+    """
+
+    def __init__(self, responses=(), points=(), tags=("ap_name", "building")):
+        self.responses = list(responses)
+        self.requests = []
+        self.queries = []
+        self.points = list(points)
+        self.tags = tags
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append({"time": time.monotonic(), "path": urlparse(self.path).path,
+                                      "params": parse_qs(urlparse(self.path).query), "headers": dict(self.headers),
+                                      "body": body})
+                status, delay = stub.responses.pop(0) if stub.responses else (204, 0)
+                time.sleep(delay)
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                except OSError:
+                    # the client timed out and closed the connection
+                    pass
+
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                stub.queries.append(params)
+                body = "".join(json.dumps(chunk) + "\n" for chunk in stub.get_chunks(params)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def get_chunks(self, params):
+        """ result chunks of a select *, with the bound time range and tag filters of the query applied """
+        query, bind_params = params["q"], json.loads(params.get("params", "{}"))
+        points = self.points
+        if "start_time" in bind_params:
+            start_time = pd.Timestamp(bind_params["start_time"]).value
+            points = [point for point in points if point["time"] >= start_time]
+        if "end_time" in bind_params:
+            end_time = pd.Timestamp(bind_params["end_time"]).value
+            inclusive = "time <= $end_time" in query
+            points = [point for point in points if point["time"] < end_time or inclusive and point["time"] == end_time]
+        tag_values = {}
+        for tag, name in re.findall(r'"(\w+)" = \$(tag_\d+_\d+)', query):
+            tag_values.setdefault(tag, set()).add(bind_params[name])
+        points = [point for point in points if all(point[tag] in values for tag, values in tag_values.items())]
+
+        columns = list(self.points[0]) if self.points else ["time"]
+        chunk_size = int(params.get("chunk_size", 10000))
+        for i in range(0, len(points), chunk_size):
+            values = [[point[column] for column in columns] for point in points[i:i + chunk_size]]
+            yield {"results": [{"statement_id": 0, "series": [{"name": "wifi count", "columns": columns,
+                                                                "values": values}]}]}
+
+    def get_lines(self, request):
+        body = request["body"]
+        if request["headers"].get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body.decode("utf-8").split("\n")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Test_Line_Protocol_Writer(unittest.TestCase):
+
+    def _get_connector(self, responses=(), batch_size=5000):
+        self.stub = Stub_InfluxDB(responses)
+        self.addCleanup(self.stub.stop)
+        project_path = tempfile.mkdtemp()
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG % (self.stub.port, batch_size))
+        context = Count_Context(project_path=project_path)
+        self.addCleanup(context.close)
+        connector = InfluxDB_Connector(project_path=project_path, section="remote_db", context=context)
+        self.addCleanup(connector.close_connection)
+        return connector
+
+    @staticmethod
+    def _get_data(n_rows=1):
+        return pd.DataFrame({"time": pd.Timestamp("2020-01-01", tz="UTC") + pd.to_timedelta(range(n_rows), unit="min"),
+                             "ap_name": ["AP-B1-%d" % i for i in range(n_rows)], "building": "B1",
+                             "count": range(n_rows)})
+
+    def test_gzip_body_and_escaping(self):
+        connector = self._get_connector()
+        data = pd.DataFrame({"time": [pd.Timestamp("2020-01-01", tz="UTC")], "ap_name": ["AP\\1"],
+                             "building": ["B 1,x=y"], "count": [3], "note": ['say "hi"']})
+        self.assertTrue(connector.save_to_db(data, tag_columns=["ap_name", "building"],
+                                             field_columns=["count", "note"]))
+
+        self.assertEqual(len(self.stub.requests), 1)
+        request = self.stub.requests[0]
+        self.assertEqual(request["path"], "/write")
+        self.assertEqual(request["params"], {"db": ["wifi"], "precision": ["ns"]})
+        self.assertEqual(request["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(self.stub.get_lines(request), [
+            'wifi\\ count,ap_name=AP\\\\1,building=B\\ 1\\,x\\=y count=3i,note="say \\"hi\\"" 1577836800000000000'])
+
+    def test_batches_split_at_batch_size(self):
+        connector = self._get_connector(batch_size=4)
+        self.assertTrue(connector.save_to_db(self._get_data(10)))
+
+        batches = [self.stub.get_lines(request) for request in self.stub.requests]
+        self.assertEqual([len(lines) for lines in batches], [4, 4, 2])
+        lines = sum(batches, [])
+        self.assertEqual([line.rsplit(" ", 2)[1] for line in lines], ["count=%di" % i for i in range(10)])
+
+    def test_5xx_is_retried_with_backoff(self):
+        connector = self._get_connector(responses=[(503, 0), (500, 0)])
+        self.assertTrue(connector.save_to_db(self._get_data()))
+
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(self.stub.get_lines(self.stub.requests[0]), self.stub.get_lines(self.stub.requests[2]))
+        delays = [b["time"] - a["time"] for a, b in zip(self.stub.requests, self.stub.requests[1:])]
+        self.assertGreaterEqual(delays[0], 0.05)
+        self.assertGreaterEqual(delays[1], 0.1)
+
+    def test_5xx_fails_after_max_retries(self):
+        connector = self._get_connector(responses=[(503, 0)] * 3)
+        self.assertFalse(connector.save_to_db(self._get_data()))
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_4xx_fails_without_retry(self):
+        connector = self._get_connector(responses=[(400, 0)])
+        self.assertFalse(connector.save_to_db(self._get_data(10)))
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_timeout_is_retried(self):
+        connector = self._get_connector(responses=[(204, 1.0)])
+        self.assertTrue(connector.save_to_db(self._get_data()))
+        self.assertEqual(len(self.stub.requests), 2)
+
+
+class Test_Query(unittest.TestCase):
+
+    START = pd.Timestamp("2020-01-01", tz="UTC")
+
+    def _get_connector(self, n_polls=6, interval="12h"):
+        times = pd.date_range(self.START, periods=n_polls, freq=interval)
+        points = [{"time": time.value, "ap_name": "AP-%s-%d" % (building, i), "building": building, "count": i + j}
+                  for j, time in enumerate(times) for building in ("B1", "B2", "B3") for i in range(2)]
+        self.stub = Stub_InfluxDB(points=points)
+        self.addCleanup(self.stub.stop)
+        project_path = tempfile.mkdtemp()
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write(CONFIG % (self.stub.port, 5000))
+        context = Count_Context(project_path=project_path)
+        self.addCleanup(context.close)
+        connector = InfluxDB_Connector(project_path=project_path, section="remote_db", context=context)
+        self.addCleanup(connector.close_connection)
+        return connector
+
+    def _check_frame(self, data, n_rows):
+        self.assertEqual(len(data), n_rows)
+        self.assertEqual(list(data.columns), ["ap_name", "building", "count"])
+        self.assertIsInstance(data.index, pd.DatetimeIndex)
+        self.assertEqual(data.index.name, "time")
+        self.assertEqual(str(data.index.tz), "UTC")
+
+    def test_query_binds_tags_and_reads_all_chunks(self):
+        connector = self._get_connector()
+        data = connector.query(tags={"building": ["B1", "B3"]}, chunk_size=5)
+        self._check_frame(data, 6 * 4)
+        self.assertEqual(set(data["building"]), {"B1", "B3"})
+        self.assertEqual(data.index.min(), self.START)
+
+        params = self.stub.queries[0]
+        self.assertEqual(params["q"], 'SELECT * FROM "wifi count" WHERE ("building" = $tag_0_0 OR '
+                                      '"building" = $tag_0_1)')
+        self.assertEqual(json.loads(params["params"]), {"tag_0_0": "B1", "tag_0_1": "B3"})
+        self.assertEqual((params["chunked"], params["chunk_size"], params["epoch"]), ("true", "5", "ns"))
+
+    def test_iter_query_yields_one_frame_per_window(self):
+        connector = self._get_connector()
+        frames = list(connector.iter_query(self.START, self.START + pd.Timedelta("2D"), tags={"building": "B2"},
+                                           window="1D", chunk_size=3))
+        self.assertEqual(len(frames), 2)
+        # polls at 0h and 12h, then 24h, 36h and 48h: the last window includes its end time
+        for i, n_polls in enumerate([2, 3]):
+            self._check_frame(frames[i], n_polls * 2)
+            self.assertEqual(set(frames[i]["building"]), {"B2"})
+            self.assertEqual(sorted(set(frames[i].index)), [self.START + pd.Timedelta(hours=24 * i + 12 * j)
+                                                            for j in range(n_polls)])
+        self.assertEqual(len(self.stub.queries), 2)
+        self.assertIn("time < $end_time", self.stub.queries[0]["q"])
+        self.assertIn("time <= $end_time", self.stub.queries[1]["q"])
+
+    def test_query_of_a_time_range_concatenates_the_windows(self):
+        connector = self._get_connector()
+        data = connector.query(self.START + pd.Timedelta("12h"), self.START + pd.Timedelta("2D"), window="1D")
+        self._check_frame(data, 4 * 6)
+        self.assertEqual(data.index.min(), self.START + pd.Timedelta("12h"))
+        self.assertEqual(data.index.max(), self.START + pd.Timedelta("2D"))
+
+    def test_read_from_db(self):
+        connector = self._get_connector()
+        self._check_frame(connector.read_from_db(), 6 * 6)
+        data = connector.read_from_db(start_time=self.START + pd.Timedelta("1D"),
+                                      end_time=self.START + pd.Timedelta("1D12h"))
+        self._check_frame(data, 2 * 6)
+
+    def test_empty_result(self):
+        connector = self._get_connector()
+        data = connector.query(tags={"building": "B9"})
+        self.assertTrue(data.empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
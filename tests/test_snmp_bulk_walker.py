@@ -0,0 +1,202 @@
+"""
+Tests of the BER encoding of SNMP_Bulk_Walker and of bulk walks (native backend of Wifi_Gatherer) against
+Fake_SNMP_Agent
+usage: python -m unittest discover tests (or python -m pytest tests)
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common.Count_Context import Count_Context
+from data_source.Fake_SNMP_Agent import Fake_SNMP_Agent
+from data_source.SNMP_Bulk_Walker import SNMP_Bulk_Walker, _decode_message, _decode_oid, _decode_value, \
+    _encode_integer, _encode_message, _encode_oid, _encode_tlv, _read_tlv, COUNTER32, END_OF_MIB_VIEW, \
+    GET_BULK_REQUEST, GET_RESPONSE, INTEGER, IP_ADDRESS, NULL, OBJECT_IDENTIFIER, OCTET_STRING
+from data_source.Wifi_Gatherer import Wifi_Gatherer
+
+COUNT_OID = ".1.3.6.1.4.1.14179.2.1.5.1.1"
+
+
+def make_table(n_rows, oid=COUNT_OID):
+    return {"%s.%d.%d.%d.1" % (oid, i // 256, i % 256, 7 * i): "AP-%d" % i if i % 2 else i for i in range(n_rows)}
+
+
+class Dropping_Agent(Fake_SNMP_Agent):
+    """ agent that does not answer its first n_dropped requests, or answers them late after delay seconds """
+
+    def __init__(self, table, n_dropped, delay=None, **kwargs):
+        super().__init__(table, **kwargs)
+        self.n_dropped = n_dropped
+        self.delay = delay
+
+    def _respond(self, data):
+        response = super()._respond(data)
+        if self.requests <= self.n_dropped:
+            if self.delay is None:
+                return None
+            time.sleep(self.delay)
+        return response
+
+
+class Test_BER(unittest.TestCase):
+
+    def _decode(self, encoded):
+        tag, start, end = _read_tlv(encoded, 0)
+        self.assertEqual(end, len(encoded))
+        return _decode_value(tag, encoded, start, end)
+
+    def test_integer(self):
+        self.assertEqual(_encode_integer(0), bytes([INTEGER, 1, 0]))
+        self.assertEqual(_encode_integer(128), bytes([INTEGER, 2, 0x00, 0x80]))
+        self.assertEqual(_encode_integer(-129), bytes([INTEGER, 2, 0xff, 0x7f]))
+        for value in (0, 1, 127, 128, 255, 256, -1, -128, -129, 2 ** 31 - 1, -2 ** 31):
+            self.assertEqual(self._decode(_encode_integer(value)), value)
+
+    def test_unsigned(self):
+        self.assertEqual(self._decode(_encode_tlv(COUNTER32, (2 ** 32 - 1).to_bytes(5, 'big'))), 2 ** 32 - 1)
+
+    def test_length(self):
+        for length in (0, 127, 128, 255, 256, 70000):
+            encoded = _encode_tlv(OCTET_STRING, b'a' * length)
+            tag, start, end = _read_tlv(encoded, 0)
+            self.assertEqual((tag, end - start, end), (OCTET_STRING, length, len(encoded)))
+        self.assertEqual(_encode_tlv(OCTET_STRING, b'a' * 200)[:3], bytes([OCTET_STRING, 0x81, 200]))
+
+    def test_oid(self):
+        self.assertEqual(_encode_oid(".1.3.6.1"), bytes([OBJECT_IDENTIFIER, 3, 0x2b, 6, 1]))
+        for oid in ("1.3.6.1.4.1.14179.2.1.5.1.1.0.26.43.60.77.94.1", "1.3.127.128.16383.16384.4294967295",
+                    "2.999.1"):
+            encoded = _encode_oid(oid)
+            _, start, end = _read_tlv(encoded, 0)
+            self.assertEqual(_decode_oid(encoded, start, end), oid)
+            self.assertEqual(self._decode(encoded), "." + oid)
+
+    def test_values(self):
+        self.assertEqual(self._decode(_encode_tlv(OCTET_STRING, "AP-B1-1".encode('utf-8'))), "AP-B1-1")
+        self.assertEqual(self._decode(_encode_tlv(OCTET_STRING, bytes([0, 0x1a, 0xff]))), "00 1A FF")
+        self.assertEqual(self._decode(_encode_tlv(IP_ADDRESS, bytes([10, 0, 0, 254]))), "10.0.0.254")
+        self.assertIsNone(self._decode(_encode_tlv(NULL, b'')))
+
+    def test_messages(self):
+        request = _encode_message(b"public", GET_BULK_REQUEST, 42, [COUNT_OID], max_repetitions=25)
+        community, pdu_tag, request_id, non_repeaters, max_repetitions, varbinds = _decode_message(request)
+        self.assertEqual((community, pdu_tag, request_id, non_repeaters, max_repetitions),
+                         (b"public", GET_BULK_REQUEST, 42, 0, 25))
+        self.assertEqual([(oid, tag) for oid, tag, _, _ in varbinds], [(COUNT_OID.strip('.'), NULL)])
+
+        values = [_encode_integer(-5), _encode_tlv(OCTET_STRING, b"x" * 300), _encode_tlv(END_OF_MIB_VIEW, b'')]
+        oids = [COUNT_OID + ".1", COUNT_OID + ".2", COUNT_OID + ".3"]
+        response = _encode_message(b"public", GET_RESPONSE, 2 ** 31 - 1, oids, values=values, error_status=5,
+                                   error_index=2)
+        _, pdu_tag, request_id, error_status, error_index, varbinds = _decode_message(response)
+        self.assertEqual((pdu_tag, request_id, error_status, error_index), (GET_RESPONSE, 2 ** 31 - 1, 5, 2))
+        self.assertEqual(["." + oid for oid, _, _, _ in varbinds], oids)
+        self.assertEqual([_decode_value(tag, response, start, end) for _, tag, start, end in varbinds[:2]],
+                         [-5, "x" * 300])
+        self.assertEqual(varbinds[2][1], END_OF_MIB_VIEW)
+
+
+class Test_Bulk_Walk(unittest.TestCase):
+
+    def _walk(self, agent, oid=COUNT_OID, max_repetitions=50, timeout=0.2, retries=2, walk_timeout=None):
+        with agent:
+            walker = SNMP_Bulk_Walker("127.0.0.1", "public", port=agent.port, max_repetitions=max_repetitions,
+                                      timeout=timeout, retries=retries)
+            try:
+                return walker.walk(oid, timeout=walk_timeout)
+            finally:
+                walker.close()
+
+    def _expected(self, table, oid=COUNT_OID):
+        rows = sorted(table.items(), key=lambda item: tuple(int(arc) for arc in item[0].strip('.').split('.')))
+        return [key[len(oid) + 1:] for key, _ in rows], [value for _, value in rows]
+
+    def test_walk_stops_at_the_end_of_the_subtree(self):
+        table = make_table(230)
+        table.update(make_table(20, oid=".1.3.6.1.4.1.14179.2.1.5.1.2"))
+        agent = Fake_SNMP_Agent(table)
+        suffixes, values = self._walk(agent)
+        self.assertEqual((suffixes, values), self._expected(make_table(230)))
+        self.assertEqual(agent.requests, 5)
+
+    def test_walk_stops_at_the_end_of_the_mib(self):
+        table = make_table(100)
+        agent = Fake_SNMP_Agent(table)
+        self.assertEqual(self._walk(agent), self._expected(table))
+        # two full pages, then a response holding only endOfMibView
+        self.assertEqual(agent.requests, 3)
+
+    def test_empty_subtree(self):
+        agent = Fake_SNMP_Agent(make_table(10))
+        self.assertEqual(self._walk(agent, oid=".1.3.6.1.4.1.14179.2.1.6"), ([], []))
+
+    def test_wrong_community_times_out(self):
+        agent = Fake_SNMP_Agent(make_table(10), community="private")
+        with self.assertRaisesRegex(Exception, "timed out after 2 attempts"):
+            self._walk(agent, timeout=0.1, retries=1)
+
+    def test_timeout_is_retried(self):
+        table = make_table(120)
+        agent = Dropping_Agent(table, n_dropped=2)
+        self.assertEqual(self._walk(agent, retries=2), self._expected(table))
+        # 50 + 50 + 20 rows and a response holding only endOfMibView, plus the two dropped requests
+        self.assertEqual(agent.requests, 4 + 2)
+
+    def test_late_answer_is_dropped(self):
+        table = make_table(120)
+        agent = Dropping_Agent(table, n_dropped=1, delay=0.3)
+        self.assertEqual(self._walk(agent, retries=2), self._expected(table))
+
+    def test_dead_agent_fails_after_retries(self):
+        agent = Dropping_Agent(make_table(10), n_dropped=10 ** 6)
+        t0 = time.monotonic()
+        with self.assertRaisesRegex(Exception, "timed out after 3 attempts"):
+            self._walk(agent, timeout=0.1, retries=2)
+        self.assertEqual(agent.requests, 3)
+        self.assertLess(time.monotonic() - t0, 1)
+
+    def test_walk_stops_at_its_deadline(self):
+        agent = Dropping_Agent(make_table(10), n_dropped=10 ** 6)
+        t0 = time.monotonic()
+        with self.assertRaisesRegex(Exception, "deadline"):
+            self._walk(agent, timeout=0.2, retries=100, walk_timeout=0.5)
+        self.assertLess(time.monotonic() - t0, 1)
+
+
+class Test_Native_Gatherer(unittest.TestCase):
+
+    def _get_gatherer(self, port, timeout=120):
+        project_path = tempfile.mkdtemp()
+        with open(os.path.join(project_path, "count_config.yaml"), "w") as fp:
+            fp.write("snmp:\n  community: public\n  controller_ip: 127.0.0.1\n  count_oid: \"%s\"\n  port: %d\n"
+                     "  backend: native\n  fallback_to_snmpwalk: False\n  timeout: %s\n  request_timeout: 0.2\n"
+                     "  retries: 100\n" % (COUNT_OID, port, timeout))
+        context = Count_Context(project_path=project_path)
+        self.addCleanup(context.close)
+        return Wifi_Gatherer(project_path=project_path, section="snmp", context=context)
+
+    def test_native_walk(self):
+        table = make_table(75)
+        with Fake_SNMP_Agent(table) as agent:
+            data = self._get_gatherer(agent.port).get_wifi_data()
+        self.assertEqual(list(data.columns), ['oid_suffix', 'value', 'controller', 'time'])
+        self.assertEqual(len(data), 75)
+        self.assertEqual(set(data['controller']), {"127.0.0.1"})
+
+    def test_dead_controller_is_bounded_by_the_controller_timeout(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        self.addCleanup(sock.close)
+        gatherer = self._get_gatherer(sock.getsockname()[1], timeout=0.5)
+        t0 = time.monotonic()
+        with self.assertRaisesRegex(Exception, "deadline"):
+            gatherer.get_wifi_data()
+        self.assertLess(time.monotonic() - t0, 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()